@@ -0,0 +1,214 @@
+import os
+import threading
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from app import connection
+from app.currency import BASE_CURRENCY, minor_to_major
+
+# -------------------------------
+# COLUMNAR SNAPSHOTS
+# -------------------------------
+# Each ledger table is mirrored into an Arrow IPC file next to the database.
+# The file is memory-mapped on load and tagged with a watermark: the highest
+# row id it contains and the table's mutation counter (see migration 6).
+# New rows are appended from the watermark; updates or deletes force a rebuild.
+
+CHUNK_SIZE = 50_000
+
+_TABLES = {"expense": "expenses", "income": "income"}
+
+_FIELDS = [
+    ("id", pa.int64()),
+    ("date", pa.timestamp("s")),
+    ("amount", pa.int64()),
+    ("currency", pa.string()),
+    ("category_id", pa.int64()),
+    ("subcategory_id", pa.int64()),
+    ("description", pa.string()),
+    ("expected", pa.bool_()),
+]
+
+_cache = {}
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _schema(kind):
+    return pa.schema([f for f in _FIELDS if kind == "expense" or f[0] != "expected"])
+
+
+def snapshot_path(kind, db_path=None):
+    db_path = db_path or connection.DB_PATH
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(os.path.dirname(db_path), "analytics", f"{name}_{_TABLES[kind]}.arrow")
+
+
+def _db_state(conn, table):
+    max_id = conn.execute(f"SELECT IFNULL(MAX(id), 0) FROM {table}").fetchone()[0]
+    row = conn.execute("SELECT value FROM ledger_state WHERE name=?", (f"{table}_mutations",)).fetchone()
+    return max_id, row[0] if row else 0
+
+
+def _batches(conn, kind, after_id, max_id):
+    schema = _schema(kind)
+    table = _TABLES[kind]
+    # Bounded by the watermark stored with the file, so rows committed
+    # meanwhile are left for the next load instead of being stored twice
+    cur = conn.execute(f"""
+        SELECT {", ".join(schema.names)}
+        FROM {table} WHERE id > ? AND id <= ? ORDER BY id
+    """, (after_id, max_id))
+    while True:
+        rows = cur.fetchmany(CHUNK_SIZE)
+        if not rows:
+            break
+        columns = list(zip(*rows))
+        arrays = []
+        for field, values in zip(schema, columns):
+            if field.name == "date":
+                arr = pa.array(values, pa.string()).cast(pa.date32()).cast(pa.timestamp("s"))
+            elif field.name == "expected":
+                arr = pa.array([None if v is None else bool(v) for v in values], pa.bool_())
+            else:
+                arr = pa.array(values, field.type)
+            arrays.append(arr)
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _read(path):
+    source = pa.memory_map(path, "r")
+    reader = pa.ipc.open_file(source)
+    table = reader.read_all()
+    meta = reader.schema.metadata or {}
+    return table, int(meta.get(b"max_id", 0)), int(meta.get(b"mutations", -1))
+
+
+def read_snapshot(path):
+    """Memory-map a snapshot file written by load() without touching the database."""
+    return _read(path)[0]
+
+
+def _write(path, kind, batches, max_id, mutations):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    schema = _schema(kind).with_metadata({"max_id": str(max_id), "mutations": str(mutations)})
+    tmp = f"{path}.{os.getpid()}.part"  # the app and the CLI may refresh the same file
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(pa.RecordBatch.from_arrays(batch.columns, schema=schema))
+    os.replace(tmp, path)
+
+
+def load(kind="expense", db_path=None):
+    """
+    Arrow table mirroring `kind`, brought up to date with the database.
+    Only rows above the snapshot's watermark are read from SQLite unless
+    rows were updated or deleted since it was written.
+    """
+    db_path = db_path or connection.DB_PATH
+    path = snapshot_path(kind, db_path)
+    table_name = _TABLES[kind]
+    with _locks_guard:
+        lock = _locks.setdefault(path, threading.Lock())
+
+    with lock, connection.connection(db_path) as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN")  # state and rows from one read snapshot
+        max_id, mutations = _db_state(conn, table_name)
+        cached = _cache.get(path)
+        if cached and cached[1:] == (max_id, mutations):
+            return cached[0]
+
+        table, snap_max_id, snap_mutations = None, 0, -1
+        if os.path.exists(path):
+            try:
+                table, snap_max_id, snap_mutations = _read(path)
+            except (pa.ArrowInvalid, OSError):
+                table = None
+
+        if table is None or snap_mutations != mutations or snap_max_id > max_id:
+            _write(path, kind, _batches(conn, kind, 0, max_id), max_id, mutations)
+        elif snap_max_id < max_id:
+            _write(path, kind, chain(table.to_batches(), _batches(conn, kind, snap_max_id, max_id)), max_id, mutations)
+
+        table, _, _ = _read(path)
+        _cache[path] = (table, max_id, mutations)
+        return table
+
+
+def frame(kind="expense", years=None, months=None, db_path=None):
+    """
+    Snapshot rows for the given period as a DataFrame shaped like
+    schema.expenses_frame, with typed datetime64 dates, categorical
+    currencies and amounts in major units. Filtering happens on the Arrow
+    table, before anything is converted to pandas.
+    """
+    from app.schema import period_ranges, list_categories
+
+    return to_frame(load(kind, db_path), kind, period_ranges(years, months), list_categories())
+
+
+def _names(ids, names):
+    """Ids mapped to names, with None (not NaN) where there is none, as from SQL."""
+    mapped = ids.map(names)
+    return mapped.astype(object).where(mapped.notna(), None)
+
+
+def to_frame(table, kind, ranges, categories):
+    """
+    frame() over an already loaded snapshot `table`: rows within the
+    half-open ISO date `ranges` (None for all, [] for none), with names
+    taken from `categories` (shaped like schema.list_categories). Needs no
+    database.
+    """
+    if ranges is not None:
+        mask = pa.array(np.zeros(table.num_rows, dtype=bool))
+        for start, end in ranges:
+            in_range = pc.and_(
+                pc.greater_equal(table["date"], pa.scalar(pd.Timestamp(start), pa.timestamp("s"))),
+                pc.less(table["date"], pa.scalar(pd.Timestamp(end), pa.timestamp("s"))),
+            )
+            mask = pc.or_(mask, in_range)
+        table = table.filter(mask)
+
+    df = table.to_pandas()
+    cat_names = {c["id"]: c["name"] for c in categories}
+    sub_names = {sc["id"]: sc["name"] for c in categories for sc in c["subcategories"]}
+    df["currency"] = df["currency"].astype("category")
+    df["amount"] = minor_to_major(df["amount"], df["currency"])
+    df["category"] = _names(df["category_id"], cat_names)
+    df["subcategory"] = _names(df["subcategory_id"], sub_names)
+
+    columns = ["date", "amount", "currency", "category", "subcategory", "description"]
+    if kind == "expense":
+        df["expected"] = df["expected"].fillna(False).astype("int64")  # 0/1, as SQL returns it
+        columns.append("expected")
+    else:
+        columns.insert(0, "id")
+    return df[columns]
+
+
+def period_totals(kind="expense", unit="day", date_from=None, date_to=None, db_path=None):
+    """
+    Minor-unit totals per period start (`unit` "day" or "week", weeks from
+    Monday), category_id and currency between two inclusive dates, grouped
+    on the Arrow snapshot. Returns a DataFrame of period, category_id,
+    currency and total.
+    """
+    table = load(kind, db_path)
+    if date_from is not None:
+        table = table.filter(pc.greater_equal(table["date"], pa.scalar(pd.Timestamp(date_from), pa.timestamp("s"))))
+    if date_to is not None:
+        table = table.filter(pc.less_equal(table["date"], pa.scalar(pd.Timestamp(date_to), pa.timestamp("s"))))
+    buckets = pa.table({
+        "period": pc.floor_temporal(table["date"], unit=unit, week_starts_monday=True),
+        "category_id": table["category_id"],
+        "currency": pc.fill_null(table["currency"], BASE_CURRENCY),
+        "amount": table["amount"],
+    })
+    grouped = buckets.group_by(["period", "category_id", "currency"]).aggregate([("amount", "sum")])
+    return grouped.rename_columns(["period", "category_id", "currency", "total"]).to_pandas()
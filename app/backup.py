@@ -0,0 +1,104 @@
+import os
+import glob
+import sqlite3
+import threading
+from datetime import datetime
+
+from app import connection
+
+KEEP = 5
+PAGES_PER_STEP = 256
+CHECK_INTERVAL = 60  # seconds
+
+_worker = None
+_lock = threading.Lock()
+
+
+def backup_dir(db_path=None):
+    return os.path.join(os.path.dirname(db_path or connection.DB_PATH), "backups")
+
+
+def list_backups(db_path=None):
+    """Existing backup generations, newest first."""
+    db_path = db_path or connection.DB_PATH
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    return sorted(glob.glob(os.path.join(backup_dir(db_path), f"{name}_*.db")), reverse=True)
+
+
+def backup_now(db_path=None, keep=KEEP, pages=PAGES_PER_STEP):
+    """
+    Copy the database with SQLite's online backup API, `pages` pages per
+    step so writers are only briefly held up, into a new timestamped file.
+    Keeps the `keep` most recent generations. Returns the new backup path.
+    """
+    db_path = db_path or connection.DB_PATH
+    dest_dir = backup_dir(db_path)
+    os.makedirs(dest_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    dest = os.path.join(dest_dir, f"{name}_{stamp}.db")
+    tmp = dest + ".part"
+
+    src = sqlite3.connect(db_path, timeout=5.0)
+    dst = sqlite3.connect(tmp)
+    try:
+        src.backup(dst, pages=pages, sleep=0.005)
+    finally:
+        dst.close()
+        src.close()
+    os.replace(tmp, dest)
+
+    for old in list_backups(db_path)[keep:]:
+        os.remove(old)
+    return dest
+
+
+def _changed_since_last_backup(db_path):
+    backups = list_backups(db_path)
+    if not backups:
+        return True
+    last = os.path.getmtime(backups[0])
+    # In WAL mode recent commits only touch the -wal file until a checkpoint
+    return any(
+        os.path.exists(p) and os.path.getmtime(p) > last for p in (db_path, db_path + "-wal")
+    )
+
+
+def _run(db_path, interval, keep, stop):
+    watch = sqlite3.connect(db_path, check_same_thread=False)
+    try:
+        # PRAGMA data_version changes whenever another connection commits
+        last_version = None
+        if not _changed_since_last_backup(db_path):
+            last_version = watch.execute("PRAGMA data_version").fetchone()[0]
+        while True:
+            version = watch.execute("PRAGMA data_version").fetchone()[0]
+            if version != last_version:
+                try:
+                    backup_now(db_path, keep=keep)
+                    last_version = version
+                except sqlite3.Error as e:
+                    print(f"Backup failed: {e}")
+            if stop.wait(interval):
+                break
+    finally:
+        watch.close()
+
+
+def start_backup_thread(db_path=None, interval=CHECK_INTERVAL, keep=KEEP):
+    """
+    Start (once per process) a daemon thread that backs the database up
+    whenever it has changed since the previous backup. Returns the stop
+    event of the running worker.
+    """
+    global _worker
+    db_path = db_path or connection.DB_PATH
+    with _lock:
+        if _worker is None or not _worker[0].is_alive():
+            stop = threading.Event()
+            thread = threading.Thread(
+                target=_run, args=(db_path, interval, keep, stop), name="budget-backup", daemon=True
+            )
+            thread.start()
+            _worker = (thread, stop)
+        return _worker[1]
@@ -0,0 +1,92 @@
+import functools
+import sys
+import threading
+from collections import OrderedDict
+
+from app import connection
+
+# -------------------------------
+# READ CACHE
+# -------------------------------
+# Results of read functions are kept in one LRU, keyed by the function, its
+# arguments and the database generation (connection.data_version). Any
+# commit, from this process or another, moves the generation on, so stale
+# entries are never returned; they simply age out of the LRU. A hit costs
+# one PRAGMA data_version and a dict lookup.
+
+MAX_ENTRIES = 256
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+stats = {"hits": 0, "misses": 0}
+
+
+def _freeze(value):
+    """Hashable form of an argument (lists and sets become tuples)."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_freeze(v) for v in value))
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def _share(value):
+    # Frames are copied deep, so callers may also edit values in place
+    # (df.loc[...] = ..., fillna(inplace=True)) without corrupting the
+    # cached entry; a few milliseconds even for a year of rows. pandas is
+    # not imported here: if it is not loaded yet, `value` is no DataFrame.
+    pandas = sys.modules.get("pandas")
+    if pandas is not None and isinstance(value, pandas.DataFrame):
+        return value.copy(deep=True)
+    if isinstance(value, list):
+        return [dict(v) if isinstance(v, dict) else v for v in value]
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+
+def cached(fn):
+    """
+    Memoize `fn` on its arguments and the database generation. DataFrames
+    come back as deep copies, dicts as copies and lists as new lists of
+    copied dicts; other objects (figures, tuples) are shared, so treat them
+    as read-only.
+    """
+    name = f"{fn.__module__}.{fn.__qualname__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # Inside a write job reads see uncommitted rows: never cache those
+        if connection.in_write():
+            return fn(*args, **kwargs)
+        try:
+            key = (name, connection.DB_PATH, _freeze(args), _freeze(kwargs))
+            hash(key)
+        except TypeError:
+            return fn(*args, **kwargs)
+        generation = connection.data_version()
+        with _lock:
+            entry = _entries.get(key)
+            if entry is not None and entry[0] == generation:
+                _entries.move_to_end(key)
+                stats["hits"] += 1
+                return _share(entry[1])
+            stats["misses"] += 1
+
+        value = fn(*args, **kwargs)
+        with _lock:
+            _entries[key] = (generation, value)
+            _entries.move_to_end(key)
+            while len(_entries) > MAX_ENTRIES:
+                _entries.popitem(last=False)
+        return _share(value)
+
+    return wrapper
+
+
+def clear():
+    """Drop every cached result."""
+    with _lock:
+        _entries.clear()
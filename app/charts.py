@@ -0,0 +1,73 @@
+import pandas as pd
+import plotly.express as px
+
+from app.schema import EMERGENCY_CATEGORY
+
+# -------------------------------
+# SHARED CHARTS
+# -------------------------------
+# Figure builders used by both the Overview page and the static reports
+# (app/report.py). They take frames already converted to `currency`, so
+# each caller stays free to convert at spot or historical rates.
+
+
+def spend_by_category(df, value="converted"):
+    """Converted spend per category name (rows without a category are left out)."""
+    return df.groupby("category")[value].sum()
+
+
+def is_unexpected(categories):
+    """Mask of category names that count as unexpected spend (see schema.period_summary)."""
+    return categories.fillna("").str.strip().str.lower() == EMERGENCY_CATEGORY
+
+
+def category_pie(by_category, currency):
+    """Pie of a Series of amounts indexed by category."""
+    column = f"Converted amount ({currency})"
+    return px.pie(
+        by_category.rename(column).reset_index(),
+        names="category",
+        values=column,
+        title=f"Expenses by Category ({currency})"
+    )
+
+
+def income_vs_expenses(income, expected, unexpected, currency):
+    """Income next to expected and unexpected spend, stacked."""
+    column = f"Amount ({currency})"
+    fig = px.bar(
+        pd.DataFrame([
+            {"Category": "Income", "Type": "Income", column: income},
+            {"Category": "Expenses", "Type": "Expected", column: expected},
+            {"Category": "Expenses", "Type": "Unexpected", column: unexpected},
+        ]),
+        x="Category",
+        y=column,
+        color="Type",
+        text_auto=".2f",
+        title=f"Income vs Expenses (Expected vs Unexpected) — {currency}",
+    )
+    fig.update_layout(barmode="stack", legend_title_text="")
+    return fig
+
+
+def budget_vs_actual(variance, currency):
+    """Grouped budget and actual bars from a variance table indexed by category."""
+    column = f"Amount ({currency})"
+    return px.bar(
+        variance.reset_index().melt(id_vars="category", value_vars=["budget", "actual"],
+                                    var_name="Type", value_name=column),
+        x="category",
+        y=column,
+        color="Type",
+        barmode="group",
+        title=f"Budget vs Actual by Category — {currency}",
+    )
+
+
+def forecast(projection, value, currency):
+    """Projected recurring spend per month and category."""
+    return px.bar(
+        projection, x="date", y=value, color="category",
+        title=f"Projected recurring spend — {currency}",
+    )
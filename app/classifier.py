@@ -0,0 +1,72 @@
+import json
+import re
+import threading
+
+from app import connection, schema
+
+# -------------------------------
+# LABEL MATCHER
+# -------------------------------
+# All subcategory labels are compiled into one alternation, longest label
+# first, so each description is scanned once by the regex engine instead of
+# once per label. The compiled matcher is cached per database and rebuilt
+# only when schema.categories_token() moves.
+
+_matchers = {}
+_lock = threading.Lock()
+
+
+def parse_labels(raw):
+    """Labels as stored in subcategories.labels (JSON list, or legacy comma-separated text)."""
+    if not raw:
+        return []
+    try:
+        labels = json.loads(raw)
+    except ValueError:
+        labels = raw.split(",")
+    if isinstance(labels, str):
+        labels = [labels]
+    return [str(label).strip() for label in labels if str(label).strip()]
+
+
+class Matcher:
+    def __init__(self, categories):
+        self.targets = {}
+        for c in categories:
+            for sc in c["subcategories"]:
+                for label in parse_labels(sc["labels"]):
+                    # The first subcategory (by id) to claim a label keeps it
+                    self.targets.setdefault(label.lower(), (c["id"], sc["id"]))
+        if self.targets:
+            alternation = "|".join(re.escape(label) for label in sorted(self.targets, key=len, reverse=True))
+            self.pattern = re.compile(rf"(?<!\w)(?:{alternation})(?!\w)", re.IGNORECASE)
+        else:
+            self.pattern = None
+
+    def classify(self, description):
+        """(category_id, subcategory_id) of the leftmost label in `description`, or None."""
+        if self.pattern is None or not description:
+            return None
+        m = self.pattern.search(description)
+        return self.targets[m.group(0).lower()] if m else None
+
+    def classify_many(self, descriptions):
+        """classify() over an iterable; repeated descriptions are matched once."""
+        seen = {}
+        out = []
+        for d in descriptions:
+            if d not in seen:
+                seen[d] = self.classify(d)
+            out.append(seen[d])
+        return out
+
+
+def matcher():
+    """Compiled matcher for the current category tree."""
+    key = connection.DB_PATH
+    version = schema.categories_token()
+    with _lock:
+        cached = _matchers.get(key)
+        if cached is None or cached[0] != version:
+            cached = _matchers[key] = (version, Matcher(schema.list_categories()))
+        return cached[1]
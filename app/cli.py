@@ -5,53 +5,407 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 import argparse
-from datetime import datetime, date
-from app.schema import init_db, create_category, create_subcategory, add_expense, add_income, list_categories, get_category_by_name
-from app.db import get_session
-
-def parse_args():
-    p = argparse.ArgumentParser()
-    p.add_argument("--init-db", action="store_true")
-    p.add_argument("--add-cat", nargs=1)
-    p.add_argument("--add-subcat", nargs=2, metavar=("CATEGORY", "SUBNAME"))
-    p.add_argument("--add-expense", nargs=4, metavar=("DATE", "AMOUNT", "CATEGORY", "EXPECTED"))
-    p.add_argument("--add-income", nargs=2, metavar=("DATE","AMOUNT"))
-    return p.parse_args()
-
-def main():
-    args = parse_args()
+import shlex
+import sqlite3
+import time
+from datetime import date
+from decimal import Decimal
+
+# Only what every command needs is imported up front. app.schema loads
+# without pandas; importers, exports, rates and search pull in their own
+# dependencies when the command runs, so one-line bookkeeping starts fast.
+from app import connection
+from app.schema import init_db
+
+TRUE_VALUES = ("1", "true", "yes", "y")
+
+
+class CommandError(Exception):
+    """A command that cannot be applied (bad arguments, unknown category...)."""
+
+
+class _BatchParser(argparse.ArgumentParser):
+    # In batch mode a bad line must fail the batch, not exit the process
+    # (argparse exits from inside the write job on errors and on --help)
+    def error(self, message):
+        raise CommandError(message)
+
+    def print_help(self, file=None):
+        raise CommandError(f"{self.prog}: --help is not available in a batch")
+
+    def exit(self, status=0, message=None):
+        raise CommandError(message.strip() if message else f"{self.prog}: exit status {status}")
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date {value!r} (expected YYYY-MM-DD)")
+
+
+def _amount(value):
+    try:
+        amount = Decimal(value)
+    except ArithmeticError:
+        raise argparse.ArgumentTypeError(f"invalid amount {value!r}")
+    # NaN/inf, or too large to store in integer minor units
+    if not amount.is_finite() or amount.adjusted() >= 15:
+        raise argparse.ArgumentTypeError(f"invalid amount {value!r}")
+    return amount
+
+
+def _period(value):
+    """YYYY or YYYY-MM as (first day, last day) of that year or month."""
+    try:
+        if len(value) == 4:
+            return date(int(value), 1, 1), date(int(value), 12, 31)
+        first = date.fromisoformat(value + "-01")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid period {value!r} (expected YYYY or YYYY-MM)")
+    following = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+    return first, date.fromordinal(following.toordinal() - 1)
+
+
+def build_parser(parser_class=argparse.ArgumentParser):
+    p = parser_class(prog="cli.py", description="Budget Baddie command line")
+    sub = p.add_subparsers(dest="command")
+
+    # ---- bookkeeping ----
+    sub.add_parser("init", help="create or migrate the database").set_defaults(run=run_init)
+
+    cat = sub.add_parser("add-category", help="create a category")
+    cat.add_argument("name")
+    cat.add_argument("--description", default="")
+    cat.add_argument("--recurrent", action="store_true")
+    cat.add_argument("--expected-monthly", type=float, default=0.0, metavar="AMOUNT")
+    cat.set_defaults(run=run_add_category)
+
+    scat = sub.add_parser("add-subcategory", help="create a subcategory")
+    scat.add_argument("category")
+    scat.add_argument("name")
+    scat.add_argument("--description", default="")
+    scat.add_argument("--labels", default="", help="comma-separated auto-categorization labels")
+    scat.set_defaults(run=run_add_subcategory)
+
+    for kind in ("expense", "income"):
+        add = sub.add_parser(f"add-{kind}", help=f"record one {kind}")
+        add.add_argument("date", type=_date, metavar="YYYY-MM-DD")
+        add.add_argument("amount", type=_amount)
+        add.add_argument("category", nargs="?", help="category name (default: none)")
+        add.add_argument("--subcategory")
+        add.add_argument("--description", default="")
+        add.add_argument("--currency", default=None, help="default: the base currency")
+        if kind == "expense":
+            add.add_argument("--expected", action="store_true", help="planned rather than unexpected")
+        add.set_defaults(run=run_add, kind=kind)
+
+    sub.add_parser("rebuild-totals", help="recompute the monthly aggregate table").set_defaults(run=run_rebuild_totals)
+
+    bat = sub.add_parser("batch", help="run many commands (one per line) in a single transaction")
+    bat.add_argument("file", nargs="?", default="-", help="command file (default: stdin)")
+    bat.set_defaults(run=run_batch)
+
+    # ---- bulk data ----
+    imp = sub.add_parser("import", help="bulk-import a bank statement CSV")
+    imp.add_argument("file")
+    imp.add_argument("--kind", choices=("expense", "income"), default="expense")
+    imp.add_argument("--map", action="append", default=[], metavar="FIELD=COLUMN",
+                     help="CSV column for date/amount/description/category/subcategory/currency/expected")
+    imp.add_argument("--date-format", default="%Y-%m-%d")
+    imp.add_argument("--decimal", default=".")
+    imp.add_argument("--thousands", default=None)
+    imp.add_argument("--currency", default="EUR", help="currency for rows without one")
+    imp.add_argument("--delimiter", default=",")
+    imp.add_argument("--encoding", default="utf-8-sig")
+    imp.add_argument("--absolute", action="store_true", help="store absolute amounts (negative debits)")
+    imp.add_argument("--batch-size", type=int, default=5000)
+    imp.add_argument("--no-classify", dest="classify", action="store_false",
+                     help="do not categorize rows from subcategory labels")
+    imp.set_defaults(run=run_import)
+
+    exp = sub.add_parser("export", help="export the full expense or income history")
+    exp.add_argument("output")
+    exp.add_argument("--kind", choices=("expense", "income"), default="expense")
+    exp.add_argument("--format", choices=("csv", "parquet"), default=None,
+                     help="defaults to the output file extension")
+    exp.add_argument("--gzip", action="store_true", help="gzip-compress CSV output")
+    exp.add_argument("--from", dest="date_from", metavar="YYYY-MM-DD")
+    exp.add_argument("--to", dest="date_to", metavar="YYYY-MM-DD")
+    exp.add_argument("--category", action="append", dest="categories", metavar="NAME")
+    exp.set_defaults(run=run_export)
+
+    rat = sub.add_parser("rates", help="manage the local exchange-rate history")
+    rat.add_argument("--import", dest="import_file", metavar="FILE",
+                     help="CSV with date,currency,rate columns (units per 1 EUR)")
+    rat.add_argument("--delimiter", default=",")
+    rat.add_argument("--refresh", action="store_true", help="fetch and store today's rates")
+    rat.set_defaults(run=run_rates)
+
+    srch = sub.add_parser("search", help="full-text search over descriptions and category names")
+    srch.add_argument("text", nargs="+")
+    srch.add_argument("--kind", choices=("expense", "income"), default=None)
+    srch.add_argument("--limit", type=int, default=20)
+    srch.add_argument("--offset", type=int, default=0)
+    srch.add_argument("--from", dest="date_from", metavar="YYYY-MM-DD")
+    srch.add_argument("--to", dest="date_to", metavar="YYYY-MM-DD")
+    srch.set_defaults(run=run_search)
+
+    cls = sub.add_parser("classify", help="categorize transactions from subcategory labels")
+    cls.add_argument("--kind", choices=("expense", "income"), action="append",
+                     help="default: both")
+    cls.add_argument("--all", dest="only_uncategorized", action="store_false",
+                     help="also re-categorize rows that already have a category")
+    cls.set_defaults(run=run_classify)
+
+    rep = sub.add_parser("report", help="render static HTML statements for every month and year")
+    rep.add_argument("--from", dest="period_from", type=_period, metavar="YYYY[-MM]",
+                     help="default: the first month with data")
+    rep.add_argument("--to", dest="period_to", type=_period, metavar="YYYY[-MM]",
+                     help="default: the last month with data")
+    rep.add_argument("--out", default="reports", help="output directory (default: reports)")
+    rep.add_argument("--currency", default=None, help="display currency (default: EUR)")
+    rep.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    rep.add_argument("--force", action="store_true", help="re-render periods that have not changed")
+    rep.add_argument("--top", type=int, default=None, help="transactions listed per table (default: 10)")
+    rep.add_argument("--plotlyjs", choices=("embed", "directory", "cdn"), default="embed",
+                     help="embed plotly.js in each page, write it once next to them, or load it from a CDN")
+    rep.set_defaults(run=run_report)
+
+    syn = sub.add_parser("sync", help="two-way sync with another copy of the database")
+    syn.add_argument("other", help="path of the other database file")
+    syn.add_argument("--full", action="store_true",
+                     help="resend every row, not just the changes since the last sync")
+    syn.set_defaults(run=run_sync)
+
+    # ---- legacy flags, kept for existing scripts ----
+    p.add_argument("--init-db", action="store_true", help=argparse.SUPPRESS)
+    p.add_argument("--add-cat", nargs=1, help=argparse.SUPPRESS)
+    p.add_argument("--add-subcat", nargs=2, metavar=("CATEGORY", "SUBNAME"), help=argparse.SUPPRESS)
+    p.add_argument("--add-expense", nargs=4, metavar=("DATE", "AMOUNT", "CATEGORY", "EXPECTED"), help=argparse.SUPPRESS)
+    p.add_argument("--add-income", nargs=2, metavar=("DATE", "AMOUNT"), help=argparse.SUPPRESS)
+    p.add_argument("--rebuild-totals", action="store_true", help=argparse.SUPPRESS)
+    return p
+
+
+# -------------------------------
+# BOOKKEEPING COMMANDS
+# -------------------------------
+# These return a one-line message instead of printing it, so batch mode
+# can stay quiet and report a single summary.
+def run_init(args):
+    return f"Database at schema version {init_db()}."
+
+def run_add_category(args):
+    from app.schema import create_category
+    create_category(args.name, args.description, args.recurrent, args.expected_monthly)
+    return f"Category created: {args.name}"
+
+def _category(name):
+    from app.schema import get_category_by_name
+    c = get_category_by_name(name)
+    if c is None:
+        raise CommandError(f"Category not found: {name}")
+    return c
+
+def run_add_subcategory(args):
+    from app.schema import create_subcategory
+    c = _category(args.category)
+    labels = [label.strip() for label in args.labels.split(",") if label.strip()]
+    create_subcategory(c["id"], args.name, args.description, labels)
+    return f"Subcategory created: {args.name} in {c['name']}"
+
+def run_add(args):
+    from app.schema import add_expense, add_income
+    from app.currency import BASE_CURRENCY
+    cat_id = sub_id = None
+    if args.category:
+        c = _category(args.category)
+        cat_id = c["id"]
+        if args.subcategory:
+            key = args.subcategory.strip().lower()
+            sub_id = next((sc["id"] for sc in c["subcategories"] if sc["name"].strip().lower() == key), None)
+            if sub_id is None:
+                raise CommandError(f"Subcategory not found: {args.subcategory} in {c['name']}")
+    elif args.subcategory:
+        raise CommandError("--subcategory needs a category")
+    currency = (args.currency or BASE_CURRENCY).upper()
+    if args.kind == "expense":
+        add_expense(args.date, args.amount, cat_id, sub_id, args.description, args.expected, currency)
+    else:
+        add_income(args.date, args.amount, cat_id, sub_id, args.description, currency)
+    return f"{args.kind.capitalize()} added."
+
+def run_rebuild_totals(args):
+    from app.schema import rebuild_monthly_totals
+    rebuild_monthly_totals()
+    return "Monthly totals rebuilt."
+
+def run_batch(args):
+    """
+    Run every line of `args.file` (stdin for "-") as a command, inside one
+    write transaction: either all of them are applied or none. Blank lines
+    and lines starting with # are skipped.
+    """
+    from app.schema import invalidate_categories
+    from app.writer import write
+
+    parser = build_parser(_BatchParser)
+    f = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+
+    def apply(conn):
+        count = 0
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                # shlex is slow; lines without quoting split the same on whitespace
+                words = shlex.split(line) if any(ch in line for ch in "\"'\\") else line.split()
+                cmd = parser.parse_args(words)
+                if getattr(cmd, "run", None) in (None, run_batch):
+                    raise CommandError("expected a command (batches cannot be nested)")
+                cmd.run(cmd)
+            except (CommandError, ValueError, ArithmeticError, sqlite3.Error) as e:
+                raise CommandError(f"line {number}: {e}") from e
+            count += 1
+        return count
+
+    start = time.perf_counter()
+    try:
+        count = write(apply)
+    except CommandError:
+        # Categories looked up or created inside the rolled-back batch
+        invalidate_categories()
+        raise
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    elapsed = time.perf_counter() - start
+    return f"Applied {count} commands in {elapsed:.2f}s ({count / elapsed if elapsed else 0:,.0f} ops/sec)."
+
+
+# -------------------------------
+# BULK DATA COMMANDS
+# -------------------------------
+def run_import(args):
+    from app.importer import import_csv
+    columns = dict(m.split("=", 1) for m in args.map)
+    result = import_csv(
+        args.file, kind=args.kind, columns=columns, date_format=args.date_format,
+        decimal=args.decimal, thousands=args.thousands, currency=args.currency,
+        delimiter=args.delimiter, encoding=args.encoding, absolute=args.absolute,
+        batch_size=args.batch_size, classify=args.classify,
+    )
+    print(f"Imported {result['imported']} rows in {result['seconds']:.2f}s "
+          f"({result['rows_per_sec']:,.0f} rows/sec), rejected {result['rejected']}.")
+    for line, reason in result["rejects"]:
+        print(f"  line {line}: {reason}")
+
+def run_export(args):
+    from app.export import export_csv, export_parquet
+    fmt = args.format or ("parquet" if args.output.endswith(".parquet") else "csv")
+    filters = dict(date_from=args.date_from, date_to=args.date_to, categories=args.categories)
+    if fmt == "parquet":
+        count = export_parquet(args.output, args.kind, **filters)
+    else:
+        count = export_csv(args.output, args.kind, compress=args.gzip or args.output.endswith(".gz"), **filters)
+    print(f"Exported {count} rows to {args.output}.")
+
+def run_rates(args):
+    from app.rates import import_rates_csv, refresh_rates
+    if args.import_file:
+        count = import_rates_csv(args.import_file, delimiter=args.delimiter)
+        print(f"Stored {count} rates from {args.import_file}.")
+    if args.refresh:
+        count = refresh_rates()
+        print(f"Stored today's rates for {count} currencies.")
+
+def run_search(args):
+    from app.schema import SEARCH_WINDOW, search_transactions
+    hits = search_transactions(" ".join(args.text), kind=args.kind, limit=args.limit, offset=args.offset,
+                               date_from=args.date_from, date_to=args.date_to)
+    for h in hits:
+        category = " / ".join(n for n in (h["category"], h["subcategory"]) if n)
+        print(f"{h['date']}  {h['kind']:7} #{h['id']:<6} {h['amount']:>12,.2f} {h['currency']}  "
+              f"{category:30.30}  {h['description'] or ''}")
+    if not hits:
+        print("No matches.")
+    if args.offset + len(hits) >= SEARCH_WINDOW:
+        print(f"Only the {SEARCH_WINDOW:,} most recent matches are searched: "
+              "use --from/--to to reach older ones.", file=sys.stderr)
+
+def run_classify(args):
+    from app.schema import auto_categorize
+    for kind in args.kind or ("expense", "income"):
+        count = auto_categorize(kind, only_uncategorized=args.only_uncategorized)
+        print(f"Categorized {count} {kind} rows.")
+
+def run_report(args):
+    from app.report import TOP_N, generate
+    from app.currency import BASE_CURRENCY
+    result = generate(
+        args.out,
+        first=args.period_from[0] if args.period_from else None,
+        last=args.period_to[1] if args.period_to else None,
+        currency=(args.currency or BASE_CURRENCY).upper(), workers=args.workers, force=args.force,
+        top=args.top or TOP_N, plotlyjs=args.plotlyjs,
+    )
+    print(f"Rendered {result['rendered']} reports, skipped {result['skipped']} unchanged "
+          f"in {result['seconds']:.2f}s -> {args.out}/index.html")
+
+def run_sync(args):
+    from app.sync import sync
+    result = sync(args.other, full=args.full)
+    if result["new_replica"]:
+        print(f"{args.other} was a copy of this database; it now syncs as a replica of its own.")
+    for direction, counts in (("Pulled", result["pulled"]), ("Pushed", result["pushed"])):
+        print(f"{direction} {counts['changes']} changes ({counts['bytes'] / 1024:,.1f} kB): "
+              f"{counts['applied']} applied, {counts['current']} already present, "
+              f"{counts['outdated']} superseded by newer edits"
+              + (f", {counts['orphaned']} orphaned" if counts["orphaned"] else "") + ".")
+    print(f"Synced with {args.other} in {result['seconds']:.2f}s.")
+
+
+def _legacy_commands(args):
+    """Translate the old top-level flags into subcommand argument lists."""
     if args.init_db:
-        init_db()
-        print("DB initialized.")
+        yield ["init"]
     if args.add_cat:
-        name = args.add_cat[0]
-        create_category(name)
-        print("Category created:", name)
+        yield ["add-category", args.add_cat[0]]
     if args.add_subcat:
-        catname, subname = args.add_subcat
-        c = get_category_by_name(catname)
-        if not c:
-            print("Category not found:", catname)
-            return
-        create_subcategory(c.id, subname)
-        print("Subcategory created:", subname, "in", catname)
+        yield ["add-subcategory", *args.add_subcat]
     if args.add_expense:
-        dstr, amount, catname, expected_str = args.add_expense
-        d = datetime.strptime(dstr, "%Y-%m-%d").date()
-        amount = float(amount)
-        expected = expected_str.lower() in ("1","true","yes","y")
-        c = get_category_by_name(catname)
-        if not c:
-            print("Category not found:", catname)
-            return
-        add_expense(d, amount, c.id, expected=expected)
-        print("Expense added.")
+        dstr, amount, catname, expected = args.add_expense
+        yield ["add-expense", dstr, amount, catname] + (["--expected"] if expected.lower() in TRUE_VALUES else [])
     if args.add_income:
-        dstr, amount = args.add_income
-        d = datetime.strptime(dstr, "%Y-%m-%d").date()
-        amount = float(amount)
-        add_income(d, amount)
-        print("Income added.")
-if __name__ == "__main__":
-    main()
+        yield ["add-income", *args.add_income]
+    if args.rebuild_totals:
+        yield ["rebuild-totals"]
+
 
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    commands = [args] if args.command else [parser.parse_args(cmd) for cmd in _legacy_commands(args)]
+    if not commands:
+        parser.print_help()
+        return 2
+    init_db()
+    try:
+        for cmd in commands:
+            try:
+                message = cmd.run(cmd)
+            except CommandError as e:
+                print(e, file=sys.stderr)
+                return 1
+            if message:
+                print(message)
+        return 0
+    finally:
+        # Fold the WAL back into the database file, so it can be copied alone
+        connection.close_all()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import atexit
+import sqlite3
+import queue
+import os
+import threading
+from contextlib import contextmanager
+
+from app.instrument import TracedConnection
+
+DB_PATH = os.getenv("BUDGET_DB", os.path.join(os.path.dirname(__file__), "budget.db"))
+
+# Connections are configured once when opened and then kept in a small pool,
+# so each schema call only pays for its own statements (the per-connection
+# statement cache keeps them prepared between calls).
+POOL_SIZE = 8
+CACHED_STATEMENTS = 256
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA foreign_keys=ON",
+)
+
+_pools = {}
+_watchers = {}
+_watch_lock = threading.Lock()
+
+
+class _Bound(threading.local):
+    path = None
+    conn = None
+
+
+_bound = _Bound()
+
+
+def _open(path):
+    conn = sqlite3.connect(
+        path,
+        timeout=5.0,
+        check_same_thread=False,
+        cached_statements=CACHED_STATEMENTS,
+        factory=TracedConnection,
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _pool(path):
+    pool = _pools.get(path)
+    if pool is None:
+        pool = _pools.setdefault(path, queue.LifoQueue(maxsize=POOL_SIZE))
+    return pool
+
+
+@contextmanager
+def connection(path=None):
+    """
+    Borrow a configured connection from the pool for reads. Inside a write
+    job (see bind) this is the job's own connection, so reads see its writes.
+    """
+    path = path or DB_PATH
+    if _bound.conn is not None and _bound.path == path:
+        yield _bound.conn
+        return
+    pool = _pool(path)
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = _open(path)
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+@contextmanager
+def transaction(path=None):
+    """Borrow a pooled connection and commit (or roll back) on exit."""
+    with connection(path) as conn:
+        with conn:
+            yield conn
+
+
+@contextmanager
+def bind(conn, path=None):
+    """Route this thread's connection(path) calls to `conn` (the writer's, mid-transaction)."""
+    previous = _bound.path, _bound.conn
+    _bound.path, _bound.conn = path or DB_PATH, conn
+    try:
+        yield conn
+    finally:
+        _bound.path, _bound.conn = previous
+
+
+def in_write():
+    """True while this thread runs a write job (reads may see uncommitted rows)."""
+    return _bound.conn is not None
+
+
+def data_version(path=None):
+    """
+    Generation token for the database: changes whenever any connection, in
+    this process or another, commits. Read from a dedicated untraced
+    connection with PRAGMA data_version, which checks the file header only.
+    """
+    path = path or DB_PATH
+    with _watch_lock:
+        watch = _watchers.get(path)
+        if watch is None:
+            watch = _watchers[path] = sqlite3.connect(path, check_same_thread=False)
+        return watch.execute("PRAGMA data_version").fetchone()[0]
+
+
+def close_all():
+    """
+    Checkpoint and close every pooled connection, e.g. before replacing the
+    database file. Runs at exit too: committed writes leave budget.db-wal
+    only once checkpointed, so a copy of budget.db alone would miss them.
+    """
+    with _watch_lock:
+        for watch in _watchers.values():
+            watch.close()
+        _watchers.clear()
+    for pool in _pools.values():
+        conns = []
+        while True:
+            try:
+                conns.append(pool.get_nowait())
+            except queue.Empty:
+                break
+        if conns:
+            try:
+                conns[0].execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error:
+                pass  # busy (another process is reading): its own exit checkpoints
+        for conn in conns:
+            conn.close()
+    _pools.clear()
+
+
+atexit.register(close_all)
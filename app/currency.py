@@ -0,0 +1,163 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+# numpy and pandas are imported inside the vectorized helpers, so scalar
+# conversions (and the CLI) do not pay for loading them
+
+# Rates are expressed as units of each currency per one unit of BASE_CURRENCY.
+BASE_CURRENCY = "EUR"
+FALLBACK_RATES = {"EUR": 1.0, "USD": 1.1, "GBP": 0.85}
+
+# Active ISO 4217 codes
+CURRENCIES = (
+    "AED", "AFN", "ALL", "AMD", "ANG", "AOA", "ARS", "AUD", "AWG", "AZN",
+    "BAM", "BBD", "BDT", "BGN", "BHD", "BIF", "BMD", "BND", "BOB", "BRL",
+    "BSD", "BTN", "BWP", "BYN", "BZD", "CAD", "CDF", "CHF", "CLP", "CNY",
+    "COP", "CRC", "CUP", "CVE", "CZK", "DJF", "DKK", "DOP", "DZD", "EGP",
+    "ERN", "ETB", "EUR", "FJD", "FKP", "GBP", "GEL", "GHS", "GIP", "GMD",
+    "GNF", "GTQ", "GYD", "HKD", "HNL", "HTG", "HUF", "IDR", "ILS", "INR",
+    "IQD", "IRR", "ISK", "JMD", "JOD", "JPY", "KES", "KGS", "KHR", "KMF",
+    "KPW", "KRW", "KWD", "KYD", "KZT", "LAK", "LBP", "LKR", "LRD", "LSL",
+    "LYD", "MAD", "MDL", "MGA", "MKD", "MMK", "MNT", "MOP", "MRU", "MUR",
+    "MVR", "MWK", "MXN", "MYR", "MZN", "NAD", "NGN", "NIO", "NOK", "NPR",
+    "NZD", "OMR", "PAB", "PEN", "PGK", "PHP", "PKR", "PLN", "PYG", "QAR",
+    "RON", "RSD", "RUB", "RWF", "SAR", "SBD", "SCR", "SDG", "SEK", "SGD",
+    "SHP", "SLE", "SOS", "SRD", "SSP", "STN", "SVC", "SYP", "SZL", "THB",
+    "TJS", "TMT", "TND", "TOP", "TRY", "TTD", "TWD", "TZS", "UAH", "UGX",
+    "USD", "UYU", "UZS", "VES", "VND", "VUV", "WST", "XAF", "XCD", "XOF",
+    "XPF", "YER", "ZAR", "ZMW", "ZWL",
+)
+
+
+# Amounts are stored as integers in minor units (cents). Most currencies use
+# two decimals; these are the ISO 4217 exceptions.
+DEFAULT_EXPONENT = 2
+CURRENCY_EXPONENTS = {
+    "BHD": 3, "BIF": 0, "CLP": 0, "DJF": 0, "GNF": 0, "IQD": 3, "ISK": 0,
+    "JOD": 3, "JPY": 0, "KMF": 0, "KRW": 0, "KWD": 3, "LYD": 3, "OMR": 3,
+    "PYG": 0, "RWF": 0, "TND": 3, "UGX": 0, "VND": 0, "VUV": 0, "XAF": 0,
+    "XOF": 0, "XPF": 0,
+}
+
+
+def exponent(currency):
+    return CURRENCY_EXPONENTS.get(currency or BASE_CURRENCY, DEFAULT_EXPONENT)
+
+
+def to_minor(amount, currency):
+    """Major-unit amount (float, str or Decimal) -> exact integer minor units."""
+    value = amount if isinstance(amount, Decimal) else Decimal(str(amount))
+    return int(value.scaleb(exponent(currency)).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_minor(minor, currency):
+    """Integer minor units -> major-unit float for display and charts."""
+    if minor is None:
+        return None
+    return minor / 10 ** exponent(currency)
+
+
+def minor_to_major(minor, currencies):
+    """Vectorized from_minor over aligned Series of minor amounts and currencies."""
+    import numpy as np
+    import pandas as pd
+
+    codes = pd.Categorical(currencies)
+    # Missing currencies have code -1, which picks the trailing base-currency scale
+    scales = np.array([10.0 ** exponent(c) for c in codes.categories] + [10.0 ** exponent(None)])
+    return minor.astype("float64") / scales[codes.codes]
+
+
+def minor_scale_sql(currency_column):
+    """SQL expression giving 10 ** exponent for each row's currency."""
+    cases = " ".join(
+        f"WHEN '{cur}' THEN {10 ** exp}" for cur, exp in sorted(CURRENCY_EXPONENTS.items())
+    )
+    return f"(CASE IFNULL({currency_column}, '{BASE_CURRENCY}') {cases} ELSE {10 ** DEFAULT_EXPONENT} END)"
+
+
+def convert_value(amount, from_currency, to_currency, rates):
+    """Convert a single amount; unknown currencies are treated as rate 1.0."""
+    if from_currency == to_currency:
+        return amount
+    return amount / rates.get(from_currency, 1.0) * rates.get(to_currency, 1.0)
+
+
+def convert_frame(df, to_currency, rates, amount_col="amount", currency_col="currency",
+                  default_currency=BASE_CURRENCY):
+    """
+    Convert a whole frame to `to_currency` in one vectorized step and return
+    the converted amounts as a Series aligned with `df`.
+
+    Conversion factors are computed once per distinct currency (via
+    categorical codes), then broadcast over the rows. Missing currencies
+    fall back to `default_currency`, unknown ones to a rate of 1.0 like
+    `convert_value`.
+    """
+    import pandas as pd
+
+    amounts = df[amount_col].to_numpy(dtype="float64")
+    if currency_col in df:
+        # object first: fillna on a Categorical fails when the default is not one of its categories
+        currencies = df[currency_col].astype("object").fillna(default_currency)
+    else:
+        currencies = pd.Series(default_currency, index=df.index)
+
+    codes = pd.Categorical(currencies)
+    categories = pd.Series(codes.categories, dtype="object")
+    to_rate = rates.get(to_currency, 1.0)
+    factors = (to_rate / categories.map(rates).fillna(1.0)).to_numpy(dtype="float64")
+    factors[(categories == to_currency).to_numpy()] = 1.0
+
+    return pd.Series(amounts * factors[codes.codes], index=df.index, name=amount_col)
+
+
+def _asof_rates(dates, currencies, rate_table):
+    """Rate in effect on each date for each currency (NaN when none is known yet)."""
+    import numpy as np
+    import pandas as pd
+
+    left = pd.DataFrame({"date": dates.to_numpy(), "currency": currencies.to_numpy(), "pos": np.arange(len(dates))})
+    left = left.sort_values("date", kind="stable")
+    merged = pd.merge_asof(
+        left, rate_table[["date", "currency", "rate"]].sort_values("date", kind="stable"),
+        on="date", by="currency", direction="backward",
+    )
+    out = np.empty(len(dates))
+    out[merged["pos"].to_numpy()] = merged["rate"].to_numpy(dtype="float64")
+    return out
+
+
+def convert_frame_asof(df, to_currency, rate_table, fallback_rates, amount_col="amount",
+                       currency_col="currency", date_col="date", default_currency=BASE_CURRENCY):
+    """
+    Like convert_frame, but each row is converted at the rate in effect on
+    its own date (an as-of join against `rate_table`, a frame of date,
+    currency, rate). Rows dated before any known rate use `fallback_rates`.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if df.empty:
+        return pd.Series([], index=df.index, name=amount_col, dtype="float64")
+
+    amounts = df[amount_col].to_numpy(dtype="float64")
+    dates = pd.to_datetime(df[date_col]).astype("datetime64[ns]").reset_index(drop=True)
+    currencies = (df[currency_col] if currency_col in df else pd.Series(default_currency, index=df.index))
+    currencies = currencies.astype("object").fillna(default_currency).reset_index(drop=True)
+
+    rate_table = rate_table.assign(date=pd.to_datetime(rate_table["date"]).astype("datetime64[ns]"))
+    fallback = currencies.map(fallback_rates).fillna(1.0).to_numpy(dtype="float64")
+
+    from_rates = _asof_rates(dates, currencies, rate_table)
+    from_rates = np.where(np.isnan(from_rates), fallback, from_rates)
+    from_rates[(currencies == BASE_CURRENCY).to_numpy()] = 1.0
+
+    if to_currency == BASE_CURRENCY:
+        to_rates = np.ones(len(df))
+    else:
+        to_rates = _asof_rates(dates, pd.Series(to_currency, index=currencies.index), rate_table)
+        to_rates = np.where(np.isnan(to_rates), fallback_rates.get(to_currency, 1.0), to_rates)
+
+    factors = to_rates / from_rates
+    factors[(currencies == to_currency).to_numpy()] = 1.0
+    return pd.Series(amounts * factors, index=df.index, name=amount_col)
@@ -0,0 +1,131 @@
+import csv
+import gzip
+import io
+
+from app.connection import connection
+from app.currency import from_minor
+
+CHUNK_SIZE = 5000
+
+COLUMNS = {
+    "expense": ["id", "date", "amount", "currency", "category", "subcategory", "description", "expected"],
+    "income": ["id", "date", "amount", "currency", "category", "subcategory", "description"],
+}
+
+_QUERIES = {
+    "expense": """
+        SELECT e.id, e.date, e.amount, e.currency, c.name AS category, s.name AS subcategory,
+               e.description, e.expected
+        FROM expenses e
+        LEFT JOIN categories c ON e.category_id = c.id
+        LEFT JOIN subcategories s ON e.subcategory_id = s.id
+    """,
+    "income": """
+        SELECT e.id, e.date, e.amount, e.currency, c.name AS category, s.name AS subcategory,
+               e.description
+        FROM income e
+        LEFT JOIN categories c ON e.category_id = c.id
+        LEFT JOIN subcategories s ON e.subcategory_id = s.id
+    """,
+}
+
+
+def iter_chunks(kind="expense", date_from=None, date_to=None, categories=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield lists of at most `chunk_size` row tuples (in COLUMNS order) for
+    `kind`, optionally restricted to an inclusive date range and category
+    names, with amounts in major units. Rows come from an open cursor, so
+    only one chunk is in memory.
+    """
+    if kind not in _QUERIES:
+        raise ValueError(f"Unknown export kind: {kind!r}")
+
+    where, params = [], []
+    if date_from:
+        where.append("e.date >= ?")
+        params.append(str(date_from))
+    if date_to:
+        where.append("e.date <= ?")
+        params.append(str(date_to))
+    if categories:
+        where.append(f"c.name IN ({', '.join('?' for _ in categories)})")
+        params.extend(categories)
+
+    query = _QUERIES[kind]
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY e.id"
+
+    with connection() as conn:
+        cur = conn.execute(query, params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            # amount (index 2) is stored in minor units of currency (index 3)
+            yield [(r[0], r[1], from_minor(r[2], r[3])) + tuple(r[3:]) for r in rows]
+
+
+def export_csv(dest, kind="expense", compress=False, **filters):
+    """
+    Write `kind` to `dest` (path or binary file) as CSV, gzip-compressed if
+    `compress`. Returns the number of rows written.
+    """
+    own = isinstance(dest, (str, bytes)) or hasattr(dest, "__fspath__")
+    raw = open(dest, "wb") if own else dest
+    binary = gzip.GzipFile(fileobj=raw, mode="wb") if compress else raw
+    text = io.TextIOWrapper(binary, encoding="utf-8", newline="")
+    count = 0
+    try:
+        writer = csv.writer(text)
+        writer.writerow(COLUMNS[kind])
+        for rows in iter_chunks(kind, **filters):
+            writer.writerows(rows)
+            count += len(rows)
+        text.flush()
+    finally:
+        text.detach()
+        if compress:
+            binary.close()
+        if own:
+            raw.close()
+    return count
+
+
+def export_parquet(dest, kind="expense", **filters):
+    """
+    Write `kind` to `dest` (path or binary file) as Parquet, one row group
+    per chunk. Returns the number of rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    fields = [
+        ("id", pa.int64()),
+        ("date", pa.date32()),
+        ("amount", pa.float64()),
+        ("currency", pa.string()),
+        ("category", pa.string()),
+        ("subcategory", pa.string()),
+        ("description", pa.string()),
+    ]
+    if kind == "expense":
+        fields.append(("expected", pa.bool_()))
+    schema = pa.schema(fields)
+
+    count = 0
+    with pq.ParquetWriter(dest, schema, compression="zstd") as writer:
+        for rows in iter_chunks(kind, **filters):
+            arrays = []
+            for i, field in enumerate(schema):
+                values = [r[i] for r in rows]
+                if field.name == "date":
+                    arrays.append(pa.array(values, pa.string()).cast(pa.date32()))
+                elif field.name == "expected":
+                    arrays.append(pa.array([None if v is None else bool(v) for v in values], pa.bool_()))
+                else:
+                    arrays.append(pa.array(values, field.type))
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            count += len(rows)
+    return count
+
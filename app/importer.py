@@ -0,0 +1,187 @@
+import csv
+import time
+from decimal import Decimal, InvalidOperation
+from datetime import datetime, date
+from functools import lru_cache
+from itertools import islice
+
+from app.writer import submit
+from app.schema import list_categories
+from app.currency import to_minor
+from app.classifier import matcher
+from app.migrations import NOW_SQL, UUID_SQL
+
+# Target field -> default CSV column name
+DEFAULT_COLUMNS = {
+    "date": "date",
+    "amount": "amount",
+    "description": "description",
+    "category": "category",
+    "subcategory": "subcategory",
+    "currency": "currency",
+    "expected": "expected",
+}
+
+BATCH_SIZE = 5000
+MAX_REJECTS = 100
+
+# Rows get their sync uuid in the INSERT itself, and each batch is entered
+# in the change log with one statement instead of a trigger run per row
+_TABLES = {"expense": "expenses", "income": "income"}
+_INSERT = {
+    "expense": f"""
+        INSERT INTO expenses (date, amount, category_id, subcategory_id, description, expected, currency, uuid)
+        VALUES (?, ?, ?, ?, ?, ?, ?, {UUID_SQL})
+    """,
+    "income": f"""
+        INSERT INTO income (date, amount, category_id, subcategory_id, description, currency, uuid)
+        VALUES (?, ?, ?, ?, ?, ?, {UUID_SQL})
+    """,
+}
+
+
+def _insert_batch(conn, kind, batch):
+    table = _TABLES[kind]
+    after = conn.execute(f"SELECT IFNULL(MAX(id), 0) FROM {table}").fetchone()[0]
+    conn.execute("UPDATE sync_state SET value = 1 WHERE name = 'applying'")
+    try:
+        conn.executemany(_INSERT[kind], batch)
+    finally:
+        conn.execute("UPDATE sync_state SET value = 0 WHERE name = 'applying'")
+    conn.execute(f"""
+        INSERT INTO changes (tbl, uuid, op, stamp, origin)
+        SELECT '{table}', uuid, 'insert', {NOW_SQL}, (SELECT value FROM sync_state WHERE name = 'replica')
+        FROM {table} WHERE id > ? ORDER BY id
+    """, (after,))
+
+
+def category_lookup():
+    """
+    In-memory name -> id maps built from the cached category tree:
+    ({category_name: id}, {(category_id, subcategory_name): id}), case-insensitive.
+    """
+    cats, subs = {}, {}
+    for c in list_categories():
+        cats[c["name"].strip().lower()] = c["id"]
+        for sc in c["subcategories"]:
+            subs[(c["id"], sc["name"].strip().lower())] = sc["id"]
+    return cats, subs
+
+
+def _field(row, column):
+    """A required field; short lines leave the trailing ones as None."""
+    value = row.get(column)
+    if value is None or not value.strip():
+        raise ValueError(f"missing {column!r}")
+    return value
+
+
+def _parse_amount(text, decimal, thousands):
+    text = text.strip().replace("\u00a0", "").replace(" ", "")
+    if thousands:
+        text = text.replace(thousands, "")
+    if decimal != ".":
+        text = text.replace(decimal, ".")
+    return Decimal(text)
+
+
+def _date_parser(date_format):
+    # Statements repeat the same few hundred dates, so memoize the parse
+    if date_format in ("%Y-%m-%d", "iso"):
+        parse = lambda text: date.fromisoformat(text.strip()).isoformat()
+    else:
+        parse = lambda text: datetime.strptime(text.strip(), date_format).date().isoformat()
+    return lru_cache(maxsize=4096)(parse)
+
+
+def parse_rows(reader, kind="expense", columns=None, date_format="%Y-%m-%d", decimal=".",
+               thousands=None, currency="EUR", absolute=False, lookup=None, on_reject=None,
+               classify=True):
+    """
+    Turn CSV dict rows into insert tuples for `kind`, lazily.
+
+    Rows that cannot be parsed are skipped and reported through
+    `on_reject(line, reason)`. Rows without a known category name are
+    categorized from their description by the label matcher when `classify`
+    is set, and import as uncategorized otherwise.
+    """
+    cols = dict(DEFAULT_COLUMNS, **(columns or {}))
+    cats, subs = lookup or category_lookup()
+    parse_date = _date_parser(date_format)
+    # Statements repeat merchant names, so memoize like the date parser
+    classify = lru_cache(maxsize=16384)(matcher().classify) if classify else None
+
+    for line, row in enumerate(reader, start=2):
+        cur = (row.get(cols["currency"]) or currency).strip().upper()
+        try:
+            d = parse_date(_field(row, cols["date"]))
+            amount = _parse_amount(_field(row, cols["amount"]), decimal, thousands)
+            minor = to_minor(abs(amount) if absolute else amount, cur)
+        except (KeyError, TypeError, ValueError, InvalidOperation) as e:
+            if on_reject is not None:
+                on_reject(line, f"{type(e).__name__}: {e}")
+            continue
+
+        cat_name = (row.get(cols["category"]) or "").strip().lower()
+        cat_id = cats.get(cat_name)
+        sub_name = (row.get(cols["subcategory"]) or "").strip().lower()
+        sub_id = subs.get((cat_id, sub_name)) if cat_id is not None else None
+        description = row.get(cols["description"]) or ""
+        if cat_id is None and classify is not None:
+            cat_id, sub_id = classify(description) or (None, None)
+
+        if kind == "expense":
+            expected = (row.get(cols["expected"]) or "").strip().lower() in ("1", "true", "yes", "y")
+            yield (d, minor, cat_id, sub_id, description, expected, cur)
+        else:
+            yield (d, minor, cat_id, sub_id, description, cur)
+
+
+def import_csv(path, kind="expense", columns=None, date_format="%Y-%m-%d", decimal=".",
+               thousands=None, currency="EUR", delimiter=",", encoding="utf-8-sig",
+               absolute=False, batch_size=BATCH_SIZE, classify=True):
+    """
+    Stream a bank export into `expenses` or `income`.
+
+    The file is read row by row and inserted with executemany in batches of
+    `batch_size`, one transaction per batch, so memory stays flat however
+    large the file is. Returns a dict with counts, timing and the first
+    MAX_REJECTS rejected lines.
+    """
+    if kind not in _INSERT:
+        raise ValueError(f"Unknown import kind: {kind!r}")
+
+    rejects = []
+    rejected = 0
+
+    def on_reject(line, reason):
+        nonlocal rejected
+        rejected += 1
+        if len(rejects) < MAX_REJECTS:
+            rejects.append((line, reason))
+
+    imported = 0
+    start = time.perf_counter()
+    with open(path, newline="", encoding=encoding) as f:
+        reader = csv.DictReader(f, delimiter=delimiter)
+        rows = parse_rows(reader, kind, columns, date_format, decimal, thousands,
+                          currency, absolute, on_reject=on_reject, classify=classify)
+        pending = None
+        while True:
+            batch = list(islice(rows, batch_size))
+            # The next batch is parsed while the writer commits the previous one
+            if pending is not None:
+                pending.result()
+            if not batch:
+                break
+            pending = submit(lambda conn, batch=batch: _insert_batch(conn, kind, batch))
+            imported += len(batch)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "imported": imported,
+        "rejected": rejected,
+        "rejects": rejects,
+        "seconds": elapsed,
+        "rows_per_sec": imported / elapsed if elapsed else 0.0,
+    }
@@ -0,0 +1,200 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# -------------------------------
+# TRACES
+# -------------------------------
+# A trace collects timed sections and SQL statements for one unit of work
+# (one Streamlit rerun). It is bound to the current thread; with no active
+# trace every hook below returns after a single attribute lookup, so the
+# instrumentation can stay wired in permanently.
+
+ENABLED = os.getenv("BUDGET_TRACE", "") not in ("", "0")
+TRACE_FILE = os.getenv("BUDGET_TRACE_FILE")
+MAX_SQL_LENGTH = 300
+
+_file_lock = threading.Lock()
+
+
+class _Local(threading.local):
+    trace = None
+
+
+_local = _Local()
+
+
+class Trace:
+    def __init__(self, label):
+        self.label = label
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.sections = []
+        self.queries = []
+        self.stack = []
+
+    def to_dict(self):
+        return {
+            "label": self.label,
+            "timestamp": self.timestamp,
+            "seconds": self.seconds,
+            "sql_seconds": sum(q["seconds"] for q in self.queries),
+            "sections": self.sections,
+            "queries": self.queries,
+        }
+
+
+def begin(label="rerun"):
+    """Start a trace for the current thread, replacing any unfinished one."""
+    _local.trace = Trace(label)
+    return _local.trace
+
+
+def reset():
+    """Drop the current thread's trace without recording it."""
+    _local.trace = None
+
+
+def current():
+    return _local.trace
+
+
+def attach(trace):
+    """
+    Make `trace` (from another thread) the current thread's trace, e.g. for
+    work done on a caller's behalf. Returns the previous one to restore.
+    """
+    previous = _local.trace
+    _local.trace = trace
+    return previous
+
+
+def finish():
+    """
+    Close the current thread's trace, append it to TRACE_FILE (when set) as
+    one JSON line and return it as a dict. Returns None if nothing was traced.
+    """
+    trace = _local.trace
+    if trace is None:
+        return None
+    _local.trace = None
+    trace.seconds = time.perf_counter() - trace.start
+    result = trace.to_dict()
+    if TRACE_FILE:
+        line = json.dumps(result, default=str)
+        with _file_lock, open(TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    return result
+
+
+@contextmanager
+def section(name):
+    """Time a block as a named section of the current trace (no-op when untraced)."""
+    trace = _local.trace
+    if trace is None:
+        yield
+        return
+    first_query = len(trace.queries)
+    trace.stack.append(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        trace.stack.pop()
+        queries = trace.queries[first_query:]
+        trace.sections.append({
+            "name": name,
+            "depth": len(trace.stack),
+            "seconds": elapsed,
+            "queries": len(queries),
+            "sql_seconds": sum(q["seconds"] for q in queries),
+        })
+
+
+def _record(sql, seconds, rows):
+    trace = _local.trace
+    if trace is None:
+        return None
+    entry = {
+        "sql": " ".join(sql.split())[:MAX_SQL_LENGTH],
+        "section": trace.stack[-1] if trace.stack else None,
+        "seconds": seconds,
+        "rows": max(rows, 0),
+    }
+    trace.queries.append(entry)
+    return entry
+
+
+# -------------------------------
+# SQLITE HOOKS
+# -------------------------------
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that records each statement, including time spent fetching its rows."""
+
+    _entry = None
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        # SELECTs report rowcount -1; their rows are counted as they are fetched
+        self._entry = _record(sql, time.perf_counter() - start, self.rowcount)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._entry = _record(sql, time.perf_counter() - start, self.rowcount)
+        return self
+
+    def _fetched(self, start, count):
+        if self._entry is not None:
+            self._entry["seconds"] += time.perf_counter() - start
+            self._entry["rows"] += count
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        row = super().__next__()
+        self._fetched(start, 1)
+        return row
+
+
+class TracedConnection(sqlite3.Connection):
+    """Connection factory that hands out TracedCursors while a trace is active."""
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = sqlite3.Cursor if _local.trace is None else TracedCursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if _local.trace is None:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if _local.trace is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,548 @@
+import sqlite3
+import threading
+import uuid
+
+from app import connection
+from app.currency import minor_scale_sql
+
+# -------------------------------
+# MONTHLY AGGREGATES
+# -------------------------------
+# One row per (kind, year, month, category, subcategory, currency, expected)
+# with running sums and counts. Missing category/subcategory ids are stored
+# as 0 so they take part in the primary key.
+MONTHLY_TOTALS_TABLE = """
+    CREATE TABLE IF NOT EXISTS monthly_totals (
+        kind TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        subcategory_id INTEGER NOT NULL,
+        currency TEXT NOT NULL,
+        expected INTEGER NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (kind, year, month, category_id, subcategory_id, currency, expected)
+    ) WITHOUT ROWID
+"""
+
+# (kind, source table, expected expression, columns that move a row between buckets)
+_TOTALS_SOURCES = (
+    ("expense", "expenses", "IFNULL({row}.expected, 0)",
+     "date, amount, category_id, subcategory_id, currency, expected"),
+    ("income", "income", "0", "date, amount, category_id, subcategory_id, currency"),
+)
+
+def _totals_key(kind, row, expected):
+    return (
+        f"'{kind}', CAST(substr({row}.date, 1, 4) AS INTEGER), CAST(substr({row}.date, 6, 2) AS INTEGER), "
+        f"IFNULL({row}.category_id, 0), IFNULL({row}.subcategory_id, 0), "
+        f"IFNULL({row}.currency, 'EUR'), {expected.format(row=row)}"
+    )
+
+def monthly_totals_triggers():
+    key_cols = "kind, year, month, category_id, subcategory_id, currency, expected"
+    statements = []
+    for kind, table, expected, columns in _TOTALS_SOURCES:
+        add = f"""
+            INSERT INTO monthly_totals ({key_cols}, total, count)
+            VALUES ({_totals_key(kind, "NEW", expected)}, NEW.amount, 1)
+            ON CONFLICT ({key_cols}) DO UPDATE SET total = total + excluded.total, count = count + 1;
+        """
+        # Both statements address the one bucket OLD was counted in, so each
+        # row costs a primary-key lookup however large the table grows
+        remove = f"""
+            UPDATE monthly_totals SET total = total - OLD.amount, count = count - 1
+            WHERE ({key_cols}) = ({_totals_key(kind, "OLD", expected)});
+            DELETE FROM monthly_totals
+            WHERE ({key_cols}) = ({_totals_key(kind, "OLD", expected)}) AND count <= 0;
+        """
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS {table}_totals_ai AFTER INSERT ON {table} BEGIN {add} END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_totals_ad AFTER DELETE ON {table} BEGIN {remove} END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_totals_au AFTER UPDATE OF {columns} ON {table} BEGIN {remove} {add} END",
+        ]
+    return statements
+
+def fill_monthly_totals(cur):
+    """Recompute monthly_totals from the expenses and income tables."""
+    cur.execute("DELETE FROM monthly_totals")
+    for kind, table, expected, _ in _TOTALS_SOURCES:
+        cur.execute(f"""
+            INSERT INTO monthly_totals
+            SELECT {_totals_key(kind, "t", expected)}, SUM(t.amount), COUNT(*)
+            FROM {table} t
+            GROUP BY 2, 3, 4, 5, 6, 7
+        """)
+
+
+# -------------------------------
+# FULL-TEXT SEARCH
+# -------------------------------
+# One FTS5 index over both ledgers. Rowids encode the source row so triggers
+# can address an entry directly: expense id * 2, income id * 2 + 1.
+SEARCH_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        kind UNINDEXED, date UNINDEXED, description, category, subcategory,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+# bm25 weights per column: descriptions count most, category names least
+SEARCH_RANK = "bm25(0.0, 0.0, 4.0, 1.0, 1.5)"
+_SEARCH_SOURCES = (("expense", "expenses", "* 2"), ("income", "income", "* 2 + 1"))
+
+
+def _search_select(kind, rowid, alias="t"):
+    return f"""
+        SELECT {alias}.id {rowid}, '{kind}', {alias}.date, IFNULL({alias}.description, ''),
+               (SELECT name FROM categories WHERE id = {alias}.category_id),
+               (SELECT name FROM subcategories WHERE id = {alias}.subcategory_id)
+    """
+
+
+def search_triggers():
+    """DDL keeping search_index in step with the ledgers and category names."""
+    columns = "INSERT INTO search_index (rowid, kind, date, description, category, subcategory)"
+    statements = []
+    for kind, table, rowid in _SEARCH_SOURCES:
+        statements += [f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN
+                {columns} {_search_select(kind, rowid, "new")};
+            END
+        """, f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN
+                DELETE FROM search_index WHERE rowid = old.id {rowid};
+            END
+        """, f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_au
+            AFTER UPDATE OF id, date, description, category_id, subcategory_id ON {table} BEGIN
+                DELETE FROM search_index WHERE rowid = old.id {rowid};
+                {columns} {_search_select(kind, rowid, "new")};
+            END
+        """]
+    for table, column, key in (("categories", "category", "category_id"),
+                               ("subcategories", "subcategory", "subcategory_id")):
+        statements.append(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE OF name ON {table} BEGIN
+                UPDATE search_index SET {column} = new.name WHERE rowid IN (
+                    SELECT id * 2 FROM expenses WHERE {key} = new.id
+                    UNION ALL
+                    SELECT id * 2 + 1 FROM income WHERE {key} = new.id
+                );
+            END
+        """)
+    return statements
+
+
+def fill_search_index(cur):
+    """(Re)build search_index from the ledgers."""
+    cur.execute("DELETE FROM search_index")
+    for kind, table, rowid in _SEARCH_SOURCES:
+        cur.execute(f"""
+            INSERT INTO search_index (rowid, kind, date, description, category, subcategory)
+            {_search_select(kind, rowid)} FROM {table} t
+        """)
+    cur.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+
+
+# -------------------------------
+# CHANGE LOG
+# -------------------------------
+# Every insert, update and delete on the synced tables appends a row to
+# `changes`: the row's uuid, a stamp (ms since the epoch, always past the
+# row's previous stamp) and the replica that made the change. (stamp,
+# origin) is the row's version; sync keeps the higher one. While sync
+# applies a peer's changes it records their versions itself, so the
+# triggers stand aside (sync_state 'applying' = 1).
+CHANGES_TABLE = """
+    CREATE TABLE IF NOT EXISTS changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        tbl TEXT NOT NULL,
+        uuid TEXT NOT NULL,
+        op TEXT NOT NULL,
+        stamp INTEGER NOT NULL,
+        origin TEXT NOT NULL
+    )
+"""
+# (table, columns whose changes are logged and synced)
+SYNCED_TABLES = (
+    ("categories", "name, description, recurrent, expected_monthly"),
+    ("subcategories", "category_id, name, description, labels"),
+    ("expenses", "date, amount, category_id, subcategory_id, description, expected, currency"),
+    ("income", "date, amount, category_id, subcategory_id, description, currency"),
+)
+# A random (version 4) UUID in canonical form
+UUID_SQL = """lower(hex(randomblob(4)) || '-' || hex(randomblob(2)) || '-4' || substr(hex(randomblob(2)), 2)
+    || '-' || substr('89ab', 1 + abs(random()) % 4, 1) || substr(hex(randomblob(2)), 2)
+    || '-' || hex(randomblob(6)))"""
+# Milliseconds since the epoch; 'now' is fixed for the whole statement
+NOW_SQL = "CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)"
+
+def stamp_sql(row_uuid):
+    last = f"(SELECT stamp FROM changes WHERE uuid = {row_uuid} ORDER BY seq DESC LIMIT 1)"
+    return f"MAX({NOW_SQL}, IFNULL({last}, 0) + 1)"
+
+def change_triggers():
+    """DDL giving new rows a uuid and logging changes to the synced tables."""
+    active = "(SELECT value FROM sync_state WHERE name = 'applying') = 0"
+    replica = "(SELECT value FROM sync_state WHERE name = 'replica')"
+    statements = []
+    # An inserted row is new, so its version needs no lookup in the log (sync
+    # re-creating a known uuid runs with the log off). Rows inserted without
+    # a uuid get one afterwards; the importer passes UUID_SQL in the INSERT
+    # and logs each batch itself.
+    for table, columns in SYNCED_TABLES:
+        statements += [f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_changes_ai AFTER INSERT ON {table}
+            WHEN new.uuid IS NOT NULL AND {active} BEGIN
+                INSERT INTO changes (tbl, uuid, op, stamp, origin)
+                VALUES ('{table}', new.uuid, 'insert', {NOW_SQL}, {replica});
+            END
+        """, f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_uuid_ai AFTER INSERT ON {table}
+            WHEN new.uuid IS NULL BEGIN
+                UPDATE {table} SET uuid = {UUID_SQL} WHERE id = new.id;
+                INSERT INTO changes (tbl, uuid, op, stamp, origin)
+                SELECT '{table}', r.uuid, 'insert', {NOW_SQL}, {replica}
+                FROM {table} r WHERE r.id = new.id AND {active};
+            END
+        """, f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_changes_au AFTER UPDATE OF {columns} ON {table}
+            WHEN {active} BEGIN
+                INSERT INTO changes (tbl, uuid, op, stamp, origin)
+                VALUES ('{table}', new.uuid, 'update', {stamp_sql("new.uuid")}, {replica});
+            END
+        """, f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_changes_ad AFTER DELETE ON {table}
+            WHEN {active} BEGIN
+                INSERT INTO changes (tbl, uuid, op, stamp, origin)
+                VALUES ('{table}', old.uuid, 'delete', {stamp_sql("old.uuid")}, {replica});
+            END
+        """]
+    return statements
+
+def _row_uuids(cur, table):
+    """
+    Content-derived uuids for rows that predate the change log, so two copies
+    of the same file agree on them without syncing everything twice.
+    """
+    # The first column is the row id, the rest make up the key
+    queries = {
+        "categories": "SELECT id, name FROM categories",  # names are unique
+        "subcategories": """SELECT s.id, s.id, c.name, s.name FROM subcategories s
+                            LEFT JOIN categories c ON c.id = s.category_id""",
+    }
+    query = queries.get(table, f"SELECT id, id, date, amount, currency, description FROM {table}")
+    for row_id, *key in cur.execute(query).fetchall():
+        yield str(uuid.uuid5(uuid.NAMESPACE_URL, "|".join(str(v) for v in (table, *key)))), row_id
+
+
+# -------------------------------
+# MIGRATIONS
+# -------------------------------
+# Each migration takes a cursor and moves the schema from version N-1 to N.
+# The version reached is stored in PRAGMA user_version. Migrations must be
+# safe on databases created before versioning existed (user_version 0).
+
+def _columns(cur, table):
+    return {r[1] for r in cur.execute(f"PRAGMA table_info({table})")}
+
+def _m001_base_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            description TEXT,
+            recurrent BOOLEAN DEFAULT 0,
+            expected_monthly REAL DEFAULT 0.0
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS subcategories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            description TEXT,
+            labels TEXT,
+            FOREIGN KEY(category_id) REFERENCES categories(id)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS expenses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            amount REAL NOT NULL,
+            category_id INTEGER,
+            subcategory_id INTEGER,
+            description TEXT,
+            expected BOOLEAN DEFAULT 0,
+            currency TEXT DEFAULT 'EUR',
+            FOREIGN KEY(category_id) REFERENCES categories(id),
+            FOREIGN KEY(subcategory_id) REFERENCES subcategories(id)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS income (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            amount REAL NOT NULL,
+            category_id INTEGER,
+            subcategory_id INTEGER,
+            description TEXT,
+            currency TEXT DEFAULT 'EUR',
+            FOREIGN KEY(category_id) REFERENCES categories(id),
+            FOREIGN KEY(subcategory_id) REFERENCES subcategories(id)
+        )
+    """)
+
+def _m002_currency_columns(cur):
+    # 'currency' was added after the first release
+    for table in ("expenses", "income"):
+        if "currency" not in _columns(cur, table):
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN currency TEXT DEFAULT 'EUR'")
+
+def _m003_indexes(cur):
+    for table in ("expenses", "income"):
+        for column in ("date", "category_id", "subcategory_id"):
+            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table}({column})")
+
+def _m004_monthly_totals(cur):
+    cur.execute(MONTHLY_TOTALS_TABLE)
+    for statement in monthly_totals_triggers():
+        cur.execute(statement)
+    fill_monthly_totals(cur)
+
+def _detach_dangling(cur):
+    # Before foreign keys were enforced, deleting a category left its
+    # subcategories and transactions pointing at it; the rebuilt tables
+    # would reject those rows
+    for table in ("expenses", "income"):
+        cur.execute(f"""
+            UPDATE {table} SET category_id=NULL, subcategory_id=NULL
+            WHERE category_id IS NOT NULL AND category_id NOT IN (SELECT id FROM categories)
+        """)
+    cur.execute("DELETE FROM subcategories WHERE category_id NOT IN (SELECT id FROM categories)")
+    for table in ("expenses", "income"):
+        cur.execute(f"""
+            UPDATE {table} SET subcategory_id=NULL
+            WHERE subcategory_id IS NOT NULL AND subcategory_id NOT IN (SELECT id FROM subcategories)
+        """)
+
+def _m005_integer_amounts(cur):
+    # Amounts move from REAL to INTEGER minor units. SQLite cannot change a
+    # column type in place, so both tables are rebuilt (which also drops
+    # their triggers and indexes; they are recreated below).
+    tables = {
+        "expenses": """
+            CREATE TABLE expenses_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                amount INTEGER NOT NULL,
+                category_id INTEGER,
+                subcategory_id INTEGER,
+                description TEXT,
+                expected BOOLEAN DEFAULT 0,
+                currency TEXT DEFAULT 'EUR',
+                FOREIGN KEY(category_id) REFERENCES categories(id),
+                FOREIGN KEY(subcategory_id) REFERENCES subcategories(id)
+            )
+        """,
+        "income": """
+            CREATE TABLE income_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                amount INTEGER NOT NULL,
+                category_id INTEGER,
+                subcategory_id INTEGER,
+                description TEXT,
+                currency TEXT DEFAULT 'EUR',
+                FOREIGN KEY(category_id) REFERENCES categories(id),
+                FOREIGN KEY(subcategory_id) REFERENCES subcategories(id)
+            )
+        """,
+    }
+    _detach_dangling(cur)
+    for table, create in tables.items():
+        columns = [c for c in ("id", "date", "category_id", "subcategory_id", "description", "expected", "currency")
+                   if c in _columns(cur, table)]
+        seq = cur.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (table,)).fetchone()
+        cur.execute(create)
+        cur.execute(f"""
+            INSERT INTO {table}_new ({", ".join(columns)}, amount)
+            SELECT {", ".join(columns)}, CAST(ROUND(amount * {minor_scale_sql("currency")}) AS INTEGER)
+            FROM {table}
+        """)
+        cur.execute(f"DROP TABLE {table}")
+        cur.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        if seq:
+            cur.execute("UPDATE sqlite_sequence SET seq=MAX(seq, ?) WHERE name=?", (seq[0], table))
+    _m003_indexes(cur)
+
+    cur.execute("DROP TABLE IF EXISTS monthly_totals")
+    _m004_monthly_totals(cur)
+
+def _m006_mutation_counters(cur):
+    # Counts in-place updates and deletes per ledger table. Appends only move
+    # max(id), so caches can tell "new rows" from "rewritten history".
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ledger_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for table in ("expenses", "income"):
+        cur.execute("INSERT OR IGNORE INTO ledger_state (name, value) VALUES (?, 0)", (f"{table}_mutations",))
+        for event in ("UPDATE", "DELETE"):
+            cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_mutations_{event[0].lower()}
+                AFTER {event} ON {table} BEGIN
+                    UPDATE ledger_state SET value = value + 1 WHERE name = '{table}_mutations';
+                END
+            """)
+
+def _m007_rates(cur):
+    # Exchange rates as units of each currency per 1 EUR, one row per day
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS rates (
+            date TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            rate REAL NOT NULL,
+            PRIMARY KEY (currency, date)
+        ) WITHOUT ROWID
+    """)
+
+def _m008_search_index(cur):
+    cur.execute(SEARCH_TABLE)
+    cur.execute(f"INSERT INTO search_index (search_index, rank) VALUES ('rank', '{SEARCH_RANK}')")
+    for statement in search_triggers():
+        cur.execute(statement)
+    fill_search_index(cur)
+
+def _m009_monthly_budgets(cur):
+    # Per-month budget overrides in minor units of the base currency; months
+    # without one fall back to the category's expected_monthly if recurrent
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS monthly_budgets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            expected_amount INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (category_id, year, month),
+            FOREIGN KEY(category_id) REFERENCES categories(id)
+        )
+    """)
+
+def _m010_change_log(cur):
+    cur.execute(CHANGES_TABLE)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_changes_uuid ON changes(uuid, seq)")
+    cur.execute("CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, value)")
+    cur.execute("INSERT OR IGNORE INTO sync_state (name, value) VALUES ('applying', 0)")
+    cur.execute(f"INSERT OR IGNORE INTO sync_state (name, value) VALUES ('replica', {UUID_SQL})")
+    # Highest local change seq already delivered to each peer replica
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sync_peers (
+            peer TEXT PRIMARY KEY,
+            sent INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for table, columns in SYNCED_TABLES:
+        if table in ("expenses", "income"):
+            # Filling in a row's uuid is not a mutation of its contents
+            cur.execute(f"DROP TRIGGER IF EXISTS {table}_mutations_u")
+            cur.execute(f"""
+                CREATE TRIGGER {table}_mutations_u AFTER UPDATE OF id, {columns} ON {table} BEGIN
+                    UPDATE ledger_state SET value = value + 1 WHERE name = '{table}_mutations';
+                END
+            """)
+        if "uuid" not in _columns(cur, table):
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN uuid TEXT")
+        cur.executemany(f"UPDATE {table} SET uuid=? WHERE id=?", list(_row_uuids(cur, table)))
+        cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_uuid ON {table}(uuid)")
+    for statement in change_triggers():
+        cur.execute(statement)
+
+def _m011_keyed_totals_cleanup(cur):
+    # The update/delete triggers used to sweep the whole monthly_totals
+    # table for emptied buckets on every row, making bulk edits quadratic
+    for _, table, _, _ in _TOTALS_SOURCES:
+        for suffix in ("ai", "ad", "au"):
+            cur.execute(f"DROP TRIGGER IF EXISTS {table}_totals_{suffix}")
+    for statement in monthly_totals_triggers():
+        cur.execute(statement)
+
+def _m012_insert_time_uuids(cur):
+    # Inserts no longer look up the log for a stamp, and skip the follow-up
+    # UPDATE when the INSERT already carries a uuid
+    for table, _ in SYNCED_TABLES:
+        cur.execute(f"DROP TRIGGER IF EXISTS {table}_changes_ai")
+    for statement in change_triggers():
+        cur.execute(statement)
+
+MIGRATIONS = [
+    (1, "base tables", _m001_base_tables),
+    (2, "currency columns", _m002_currency_columns),
+    (3, "date and category indexes", _m003_indexes),
+    (4, "monthly aggregate table", _m004_monthly_totals),
+    (5, "integer minor-unit amounts", _m005_integer_amounts),
+    (6, "ledger mutation counters", _m006_mutation_counters),
+    (7, "historical exchange rates", _m007_rates),
+    (8, "full-text search index", _m008_search_index),
+    (9, "monthly budget overrides", _m009_monthly_budgets),
+    (10, "change log and row uuids", _m010_change_log),
+    (11, "keyed monthly total cleanup", _m011_keyed_totals_cleanup),
+    (12, "insert-time row uuids", _m012_insert_time_uuids),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+_migrated = {}
+_lock = threading.Lock()
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(path=None):
+    """
+    Apply all pending migrations in one transaction and return the schema
+    version. Each database is only checked once per process.
+    """
+    path = path or connection.DB_PATH
+    with _lock:
+        if path in _migrated:
+            return _migrated[path]
+
+        with connection.connection(path) as conn:
+            version = schema_version(conn)
+            pending = [m for m in MIGRATIONS if m[0] > version]
+            if pending:
+                # Table rebuilds need foreign keys off, which only takes
+                # effect outside a transaction; they are checked before commit
+                conn.execute("PRAGMA foreign_keys=OFF")
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    # Re-read under the write lock in case another process migrated
+                    version = schema_version(conn)
+                    cur = conn.cursor()
+                    for number, _, apply in MIGRATIONS:
+                        if number > version:
+                            apply(cur)
+                            version = number
+                    broken = cur.execute("PRAGMA foreign_key_check").fetchall()
+                    if broken:
+                        raise sqlite3.IntegrityError(
+                            f"migration to version {version} leaves {len(broken)} rows with dangling "
+                            f"references (first in table {broken[0][0]})"
+                        )
+                    cur.execute(f"PRAGMA user_version={version}")
+                    conn.commit()
+                except sqlite3.Error:
+                    conn.rollback()
+                    raise
+                finally:
+                    conn.execute("PRAGMA foreign_keys=ON")
+
+        _migrated[path] = version
+        return version
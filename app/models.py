@@ -3,6 +3,8 @@ from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
 
+# Mirrors the tables created by app/migrations.py, which owns the schema.
+
 class Category(Base):
     __tablename__ = "categories"
     id = Column(Integer, primary_key=True)
@@ -29,26 +31,30 @@ class Expense(Base):
     __tablename__ = "expenses"
     id = Column(Integer, primary_key=True)
     date = Column(Date, nullable=False)
-    amount = Column(Float, nullable=False)
+    amount = Column(Integer, nullable=False)  # minor units, see app/currency.py
     description = Column(String, default="")
-    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
     subcategory_id = Column(Integer, ForeignKey("subcategories.id"), nullable=True)
     expected = Column(Boolean, default=False)
+    currency = Column(String, default="EUR")
 
     category = relationship("Category", back_populates="expenses")
     subcategory = relationship("Subcategory", back_populates="expenses")
 
 class Income(Base):
-    __tablename__ = "incomes"
+    __tablename__ = "income"
     id = Column(Integer, primary_key=True)
     date = Column(Date, nullable=False)
-    amount = Column(Float, nullable=False)
+    amount = Column(Integer, nullable=False)  # minor units, see app/currency.py
     description = Column(String, default="")
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+    subcategory_id = Column(Integer, ForeignKey("subcategories.id"), nullable=True)
+    currency = Column(String, default="EUR")
 
 class MonthlyBudget(Base):
     __tablename__ = "monthly_budgets"
     id = Column(Integer, primary_key=True)
     year = Column(Integer, nullable=False)
     month = Column(Integer, nullable=False)
-    category_id = Column(Integer, ForeignKey("categories.id"))
-    expected_amount = Column(Float, default=0.0)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
+    expected_amount = Column(Integer, default=0)  # minor units of the base currency
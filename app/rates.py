@@ -0,0 +1,119 @@
+import csv
+import threading
+from datetime import date
+
+import pandas as pd
+
+from app import connection
+from app.cache import cached
+from app.currency import BASE_CURRENCY, FALLBACK_RATES
+from app.writer import write
+
+RATES_URL = "https://api.exchangerate.host/latest?base={base}"
+REFRESH_INTERVAL = 6 * 3600  # seconds
+BATCH_SIZE = 5000
+
+_refresher = None
+_lock = threading.Lock()
+
+
+# -------------------------------
+# STORAGE
+# -------------------------------
+def store_rates(rows):
+    """Upsert (date, currency, rate) rows; rates are per 1 BASE_CURRENCY."""
+    params = [(str(d), cur.upper(), float(rate)) for d, cur, rate in rows]
+    write(lambda conn: conn.executemany("""
+        INSERT INTO rates (date, currency, rate) VALUES (?, ?, ?)
+        ON CONFLICT (currency, date) DO UPDATE SET rate = excluded.rate
+    """, params))
+
+
+def import_rates_csv(path, delimiter=","):
+    """
+    Load historical rates from a CSV with `date,currency,rate` columns
+    (rate = units of currency per 1 EUR). Returns the number of rows stored.
+    """
+    count = 0
+    batch = []
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f, delimiter=delimiter):
+            batch.append((date.fromisoformat(row["date"].strip()), row["currency"].strip(), row["rate"]))
+            if len(batch) >= BATCH_SIZE:
+                store_rates(batch)
+                count += len(batch)
+                batch = []
+    if batch:
+        store_rates(batch)
+        count += len(batch)
+    return count
+
+
+@cached
+def latest_rates():
+    """Most recent stored rate per currency, on top of FALLBACK_RATES."""
+    rates = dict(FALLBACK_RATES)
+    with connection.connection() as conn:
+        rows = conn.execute("""
+            SELECT currency, rate FROM rates r
+            WHERE date = (SELECT MAX(date) FROM rates WHERE currency = r.currency)
+        """).fetchall()
+    rates.update({r["currency"]: r["rate"] for r in rows})
+    rates[BASE_CURRENCY] = 1.0
+    return rates
+
+
+@cached
+def rates_table(currencies=None):
+    """
+    Stored rates as a DataFrame (date as datetime64, currency, rate) sorted
+    by date, optionally limited to the given currencies.
+    """
+    query = "SELECT date, currency, rate FROM rates"
+    params = []
+    if currencies is not None:
+        currencies = sorted({c for c in currencies if c})
+        query += f" WHERE currency IN ({', '.join('?' for _ in currencies)})"
+        params = currencies
+    with connection.connection() as conn:
+        df = pd.read_sql_query(query + " ORDER BY date", conn, params=params)
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
+
+# -------------------------------
+# BACKGROUND REFRESH
+# -------------------------------
+def refresh_rates(base=BASE_CURRENCY, timeout=10):
+    """Fetch today's rates and store them. Returns the number of currencies stored."""
+    import requests
+
+    resp = requests.get(RATES_URL.format(base=base), timeout=timeout)
+    data = resp.json()
+    day = data.get("date") or date.today().isoformat()
+    rows = [(day, cur, rate) for cur, rate in data["rates"].items() if rate]
+    store_rates(rows)
+    return len(rows)
+
+
+def _run(interval, stop):
+    while True:
+        try:
+            refresh_rates()
+        except Exception as e:
+            # Offline or API change: keep using the stored rates
+            print(f"Rate refresh failed: {e}")
+        if stop.wait(interval):
+            break
+
+
+def start_rate_refresher(interval=REFRESH_INTERVAL):
+    """Start (once per process) a daemon thread that refreshes rates periodically."""
+    global _refresher
+    with _lock:
+        if _refresher is None or not _refresher[0].is_alive():
+            stop = threading.Event()
+            thread = threading.Thread(target=_run, args=(interval, stop), name="budget-rates", daemon=True)
+            thread.start()
+            _refresher = (thread, stop)
+        return _refresher[1]
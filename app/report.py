@@ -0,0 +1,297 @@
+import hashlib
+import html
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from app import analytics, charts
+from app.currency import BASE_CURRENCY, FALLBACK_RATES, convert_frame_asof
+
+# -------------------------------
+# STATIC REPORTS
+# -------------------------------
+# One HTML statement per month and per year. The parent process refreshes
+# the Arrow snapshots once; workers memory-map those same files (shared,
+# read-only) and only render. A manifest in the output directory records a
+# fingerprint of each period's rows, the rates it was converted with and
+# the report settings, so unchanged periods are skipped on the next run.
+
+REPORT_VERSION = 1  # bump when the page layout changes to rebuild every report
+MANIFEST = "manifest.json"
+TOP_N = 10
+PLOTLYJS = ("embed", "directory", "cdn")
+
+_worker = {}
+
+
+# -------------------------------
+# PERIODS
+# -------------------------------
+def _month_start(index):
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def periods(first, last):
+    """
+    (label, title, start, end) for every month from `first` to `last`
+    (inclusive dates) and every year they touch; `end` is exclusive.
+    """
+    lo, hi = first.year * 12 + first.month - 1, last.year * 12 + last.month - 1
+    for year in range(first.year, last.year + 1):
+        yield str(year), f"Statement {year}", date(year, 1, 1), date(year + 1, 1, 1)
+        for index in range(max(lo, year * 12), min(hi, year * 12 + 11) + 1):
+            start = _month_start(index)
+            yield start.strftime("%Y-%m"), f"Statement {start:%B %Y}", start, _month_start(index + 1)
+
+
+# -------------------------------
+# FINGERPRINTS
+# -------------------------------
+def _row_hashes(table, categories, index_of):
+    """(period index, uint64 content hash) per snapshot row; `index_of` maps dates to indices."""
+    # Integer columns with nulls would turn float in pandas, and with them
+    # every row's hash: the first uncategorized row must not dirty all periods
+    df = pd.DataFrame({
+        name: (column.fill_null(-1) if pa.types.is_integer(column.type) else column).to_pandas()
+        for name, column in zip(table.column_names, table.columns)
+    })
+    # Hash the names a page shows, so renaming a category only touches the periods using it
+    df["category_id"] = df["category_id"].map({c["id"]: c["name"] for c in categories})
+    df["subcategory_id"] = df["subcategory_id"].map(
+        {sc["id"]: sc["name"] for c in categories for sc in c["subcategories"]})
+    return index_of(df["date"]), pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def _sums(keys, hashes):
+    """Wrapping uint64 sum of the row hashes per key (order-independent)."""
+    if len(keys) == 0:
+        return {}
+    order = np.argsort(keys, kind="stable")
+    keys, hashes = keys[order], hashes[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return dict(zip(keys[starts].tolist(), np.add.reduceat(hashes, starts).tolist()))
+
+
+def _fingerprints(tables, categories, rate_table, settings, spans):
+    """Hex digest per period label; periods without any rows are left out."""
+    month_of = lambda dates: (dates.dt.year * 12 + dates.dt.month - 1).to_numpy()
+    per_month = {kind: _sums(*_row_hashes(t, categories, month_of)) for kind, t in tables.items()}
+
+    # Rates only matter up to a period's end (conversion is as of each row's date)
+    rate_table = rate_table.sort_values("date", kind="stable")
+    rate_dates = rate_table["date"].to_numpy()
+    rate_sums = np.cumsum(pd.util.hash_pandas_object(rate_table, index=False).to_numpy())
+
+    result = {}
+    for label, start, end in spans:
+        months = range(start.year * 12 + start.month - 1, end.year * 12 + end.month - 1)
+        rows = [per_month[kind].get(m) for kind in sorted(per_month) for m in months]
+        if not any(r is not None for r in rows):
+            continue
+        n_rates = int(np.searchsorted(rate_dates, np.datetime64(end), side="left"))
+        rates = int(rate_sums[n_rates - 1]) if n_rates else 0
+        text = json.dumps([settings, rows, rates], default=str)
+        result[label] = hashlib.sha1(text.encode()).hexdigest()
+    return result
+
+
+def _load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + ".part", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".part", path)
+
+
+# -------------------------------
+# RENDERING (runs in the workers)
+# -------------------------------
+_STYLE = """
+body { font-family: system-ui, sans-serif; margin: 2rem auto; max-width: 1100px; color: #222; }
+h1 { margin-bottom: 0; } .generated { color: #777; margin-top: .2rem; }
+.summary td { padding: .2rem 1.5rem .2rem 0; } .summary td.num, .top td.num { text-align: right; }
+.charts { display: flex; flex-wrap: wrap; } .charts > div { flex: 1 1 500px; }
+table.top { border-collapse: collapse; width: 100%; margin-bottom: 2rem; }
+.top th, .top td { border-bottom: 1px solid #ddd; padding: .3rem .5rem; text-align: left; }
+.surplus { color: #1a7f37; } .deficit { color: #cf222e; }
+"""
+
+
+def _init_worker(paths, categories, rate_table, currency, top, plotlyjs):
+    _worker.update(
+        tables={kind: analytics.read_snapshot(path) for kind, path in paths.items()},
+        categories=categories, rate_table=rate_table, currency=currency, top=top, plotlyjs=plotlyjs,
+    )
+
+
+def _rows(kind, start, end):
+    df = analytics.to_frame(_worker["tables"][kind], kind, [(start.isoformat(), end.isoformat())],
+                            _worker["categories"])
+    return df.assign(converted=convert_frame_asof(df, _worker["currency"], _worker["rate_table"],
+                                                 FALLBACK_RATES))
+
+
+def _top_table(df, currency):
+    if df.empty:
+        return "<p>None.</p>"
+    top = df.nlargest(_worker["top"], "converted")
+    body = "".join(
+        f"<tr><td>{r.date:%Y-%m-%d}</td><td>{html.escape(r.description or '')}</td>"
+        f"<td>{html.escape(' / '.join(n for n in (r.category, r.subcategory) if isinstance(n, str)))}</td>"
+        f"<td class='num'>{r.amount:,.2f} {r.currency}</td><td class='num'>{r.converted:,.2f}</td></tr>"
+        for r in top.itertuples()
+    )
+    return (f"<table class='top'><tr><th>Date</th><th>Description</th><th>Category</th>"
+            f"<th>Amount</th><th>{currency}</th></tr>{body}</table>")
+
+
+def _render(label, title, start, end, path):
+    started = time.perf_counter()
+    currency = _worker["currency"]
+    expenses, income = _rows("expense", start, end), _rows("income", start, end)
+
+    total_income = income["converted"].sum()
+    unexpected = expenses.loc[charts.is_unexpected(expenses["category"]), "converted"].sum()
+    expected = expenses["converted"].sum() - unexpected
+    balance = total_income - expected - unexpected
+
+    figures = [
+        charts.category_pie(charts.spend_by_category(expenses), currency),
+        charts.income_vs_expenses(total_income, expected, unexpected, currency),
+    ]
+    include = {"embed": True, "directory": "directory", "cdn": "cdn"}[_worker["plotlyjs"]]
+    charts_html = "".join(
+        f"<div>{fig.to_html(full_html=False, include_plotlyjs=include if i == 0 else False)}</div>"
+        for i, fig in enumerate(figures)
+    )
+
+    page = f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(title)}</title><style>{_STYLE}</style></head>
+<body>
+<h1>{html.escape(title)}</h1>
+<p class="generated">{start:%d %b %Y} – {end:%d %b %Y} (exclusive) · amounts in {currency} at historical rates ·
+generated {datetime.now():%Y-%m-%d %H:%M}</p>
+<table class="summary">
+<tr><td>💰 Income</td><td class="num">{total_income:,.2f}</td></tr>
+<tr><td>💸 Expected expenses</td><td class="num">{expected:,.2f}</td></tr>
+<tr><td>🚨 Unexpected expenses</td><td class="num">{unexpected:,.2f}</td></tr>
+<tr><td><b>⚖️ Net balance</b></td>
+<td class="num {'surplus' if balance >= 0 else 'deficit'}"><b>{balance:,.2f}</b></td></tr>
+</table>
+<div class="charts">{charts_html}</div>
+<h2>Top expenses</h2>{_top_table(expenses, currency)}
+<h2>Top income</h2>{_top_table(income, currency)}
+</body></html>
+"""
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        f.write(page)
+    os.replace(path + ".part", path)
+    return label, time.perf_counter() - started
+
+
+def _write_index(out_dir, labels):
+    items = "".join(
+        f"<li{' class=year' if len(label) == 4 else ''}><a href='{label}.html'>{label}</a></li>"
+        for label in sorted(labels)
+    )
+    with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>Statements</title>"
+                f"<style>{_STYLE} li.year {{ margin-top: .8rem; font-weight: bold; }}</style></head>"
+                f"<body><h1>Statements</h1><ul>{items}</ul></body></html>")
+
+
+# -------------------------------
+# DRIVER
+# -------------------------------
+def generate(out_dir, first=None, last=None, currency=BASE_CURRENCY, workers=None, force=False,
+             top=TOP_N, plotlyjs="embed", on_done=None):
+    """
+    Render the monthly and yearly statements between the dates `first` and
+    `last` (default: the whole ledger) into `out_dir`, `workers` at a time
+    (default: one per CPU; 1 renders in this process). Periods whose rows,
+    rates and settings are unchanged since the last run are skipped unless
+    `force`. `on_done(label, seconds)` is called as each report finishes.
+    Returns a dict of counts and timing.
+    """
+    from app.schema import list_categories
+    from app.rates import rates_table
+
+    started = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    tables = {kind: analytics.load(kind) for kind in ("expense", "income")}
+    if first is None or last is None:
+        dates = pd.concat([t["date"].to_pandas() for t in tables.values()])
+        if dates.empty:
+            return {"rendered": 0, "skipped": 0, "periods": 0, "seconds": time.perf_counter() - started}
+        first = first or min(dates).date()
+        last = last or max(dates).date()
+
+    categories = list_categories()
+    rate_table = rates_table()
+    settings = {
+        "version": REPORT_VERSION, "currency": currency, "top": top, "plotlyjs": plotlyjs,
+        "fallback": FALLBACK_RATES,
+    }
+    spans = list(periods(first, last))
+    fingerprints = _fingerprints(tables, categories, rate_table, settings, [(label, s, e) for label, _, s, e in spans])
+
+    manifest = _load_manifest(out_dir)
+    todo = [
+        (label, title, start, end, os.path.join(out_dir, f"{label}.html"))
+        for label, title, start, end in spans
+        if label in fingerprints and (
+            force or manifest.get(label) != fingerprints[label]
+            or not os.path.exists(os.path.join(out_dir, f"{label}.html"))
+        )
+    ]
+
+    if plotlyjs == "directory" and todo and not os.path.exists(os.path.join(out_dir, "plotly.min.js")):
+        from plotly.offline import get_plotlyjs
+        with open(os.path.join(out_dir, "plotly.min.js"), "w", encoding="utf-8") as f:
+            f.write(get_plotlyjs())
+
+    paths = {kind: analytics.snapshot_path(kind) for kind in tables}
+    init_args = (paths, categories, rate_table, currency, top, plotlyjs)
+
+    def done(label, seconds):
+        manifest[label] = fingerprints[label]
+        if on_done:
+            on_done(label, seconds)
+
+    workers = workers or os.cpu_count() or 1
+    try:
+        if workers <= 1 or len(todo) <= 1:
+            _init_worker(*init_args)
+            for job in todo:
+                done(*_render(*job))
+        elif todo:
+            with ProcessPoolExecutor(max_workers=min(workers, len(todo)), initializer=_init_worker,
+                                     initargs=init_args) as pool:
+                for future in as_completed([pool.submit(_render, *job) for job in todo]):
+                    done(*future.result())
+    finally:
+        # Keep what was rendered even if a later report failed
+        _save_manifest(out_dir, manifest)
+
+    # The index lists every statement rendered so far, not just this range
+    _write_index(out_dir, [label for label in manifest
+                           if os.path.exists(os.path.join(out_dir, f"{label}.html"))])
+    return {
+        "rendered": len(todo),
+        "skipped": len(fingerprints) - len(todo),
+        "periods": len(fingerprints),
+        "seconds": time.perf_counter() - started,
+    }
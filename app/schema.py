@@ -1,173 +1,345 @@
-import sqlite3
 from datetime import date
-import pandas as pd
 import json
-import os
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "budget.db")
+from app.connection import DB_PATH, connection, data_version
+from app.writer import write
+from app.cache import cached
+from app.migrations import migrate, fill_monthly_totals, fill_search_index
+from app.currency import BASE_CURRENCY, exponent, to_minor, from_minor, minor_to_major
+
+# pandas is imported by the functions that return DataFrames, so that plain
+# reads and writes (e.g. from the CLI) start without loading it
 
 # -------------------------------
 # DATABASE INITIALIZATION
 # -------------------------------
 def init_db():
-    """Initialize the database and create all required tables."""
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.cursor()
-
-        # Categories
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS categories (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE NOT NULL,
-                description TEXT,
-                recurrent BOOLEAN DEFAULT 0,
-                expected_monthly REAL DEFAULT 0.0
-            )
-        """)
-
-        # Subcategories
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS subcategories (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                category_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                description TEXT,
-                labels TEXT,
-                FOREIGN KEY(category_id) REFERENCES categories(id)
-            )
-        """)
-
-        # Expenses — added 'currency'
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS expenses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL,
-                amount REAL NOT NULL,
-                category_id INTEGER,
-                subcategory_id INTEGER,
-                description TEXT,
-                expected BOOLEAN DEFAULT 0,
-                currency TEXT DEFAULT 'EUR',
-                FOREIGN KEY(category_id) REFERENCES categories(id),
-                FOREIGN KEY(subcategory_id) REFERENCES subcategories(id)
-            )
-        """)
-
-        # Income — added 'currency'
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS income (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL,
-                amount REAL NOT NULL,
-                category_id INTEGER,
-                subcategory_id INTEGER,
-                description TEXT,
-                currency TEXT DEFAULT 'EUR',
-                FOREIGN KEY(category_id) REFERENCES categories(id),
-                FOREIGN KEY(subcategory_id) REFERENCES subcategories(id)
-            )
-        """)
+    """
+    Bring the database up to the latest schema version. Migrations run at
+    most once per process, so calling this on every rerun costs no DDL.
+    """
+    return migrate()
+
+
+# -------------------------------
+# MONTHLY AGGREGATES
+# -------------------------------
+def rebuild_monthly_totals():
+    """Recompute monthly_totals from scratch (e.g. after editing the DB by hand)."""
+    write(lambda conn: fill_monthly_totals(conn.cursor()))
+
+@cached
+def monthly_summary(years=None, months=None, kind="expense"):
+    """
+    Aggregated totals per month, category, subcategory, currency and expected
+    flag for the given period, read from monthly_totals. Sums are exact
+    integer minor units in SQL; `total` is converted to major units here.
+    """
+    import pandas as pd
+
+    clause, params = _month_clause(years, months)
+    with connection() as conn:
+        df = pd.read_sql_query(f"""
+            SELECT m.year, m.month, c.name AS category, s.name AS subcategory,
+                   m.currency, m.expected, m.total, m.count
+            FROM monthly_totals m
+            LEFT JOIN categories c ON m.category_id = c.id
+            LEFT JOIN subcategories s ON m.subcategory_id = s.id
+            WHERE m.kind = ? AND {clause}
+            ORDER BY m.year, m.month
+        """, conn, params=[kind] + params, dtype={"total": "int64"})
+    df["total"] = minor_to_major(df["total"], df["currency"])
+    return df
+
+# Expenses in this category count as unexpected; everything else as expected
+EMERGENCY_CATEGORY = "unexpected / emergencies"
+
+@cached
+def period_summary(years=None, months=None, currency=None, by_month=False):
+    """
+    Income, expected and unexpected spend and net balance for the period,
+    one row per currency (per month too with `by_month`), optionally for a
+    single `currency`. One aggregate query over monthly_totals, so the cost
+    depends on the number of months, not on the number of transactions.
+    Amounts are in major units of each row's currency.
+    """
+    import pandas as pd
+
+    clause, params = _month_clause(years, months)
+    if currency is not None:
+        clause += " AND m.currency = ?"
+        params.append(currency)
+    keys = "m.year, m.month, m.currency" if by_month else "m.currency"
+    unexpected = "LOWER(TRIM(IFNULL(c.name, ''))) = ?"
+    with connection() as conn:
+        df = pd.read_sql_query(f"""
+            SELECT {keys},
+                   SUM(CASE WHEN m.kind = 'income' THEN m.total ELSE 0 END) AS income,
+                   SUM(CASE WHEN m.kind = 'expense' AND NOT {unexpected} THEN m.total ELSE 0 END) AS expected,
+                   SUM(CASE WHEN m.kind = 'expense' AND {unexpected} THEN m.total ELSE 0 END) AS unexpected,
+                   SUM(CASE WHEN m.kind = 'income' THEN m.total ELSE -m.total END) AS net
+            FROM monthly_totals m
+            LEFT JOIN categories c ON m.category_id = c.id
+            WHERE {clause}
+            GROUP BY {keys}
+            ORDER BY {keys}
+        """, conn, params=[EMERGENCY_CATEGORY, EMERGENCY_CATEGORY] + params,
+            dtype={"income": "int64", "expected": "int64", "unexpected": "int64", "net": "int64"})
+    for column in ("income", "expected", "unexpected", "net"):
+        df[column] = minor_to_major(df[column], df["currency"])
+    return df
 
-        conn.commit()
+def _month_index(iso_date):
+    return int(iso_date[:4]) * 12 + int(iso_date[5:7]) - 1
+
+def _month_clause(years=None, months=None):
+    """WHERE clause (and parameters) restricting monthly_totals `m` to the period."""
+    ranges = period_ranges(years, months)
+    if ranges is None:
+        return "1", []
+    if not ranges:
+        return "0", []
+    month_index = "(m.year * 12 + m.month - 1)"
+    clauses = [f"({month_index} >= ? AND {month_index} < ?)" for _ in ranges]
+    params = [v for start, end in ranges for v in (_month_index(start), _month_index(end))]
+    return f"({' OR '.join(clauses)})", params
+
+
+# -------------------------------
+# PERIOD HELPERS
+# -------------------------------
+def _as_list(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, str)):
+        return [int(value)]
+    return sorted({int(v) for v in value})
+
+def period_ranges(years=None, months=None):
+    """
+    Turn a set of years and months into half-open ISO date ranges
+    [(start, end), ...], merging consecutive months so that e.g. five
+    full years become a single range. Returns None when unfiltered (no
+    years); months=None means all twelve, while an empty list of years or
+    months selects nothing.
+    """
+    years = _as_list(years)
+    if years is None:
+        return None
+    months = _as_list(months)
+    if months is None:
+        months = list(range(1, 13))
+    indices = sorted(y * 12 + m - 1 for y in years for m in months)
+
+    ranges = []
+    for idx in indices:
+        if ranges and ranges[-1][1] == idx:
+            ranges[-1][1] = idx + 1
+        else:
+            ranges.append([idx, idx + 1])
+
+    def iso(i):
+        return f"{i // 12:04d}-{i % 12 + 1:02d}-01"
+
+    return [(iso(start), iso(end)) for start, end in ranges]
+
+def _iso(value):
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+def _major(row):
+    """Row dict with its integer minor-unit amount converted back to major units."""
+    d = dict(row)
+    d["amount"] = from_minor(d["amount"], d["currency"])
+    return d
+
+def _period_clause(column, years=None, months=None):
+    """SQL condition and params restricting a date column to the given period."""
+    ranges = period_ranges(years, months)
+    if ranges is None:
+        return "1", []
+    if not ranges:
+        return "0", []
+    clause = " OR ".join(f"({column} >= ? AND {column} < ?)" for _ in ranges)
+    return f"({clause})", [bound for r in ranges for bound in r]
 
 
 # -------------------------------
 # CATEGORY FUNCTIONS
 # -------------------------------
+_category_cache = {}
+# Bumped whenever the category tree changes, so derived structures can rebuild
+categories_version = 0
+
+def categories_token():
+    """
+    Changes whenever the category tree may have: on any commit, from this
+    process or another (PRAGMA data_version), and on category writes in
+    this process, which may not be committed yet (e.g. inside a batch).
+    """
+    return data_version(), categories_version
+
 def create_category(name, description="", recurrent=False, expected_monthly=0.0):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            "INSERT INTO categories (name, description, recurrent, expected_monthly) VALUES (?, ?, ?, ?)",
-            (name, description, recurrent, expected_monthly)
-        )
-        conn.commit()
+    write(lambda conn: conn.execute(
+        "INSERT INTO categories (name, description, recurrent, expected_monthly) VALUES (?, ?, ?, ?)",
+        (name, description, recurrent, expected_monthly)
+    ))
+    invalidate_categories()
 
 def update_category(category_id, name, description, recurrent, expected_monthly):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("""
-            UPDATE categories 
-            SET name=?, description=?, recurrent=?, expected_monthly=? 
-            WHERE id=?
-        """, (name, description, recurrent, expected_monthly, category_id))
-        conn.commit()
+    write(lambda conn: conn.execute("""
+        UPDATE categories 
+        SET name=?, description=?, recurrent=?, expected_monthly=? 
+        WHERE id=?
+    """, (name, description, recurrent, expected_monthly, category_id)))
+    invalidate_categories()
 
 def delete_category(category_id):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("DELETE FROM subcategories WHERE category_id=?", (category_id,))
-        conn.execute("DELETE FROM categories WHERE id=?", (category_id,))
-        conn.commit()
+    write(lambda conn: remove_category(conn, category_id))
+    invalidate_categories()
+
+def remove_category(conn, category_id):
+    """Delete a category with its subcategories and budgets on `conn` (inside a write)."""
+    # foreign_keys=ON: detach transactions before removing what they point to
+    for table in ("expenses", "income"):
+        conn.execute(f"UPDATE {table} SET category_id=NULL, subcategory_id=NULL WHERE category_id=?", (category_id,))
+    conn.execute("DELETE FROM subcategories WHERE category_id=?", (category_id,))
+    conn.execute("DELETE FROM monthly_budgets WHERE category_id=?", (category_id,))
+    conn.execute("DELETE FROM categories WHERE id=?", (category_id,))
 
 def list_categories():
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        cats = conn.execute("SELECT * FROM categories").fetchall()
-
-        result = []
-        for c in cats:
-            subs = conn.execute("SELECT * FROM subcategories WHERE category_id=?", (c["id"],)).fetchall()
-            result.append({
-                "id": c["id"],
-                "name": c["name"],
-                "description": c["description"],
-                "recurrent": bool(c["recurrent"]),
-                "expected_monthly": c["expected_monthly"],
-                "subcategories": [dict(s) for s in subs]
+    """
+    Category tree (categories with their subcategories), loaded with a single
+    join and cached per database until categories_token() moves. The
+    returned list is shared: treat it as read-only.
+    """
+    token = categories_token()
+    cached = _category_cache.get(DB_PATH)
+    if cached is not None and cached[0] == token:
+        return cached[1]
+
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT c.id, c.name, c.description, c.recurrent, c.expected_monthly,
+                   s.id AS sub_id, s.category_id AS sub_category_id, s.name AS sub_name,
+                   s.description AS sub_description, s.labels AS sub_labels
+            FROM categories c
+            LEFT JOIN subcategories s ON s.category_id = c.id
+            ORDER BY c.id, s.id
+        """).fetchall()
+
+    result = []
+    by_id = {}
+    for r in rows:
+        cat = by_id.get(r["id"])
+        if cat is None:
+            cat = by_id[r["id"]] = {
+                "id": r["id"],
+                "name": r["name"],
+                "description": r["description"],
+                "recurrent": bool(r["recurrent"]),
+                "expected_monthly": r["expected_monthly"],
+                "subcategories": []
+            }
+            result.append(cat)
+        if r["sub_id"] is not None:
+            cat["subcategories"].append({
+                "id": r["sub_id"],
+                "category_id": r["sub_category_id"],
+                "name": r["sub_name"],
+                "description": r["sub_description"],
+                "labels": r["sub_labels"],
             })
-        return result
+
+    _category_cache[DB_PATH] = (token, result)
+    return result
+
+def get_category_by_name(name):
+    """Category dict (from the cached tree) whose name matches, or None."""
+    key = name.strip().lower()
+    return next((c for c in list_categories() if c["name"].strip().lower() == key), None)
+
+def invalidate_categories():
+    """Drop the cached category tree; called by every category/subcategory writer."""
+    global categories_version
+    _category_cache.clear()
+    categories_version += 1
 
 # -------------------------------
 # SUBCATEGORY FUNCTIONS
 # -------------------------------
 def create_subcategory(category_id, name, description="", labels=None):
     labels_json = json.dumps(labels or [])
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("""
-            INSERT INTO subcategories (category_id, name, description, labels)
-            VALUES (?, ?, ?, ?)
-        """, (category_id, name, description, labels_json))
-        conn.commit()
+    write(lambda conn: conn.execute("""
+        INSERT INTO subcategories (category_id, name, description, labels)
+        VALUES (?, ?, ?, ?)
+    """, (category_id, name, description, labels_json)))
+    invalidate_categories()
 
-def update_subcategory(subcategory_id, name, description):
-    with sqlite3.connect(DB_PATH) as conn:
+def update_subcategory(subcategory_id, name, description, labels=None):
+    def apply(conn):
         conn.execute("""
             UPDATE subcategories SET name=?, description=? WHERE id=?
         """, (name, description, subcategory_id))
-        conn.commit()
+        if labels is not None:
+            conn.execute("UPDATE subcategories SET labels=? WHERE id=?", (json.dumps(labels), subcategory_id))
+    write(apply)
+    invalidate_categories()
 
 def delete_subcategory(subcategory_id):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("DELETE FROM subcategories WHERE id=?", (subcategory_id,))
-        conn.commit()
+    write(lambda conn: remove_subcategory(conn, subcategory_id))
+    invalidate_categories()
+
+def remove_subcategory(conn, subcategory_id):
+    """Delete a subcategory on `conn` (inside a write), detaching its transactions."""
+    for table in ("expenses", "income"):
+        conn.execute(f"UPDATE {table} SET subcategory_id=NULL WHERE subcategory_id=?", (subcategory_id,))
+    conn.execute("DELETE FROM subcategories WHERE id=?", (subcategory_id,))
 
 # -------------------------------
 # EXPENSE FUNCTIONS
 # -------------------------------
 def add_expense(exp_date, amount, category_id, subcategory_id, description, expected=False, currency="EUR"):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("""
-            INSERT INTO expenses (date, amount, category_id, subcategory_id, description, expected, currency)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (exp_date.isoformat(), amount, category_id, subcategory_id, description, expected, currency))
-        conn.commit()
+    row = (exp_date.isoformat(), to_minor(amount, currency), category_id, subcategory_id, description, expected, currency)
+    write(lambda conn: conn.execute("""
+        INSERT INTO expenses (date, amount, category_id, subcategory_id, description, expected, currency)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, row))
 
 
 def update_expense(expense_id, exp_date, amount, category_id, subcategory_id, description, expected, currency="EUR"):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("""
+    update_expenses([(expense_id, exp_date, amount, category_id, subcategory_id, description, expected, currency)])
+
+def update_expenses(rows):
+    """
+    Apply many edits in one transaction (amounts in major units). Each row is
+    (expense_id, date, amount, category_id, subcategory_id, description, expected, currency).
+    """
+    save_expense_edits(rows, [])
+
+def delete_expense(expense_id):
+    delete_expenses([expense_id])
+
+def delete_expenses(expense_ids):
+    save_expense_edits([], expense_ids)
+
+def save_expense_edits(updates, deletes):
+    """Apply edits (rows as in update_expenses) and deletions by id in one transaction."""
+    params = [(_iso(d), to_minor(amount, cur), cat, sub, desc, bool(exp), cur, int(eid))
+              for eid, d, amount, cat, sub, desc, exp, cur in updates]
+    ids = [(int(i),) for i in deletes]
+
+    def apply(conn):
+        conn.executemany("""
             UPDATE expenses 
             SET date=?, amount=?, category_id=?, subcategory_id=?, description=?, expected=?, currency=?
             WHERE id=?
-        """, (exp_date.isoformat(), amount, category_id, subcategory_id, description, expected, currency, expense_id))
-        conn.commit()
-
-def delete_expense(expense_id):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("DELETE FROM expenses WHERE id=?", (expense_id,))
-        conn.commit()
+        """, params)
+        conn.executemany("DELETE FROM expenses WHERE id=?", ids)
+    write(apply)
 
+@cached
 def list_recent_expenses(limit=20):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
+    with connection() as conn:
         rows = conn.execute("""
             SELECT e.id, e.date, e.amount, e.currency, c.name as category, s.name as subcategory, e.description, e.expected
             FROM expenses e
@@ -176,57 +348,95 @@ def list_recent_expenses(limit=20):
             ORDER BY e.date DESC
             LIMIT ?
         """, (limit,)).fetchall()
-        return [dict(r) for r in rows]
+        return [_major(r) for r in rows]
 
-def expenses_frame(year=None, month=None):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        query = """
-            SELECT e.date, e.amount, c.name as category, s.name as subcategory, e.description, e.expected
+@cached
+def expenses_page(after=None, limit=50, date_from=None, date_to=None, category_id=None):
+    """
+    One page of expenses ordered by (date, id), newest first. Pass the
+    (date, id) of the last row of the previous page as `after` to get the
+    next one; the cost stays the same however deep the page is.
+    """
+    return _page("expenses", ", t.expected", after, limit, date_from, date_to, category_id)
+
+@cached
+def expenses_frame(years=None, months=None, snapshot=False):
+    """
+    Expenses for any combination of years and months (ints or iterables),
+    fetched in one indexed range scan. Months only apply together with years.
+    With `snapshot=True` rows come from the columnar analytics snapshot
+    (typed datetime64 dates) instead of SQLite.
+    """
+    import pandas as pd
+
+    if snapshot:
+        from app.analytics import frame
+        return frame("expense", years, months)
+    where, params = _period_clause("e.date", years, months)
+    with connection() as conn:
+        query = f"""
+            SELECT e.date, e.amount, e.currency, c.name as category, s.name as subcategory, e.description, e.expected
             FROM expenses e
             LEFT JOIN categories c ON e.category_id = c.id
             LEFT JOIN subcategories s ON e.subcategory_id = s.id
+            WHERE {where}
+            ORDER BY e.date
         """
-        params = []
-        if year and month:
-            query += " WHERE strftime('%Y', e.date)=? AND strftime('%m', e.date)=?"
-            params = [str(year), f"{month:02d}"]
-        elif year:
-            query += " WHERE strftime('%Y', e.date)=?"
-            params = [str(year)]
-
         df = pd.read_sql_query(query, conn, params=params)
+        df["amount"] = minor_to_major(df["amount"], df["currency"])
         return df
 
 # -------------------------------
 # INCOME FUNCTIONS
 # -------------------------------
 def add_income(inc_date, amount, category_id, subcategory_id, description, currency="EUR"):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("""
-            INSERT INTO income (date, amount, category_id, subcategory_id, description, currency)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (inc_date.isoformat(), amount, category_id, subcategory_id, description, currency))
-        conn.commit()
+    row = (inc_date.isoformat(), to_minor(amount, currency), category_id, subcategory_id, description, currency)
+    write(lambda conn: conn.execute("""
+        INSERT INTO income (date, amount, category_id, subcategory_id, description, currency)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, row))
 
 
 def update_income(income_id, inc_date, amount, category_id, subcategory_id, description, currency="EUR"):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("""
+    update_incomes([(income_id, inc_date, amount, category_id, subcategory_id, description, currency)])
+
+def update_incomes(rows):
+    """
+    Apply many edits in one transaction (amounts in major units). Each row is
+    (income_id, date, amount, category_id, subcategory_id, description, currency).
+    """
+    save_income_edits(rows, [])
+
+def delete_income(income_id):
+    delete_incomes([income_id])
+
+def delete_incomes(income_ids):
+    save_income_edits([], income_ids)
+
+def save_income_edits(updates, deletes):
+    """Apply edits (rows as in update_incomes) and deletions by id in one transaction."""
+    params = [(_iso(d), to_minor(amount, cur), cat, sub, desc, cur, int(iid))
+              for iid, d, amount, cat, sub, desc, cur in updates]
+    ids = [(int(i),) for i in deletes]
+
+    def apply(conn):
+        conn.executemany("""
             UPDATE income 
             SET date=?, amount=?, category_id=?, subcategory_id=?, description=?, currency=? 
             WHERE id=?
-        """, (inc_date.isoformat(), amount, category_id, subcategory_id, description, currency, income_id))
-        conn.commit()
-
-def delete_income(income_id):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("DELETE FROM income WHERE id=?", (income_id,))
-        conn.commit()
+        """, params)
+        conn.executemany("DELETE FROM income WHERE id=?", ids)
+    write(apply)
 
-def list_incomes(limit=20):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
+@cached
+def list_incomes(limit=20, snapshot=False):
+    if snapshot:
+        from app.analytics import frame
+        df = frame("income").sort_values(["date", "id"], ascending=False).head(limit)
+        df["date"] = df["date"].dt.strftime("%Y-%m-%d")
+        df = df.astype(object)
+        return df.where(df.notna(), None).to_dict("records")
+    with connection() as conn:
         rows = conn.execute("""
             SELECT i.id, i.date, i.amount, i.currency, c.name as category, s.name as subcategory, i.description
             FROM income i
@@ -235,5 +445,342 @@ def list_incomes(limit=20):
             ORDER BY i.date DESC
             LIMIT ?
         """, (limit,)).fetchall()
-        return [dict(r) for r in rows]
+        return [_major(r) for r in rows]
+
+@cached
+def incomes_page(after=None, limit=50, date_from=None, date_to=None, category_id=None):
+    """Keyset-paginated income, newest first; see expenses_page."""
+    return _page("income", "", after, limit, date_from, date_to, category_id)
+
+# -------------------------------
+# KEYSET PAGINATION
+# -------------------------------
+def _page(table, extra_columns, after, limit, date_from, date_to, category_id):
+    where, params = [], []
+    if after is not None:
+        where.append("(t.date, t.id) < (?, ?)")
+        params += [_iso(after[0]), int(after[1])]
+    if date_from is not None:
+        where.append("t.date >= ?")
+        params.append(_iso(date_from))
+    if date_to is not None:
+        where.append("t.date <= ?")
+        params.append(_iso(date_to))
+    if category_id is not None:
+        where.append("t.category_id = ?")
+        params.append(category_id)
+
+    with connection() as conn:
+        rows = conn.execute(f"""
+            SELECT t.id, t.date, t.amount, t.currency, t.category_id, t.subcategory_id,
+                   c.name as category, s.name as subcategory, t.description{extra_columns}
+            FROM {table} t
+            LEFT JOIN categories c ON t.category_id = c.id
+            LEFT JOIN subcategories s ON t.subcategory_id = s.id
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY t.date DESC, t.id DESC
+            LIMIT ?
+        """, params + [limit]).fetchall()
+        return [_major(r) for r in rows]
+
+
+# -------------------------------
+# BUDGETS
+# -------------------------------
+def set_budget(year, month, category_id, amount):
+    """Budget `category_id` at `amount` (base currency) for one month; None removes the override."""
+    if amount is None:
+        write(lambda conn: conn.execute("DELETE FROM monthly_budgets WHERE category_id=? AND year=? AND month=?",
+                                        (category_id, year, month)))
+    else:
+        write(lambda conn: conn.execute("""
+            INSERT INTO monthly_budgets (year, month, category_id, expected_amount) VALUES (?, ?, ?, ?)
+            ON CONFLICT (category_id, year, month) DO UPDATE SET expected_amount = excluded.expected_amount
+        """, (year, month, category_id, to_minor(amount, BASE_CURRENCY))))
+
+def _month_ranges(years=None, months=None):
+    """period_ranges as half-open month-index ranges; None means every month with data."""
+    ranges = period_ranges(years, months)
+    if ranges is None:
+        with connection() as conn:
+            lo, hi = conn.execute("SELECT MIN(year * 12 + month - 1), MAX(year * 12 + month) FROM monthly_totals").fetchone()
+        today = date.today()
+        return [(lo, hi)] if lo is not None else [(today.year * 12 + today.month - 1,) * 2]
+    return [(_month_index(start), _month_index(end)) for start, end in ranges]
+
+def _budget_query(ranges, with_actuals):
+    """
+    SQL and parameters for budget (and actual) minor-unit totals per month
+    index, category and currency over the given month-index ranges.
+    Months come from a recursive CTE crossed with categories, so any
+    horizon is one statement.
+    """
+    in_range = " OR ".join("(idx >= ? AND idx < ?)" for _ in ranges) or "0"
+    bounds = [v for r in ranges for v in r]
+    expected = f"CAST(ROUND(c.expected_monthly * {10 ** exponent(BASE_CURRENCY)}) AS INTEGER)"
+    sql = f"""
+        WITH RECURSIVE months(idx) AS (
+            SELECT ? UNION ALL SELECT idx + 1 FROM months WHERE idx + 1 < ?
+        ),
+        budget AS (
+            SELECT m.idx, c.id AS category_id,
+                   COALESCE(b.expected_amount, CASE WHEN c.recurrent AND c.id NOT IN (
+                       -- recurrent income categories (e.g. salary) are not spending
+                       -- budgets; a category with any expense still is one
+                       SELECT category_id FROM monthly_totals WHERE kind = 'income'
+                       EXCEPT SELECT category_id FROM monthly_totals WHERE kind = 'expense'
+                   ) THEN {expected} ELSE 0 END) AS amount
+            FROM months m
+            CROSS JOIN categories c
+            LEFT JOIN monthly_budgets b
+                ON b.category_id = c.id AND b.year = m.idx / 12 AND b.month = m.idx % 12 + 1
+            WHERE {in_range}
+        )
+        SELECT idx, category_id, '{BASE_CURRENCY}' AS currency, amount AS budget, 0 AS actual
+        FROM budget WHERE amount != 0
+    """
+    params = [min(r[0] for r in ranges), max(r[1] for r in ranges)] + bounds
+    if with_actuals:
+        sql += f"""
+        UNION ALL
+        SELECT idx, NULLIF(category_id, 0), currency, 0, total
+        FROM (SELECT year * 12 + month - 1 AS idx, category_id, currency, total
+              FROM monthly_totals WHERE kind = 'expense')
+        WHERE {in_range}
+        """
+        params += bounds
+    return sql, params
+
+@cached
+def budget_vs_actual(years=None, months=None):
+    """
+    Budget against actual spend per (year, month, category, currency) in one
+    grouped query: budgets from monthly_budgets overrides or recurrent
+    categories' expected_monthly (base currency), actuals from monthly_totals.
+    Amounts are returned in major units; convert per row currency.
+    """
+    import pandas as pd
+
+    ranges = [r for r in _month_ranges(years, months) if r[0] < r[1]]
+    if not ranges:
+        return pd.DataFrame(columns=["year", "month", "category_id", "category", "currency", "budget", "actual"])
+    sql, params = _budget_query(ranges, with_actuals=True)
+    with connection() as conn:
+        df = pd.read_sql_query(f"""
+            SELECT g.idx / 12 AS year, g.idx % 12 + 1 AS month, g.category_id, c.name AS category,
+                   g.currency, SUM(g.budget) AS budget, SUM(g.actual) AS actual
+            FROM ({sql}) g
+            LEFT JOIN categories c ON c.id = g.category_id
+            GROUP BY g.idx, g.category_id, g.currency
+            ORDER BY g.idx, c.name
+        """, conn, params=params, dtype={"budget": "int64", "actual": "int64"})
+    df["budget"] = minor_to_major(df["budget"], df["currency"])
+    df["actual"] = minor_to_major(df["actual"], df["currency"])
+    return df
+
+def budget_projection(months_ahead=12, start=None):
+    """
+    Expected recurring spend per (year, month, category) in the base
+    currency for `months_ahead` months from `start` (default: this month).
+    """
+    import pandas as pd
+
+    start = start or date.today()
+    first = start.year * 12 + start.month - 1
+    sql, params = _budget_query([(first, first + max(int(months_ahead), 1))], with_actuals=False)
+    with connection() as conn:
+        df = pd.read_sql_query(f"""
+            SELECT g.idx / 12 AS year, g.idx % 12 + 1 AS month, g.category_id, c.name AS category,
+                   g.currency, g.budget
+            FROM ({sql}) g
+            LEFT JOIN categories c ON c.id = g.category_id
+            ORDER BY g.idx, c.name
+        """, conn, params=params, dtype={"budget": "int64"})
+    df["budget"] = minor_to_major(df["budget"], df["currency"])
+    return df
+
+# -------------------------------
+# TRENDS
+# -------------------------------
+# Period start for each granularity; weeks start on Monday
+_TREND_BUCKETS = {
+    "day": "t.date",
+    "week": "date(t.date, '-6 days', 'weekday 1')",
+}
+
+@cached
+def trend_totals(freq="month", date_from=None, date_to=None, snapshot=False):
+    """
+    Expense and income totals per period start, kind, category and currency
+    between two inclusive dates. `freq` is "day", "week" or "month"; months
+    come from monthly_totals, days and weeks from a date-range scan of the
+    ledgers grouped in SQL (or on the Arrow snapshots with `snapshot`).
+    Amounts are in major units.
+    """
+    import pandas as pd
+
+    if freq == "month":
+        df = _monthly_trend(date_from, date_to)
+    elif freq in _TREND_BUCKETS and snapshot:
+        from app.analytics import period_totals
+        parts = [
+            period_totals(kind, freq, date_from, date_to).assign(kind=kind)
+            for kind in ("expense", "income")
+        ]
+        df = pd.concat(parts, ignore_index=True)
+        names = {c["id"]: c["name"] for c in list_categories()}
+        df["category"] = df["category_id"].map(names)
+        df = df.sort_values("period", kind="stable")[["period", "kind", "category_id", "category", "currency", "total"]]
+    elif freq in _TREND_BUCKETS:
+        df = _ledger_trend(freq, date_from, date_to)
+    else:
+        raise ValueError(f"Unknown trend frequency: {freq!r}")
+
+    df["period"] = pd.to_datetime(df["period"]).astype("datetime64[ns]")
+    df["category_id"] = df["category_id"].astype("Int64")
+    df["total"] = minor_to_major(df["total"].astype("int64"), df["currency"])
+    return df.reset_index(drop=True)
+
+def _trend_query(query, params):
+    import pandas as pd
+
+    with connection() as conn:
+        return pd.read_sql_query(f"""
+            SELECT b.period, b.kind, b.category_id, c.name AS category, b.currency, b.total
+            FROM ({query}) b
+            LEFT JOIN categories c ON c.id = b.category_id
+            ORDER BY b.period
+        """, conn, params=params, dtype={"total": "int64"})
+
+def _monthly_trend(date_from, date_to):
+    where, params = ["1"], []
+    if date_from is not None:
+        where.append("m.year * 12 + m.month - 1 >= ?")
+        params.append(_month_index(_iso(date_from)))
+    if date_to is not None:
+        where.append("m.year * 12 + m.month - 1 <= ?")
+        params.append(_month_index(_iso(date_to)))
+    return _trend_query(f"""
+        SELECT printf('%04d-%02d-01', m.year, m.month) AS period, m.kind,
+               NULLIF(m.category_id, 0) AS category_id, m.currency, SUM(m.total) AS total
+        FROM monthly_totals m
+        WHERE {" AND ".join(where)}
+        GROUP BY m.year, m.month, m.kind, m.category_id, m.currency
+    """, params)
+
+def _ledger_trend(freq, date_from, date_to):
+    where, params = ["1"], []
+    if date_from is not None:
+        where.append("t.date >= ?")
+        params.append(_iso(date_from))
+    if date_to is not None:
+        where.append("t.date <= ?")
+        params.append(_iso(date_to))
+    selects = [
+        f"""
+        SELECT {_TREND_BUCKETS[freq]} AS period, '{kind}' AS kind, t.category_id,
+               IFNULL(t.currency, '{BASE_CURRENCY}') AS currency, SUM(t.amount) AS total
+        FROM {table} t
+        WHERE {" AND ".join(where)}
+        GROUP BY 1, 3, 4
+        """
+        for kind, table in (("expense", "expenses"), ("income", "income"))
+    ]
+    return _trend_query(" UNION ALL ".join(selects), params * 2)
+
+# -------------------------------
+# AUTO-CATEGORIZATION
+# -------------------------------
+def classify_descriptions(descriptions):
+    """(category_id, subcategory_id) or None per description, from the subcategory labels."""
+    from app.classifier import matcher
+    return matcher().classify_many(descriptions)
+
+def auto_categorize(kind="expense", only_uncategorized=True):
+    """
+    Assign category and subcategory to `kind` rows whose description
+    contains a subcategory label, in one transaction. By default only rows
+    without a category are touched. Returns the number of rows updated.
+    """
+    table = {"expense": "expenses", "income": "income"}[kind]
+    where = "WHERE category_id IS NULL" if only_uncategorized else ""
+    def apply(conn):
+        rows = conn.execute(f"SELECT id, description, category_id, subcategory_id FROM {table} {where}").fetchall()
+        updates = [
+            (target[0], target[1], r["id"])
+            for r, target in zip(rows, classify_descriptions(r["description"] for r in rows))
+            if target is not None and target != (r["category_id"], r["subcategory_id"])
+        ]
+        conn.executemany(f"UPDATE {table} SET category_id=?, subcategory_id=? WHERE id=?", updates)
+        return len(updates)
+    return write(apply)
+
+# -------------------------------
+# SEARCH
+# -------------------------------
+# Matches are ranked among the SEARCH_WINDOW most recent ones, so a common
+# word costs the same as a rare one however large the ledger grows
+SEARCH_WINDOW = 1000
+
+def _match_expression(text):
+    """User input -> FTS5 query: every word must match, as a prefix."""
+    return " ".join(f'"{t}"*' for t in text.replace('"', " ").split())
+
+@cached
+def search_transactions(text, kind=None, limit=20, offset=0, date_from=None, date_to=None):
+    """
+    Expenses and income whose description, category or subcategory match
+    every word of `text` (as prefixes, accent-insensitive), best matches
+    first. `kind` restricts to "expense" or "income"; page with
+    `limit`/`offset`. Only the SEARCH_WINDOW most recent matches are ranked
+    and paged: narrow `date_from`/`date_to` to reach older ones. Each hit
+    carries its kind, id and a bm25 `score` (lower is better).
+    """
+    match = _match_expression(text or "")
+    if not match:
+        return []
+    where, params = ["search_index MATCH ?"], [match]
+    if kind is not None:
+        where.append("kind = ?")
+        params.append(kind)
+    if date_from is not None:
+        where.append("date >= ?")
+        params.append(_iso(date_from))
+    if date_to is not None:
+        where.append("date <= ?")
+        params.append(_iso(date_to))
+
+    with connection() as conn:
+        rows = conn.execute(f"""
+            WITH recent AS (
+                SELECT rowid, kind, rank
+                FROM search_index
+                WHERE {" AND ".join(where)}
+                ORDER BY rowid DESC
+                LIMIT {SEARCH_WINDOW}
+            ), hits AS (
+                SELECT * FROM recent ORDER BY rank LIMIT ? OFFSET ?
+            )
+            SELECT h.kind, h.rowid >> 1 AS id,
+                   COALESCE(e.date, i.date) AS date,
+                   COALESCE(e.amount, i.amount) AS amount,
+                   COALESCE(e.currency, i.currency) AS currency,
+                   c.name AS category, s.name AS subcategory,
+                   COALESCE(e.description, i.description) AS description,
+                   e.expected, h.rank AS score
+            FROM hits h
+            LEFT JOIN expenses e ON h.kind = 'expense' AND e.id = h.rowid >> 1
+            LEFT JOIN income i ON h.kind = 'income' AND i.id = h.rowid >> 1
+            LEFT JOIN categories c ON c.id = COALESCE(e.category_id, i.category_id)
+            LEFT JOIN subcategories s ON s.id = COALESCE(e.subcategory_id, i.subcategory_id)
+            ORDER BY h.rank
+        """, params + [limit, offset]).fetchall()
+        return [_major(r) for r in rows]
+
+def rebuild_search_index():
+    """Recompute search_index from scratch (e.g. after editing the DB by hand)."""
+    write(lambda conn: fill_search_index(conn.cursor()))
+
 
+if __name__ == "__main__":
+    print(f"Database at schema version {init_db()}: {DB_PATH}")
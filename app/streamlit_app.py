@@ -3,85 +3,385 @@ import pandas as pd
 import plotly.express as px
 from datetime import date
 import calendar
-import requests
 import os
-import shutil
+import tempfile
 
 from app.schema import (
     init_db, list_categories, create_category, update_category, delete_category,
     create_subcategory, update_subcategory, delete_subcategory,
-    add_expense, add_income, delete_expense, delete_income,
-    expenses_frame, list_recent_expenses, list_incomes, update_expense, update_income
+    add_expense, add_income, save_expense_edits, save_income_edits,
+    expenses_frame, list_recent_expenses, list_incomes,
+    expenses_page, incomes_page, monthly_summary, search_transactions, SEARCH_WINDOW,
+    auto_categorize, budget_vs_actual, budget_projection, set_budget,
+    period_summary, trend_totals
 )
+from app.backup import start_backup_thread
+from app import instrument
+from app.instrument import section
+from app.classifier import parse_labels
+from app.export import export_csv, export_parquet
+from app.currency import BASE_CURRENCY, CURRENCIES, FALLBACK_RATES, convert_frame, convert_frame_asof
+from app.rates import latest_rates, rates_table, start_rate_refresher
+from app import charts, trends
+from app.cache import cached
 
 # -------------------------------
 # HELPER FUNCTIONS
 # -------------------------------
-def get_cats_dict():
-    cats = list_categories()
-    return {c["name"]: c["id"] for c in cats}
-
-from app.schema import DB_PATH
+@st.cache_resource
+def setup_db():
+    """Run schema migrations once per server process, not on every rerun."""
+    return init_db()
 
-def backup_db():
-    backup_path = os.path.join(os.path.dirname(DB_PATH), "budget_backup.db")
-    if os.path.exists(DB_PATH):
-        shutil.copyfile(DB_PATH, backup_path)
-        print(f"Database backed up to {backup_path}")
-    else:
-        print("No database file to backup.")
+@st.cache_resource
+def start_backups():
+    """Background, change-aware backups; started once per server process."""
+    return start_backup_thread()
 
 # -------------------------------
 # Currency utilities
 # -------------------------------
-@st.cache_data(ttl=3600)
-def fetch_rates(base="EUR", targets=["EUR", "USD", "GBP"]):
-    try:
-        url = f"https://api.exchangerate.host/latest?base={base}"
-        resp = requests.get(url, timeout=5)
-        data = resp.json()
-        rates = {cur: data["rates"].get(cur, None) for cur in targets}
-    except Exception:
-        rates = {"EUR": 1.0, "USD": 1.1, "GBP": 0.85}
-    return rates
+@st.cache_resource
+def start_rates():
+    """Refresh exchange rates in the background; pages only read the local store."""
+    return start_rate_refresher()
 
 def currency_selector():
     st.sidebar.markdown("### 💱 Currency Settings")
 
-    base = "EUR"
-    targets = ["EUR", "USD", "GBP"]
-    rates = fetch_rates(base, targets)
+    # Cached on the database generation, like every view that converts with them
+    rates = latest_rates()
+    targets = [c for c in CURRENCIES if c in rates]
 
-    display_currency = st.sidebar.selectbox("Display currency", targets, index=0)
-    st.sidebar.caption("Live rates from exchangerate.host")
+    display_currency = st.sidebar.selectbox("Display currency", targets, index=targets.index(BASE_CURRENCY))
+    historical = st.sidebar.checkbox("Convert at historical rates", value=True,
+                                     help="Use the rate in effect on each transaction's date")
+    st.sidebar.caption("Rates from exchangerate.host, refreshed in the background")
 
     st.sidebar.write("Override rates (optional):")
-    user_rate_USD = st.sidebar.number_input("EUR → USD", value=rates.get("USD", 1.1), format="%.4f")
-    user_rate_GBP = st.sidebar.number_input("EUR → GBP", value=rates.get("GBP", 0.85), format="%.4f")
+    overrides = [c for c in FALLBACK_RATES if c != BASE_CURRENCY]
+    if display_currency not in overrides and display_currency != BASE_CURRENCY:
+        overrides.append(display_currency)
+    for cur in overrides:
+        rates[cur] = st.sidebar.number_input(
+            f"{BASE_CURRENCY} → {cur}", value=float(rates.get(cur, FALLBACK_RATES.get(cur, 1.0))), format="%.4f"
+        )
+    rates[BASE_CURRENCY] = 1.0
 
-    rates["USD"] = user_rate_USD
-    rates["GBP"] = user_rate_GBP
-    rates["EUR"] = 1.0
+    return display_currency, rates, historical
 
-    return display_currency, rates
+def convert(df, fx, amount_col="amount", date_col="date"):
+    """
+    Convert to the display currency, as of each row's date when enabled.
+    `fx` is the (currency, historical, rates) tuple from the sidebar.
+    """
+    currency, historical, rate_items = fx
+    if historical:
+        return convert_frame_asof(df, currency, rates_table(), dict(rate_items),
+                                  amount_col=amount_col, date_col=date_col)
+    return convert_frame(df, currency, dict(rate_items), amount_col=amount_col)
 
-def convert_value(amount, from_currency, to_currency, rates):
-    if from_currency == to_currency:
-        return amount
-    try:
-        eur_amount = amount / rates.get(from_currency, 1.0)
-        return eur_amount * rates.get(to_currency, 1.0)
-    except Exception:
-        return amount
-
-def to_display_currency(amount, row_currency, target_currency, rates):
-    """Convert amount from row_currency to target_currency using rates dict."""
-    if row_currency == target_currency:
-        return amount
+def currency_index(currency):
+    """Position of a currency in the selectbox options (EUR when unknown)."""
+    return CURRENCIES.index(currency if currency in CURRENCIES else BASE_CURRENCY)
+
+# -------------------------------
+# Performance panel
+# -------------------------------
+def performance_panel():
+    """Finish this rerun's trace and, if requested, show it in the sidebar."""
+    trace = instrument.finish()
+    if trace is None or not st.session_state.get("perf_panel"):
+        return
+    with st.sidebar.expander("⏱ Performance", expanded=True):
+        st.caption(
+            f"Rerun {trace['seconds'] * 1000:,.1f} ms · SQL {trace['sql_seconds'] * 1000:,.1f} ms "
+            f"in {len(trace['queries'])} statements"
+        )
+        sections = pd.DataFrame(trace["sections"])
+        if not sections.empty:
+            sections["name"] = sections["depth"].map(lambda d: "· " * d) + sections["name"]
+            sections["ms"] = sections["seconds"] * 1000
+            sections["sql ms"] = sections["sql_seconds"] * 1000
+            st.dataframe(sections[["name", "ms", "sql ms", "queries"]], hide_index=True)
+        queries = pd.DataFrame(trace["queries"])
+        if not queries.empty:
+            queries["ms"] = queries["seconds"] * 1000
+            st.dataframe(
+                queries.sort_values("ms", ascending=False)[["ms", "rows", "section", "sql"]].head(20),
+                hide_index=True,
+            )
+
+# -------------------------------
+# Cached views
+# -------------------------------
+# Converted frames and figures are cached on their inputs, the conversion
+# settings and the database generation, so a rerun that changes nothing
+# (or only touches another widget) does no SQL and no pandas work.
+def _converted_label(df, fx):
+    return {
+        "amount": f"Amount ({df['currency'].iloc[0] if 'currency' in df else 'EUR'})",
+        "Converted amount": f"Converted amount ({fx[0]})",
+    }
+
+@cached
+def recent_view(kind, fx):
+    df = pd.DataFrame(list_recent_expenses(limit=10) if kind == "expense" else list_incomes(limit=10))
+    if df.empty:
+        return df
+    df["Converted amount"] = convert(df, fx)
+    return df.rename(columns=_converted_label(df, fx))
+
+@cached
+def overview_view(years, months, fx):
+    df = expenses_frame(years, months, snapshot=True)
+    if df.empty:
+        return df
+    df["Converted amount"] = convert(df, fx)
+    return df.rename(columns=_converted_label(df, fx))
+
+@cached
+def category_pie(years, months, fx):
+    # Charts and totals come from the monthly aggregates, not the raw rows
+    totals = monthly_summary(years, months)
+    # Monthly totals are converted at the mid-month rate
+    totals["date"] = pd.to_datetime(totals[["year", "month"]].assign(day=15))
+    totals["converted"] = convert(totals, fx, amount_col="total")
+    return charts.category_pie(charts.spend_by_category(totals), fx[0])
+
+@cached
+def income_vs_expenses(years, months, fx):
+    """((income, expected, unexpected) totals, stacked bar figure) for the period."""
+    # A handful of per-currency totals (per month for historical rates) to convert
+    period = period_summary(years, months, by_month=fx[1])
+    if fx[1]:
+        period["date"] = pd.to_datetime(period[["year", "month"]].assign(day=15))
+    totals = tuple(convert(period, fx, amount_col=col).sum() for col in ("income", "expected", "unexpected"))
+    return totals, charts.income_vs_expenses(*totals, fx[0])
+
+@cached
+def budget_view(years, months, fx):
+    """(variance table per category, grouped bar figure or None)."""
+    budget = budget_vs_actual(years, months)
+    budget["date"] = pd.to_datetime(budget[["year", "month"]].assign(day=15))
+    budget["budget"] = convert(budget, fx, amount_col="budget")
+    budget["actual"] = convert(budget, fx, amount_col="actual")
+    variance = (
+        budget.assign(category=budget["category"].fillna("Uncategorized"))
+        .groupby("category")[["budget", "actual"]].sum()
+    )
+    variance["variance"] = variance["budget"] - variance["actual"]
+    variance["used %"] = (variance["actual"] / variance["budget"].where(variance["budget"] != 0) * 100).round(1)
+    variance = variance.sort_values("variance")
+    if variance.empty:
+        return variance, None
+    return variance, charts.budget_vs_actual(variance, fx[0])
+
+@cached
+def forecast_view(horizon, start, fx):
+    """(expected recurring spend over `horizon` months from `start`, bar figure)."""
+    forecast = budget_projection(horizon, start)
+    forecast["date"] = pd.to_datetime(forecast[["year", "month"]].assign(day=1))
+    value = f"Expected ({fx[0]})"
+    forecast[value] = convert(forecast, fx, amount_col="budget")
+    return forecast[value].sum(), charts.forecast(forecast, value, fx[0])
+
+@cached
+def trend_series(freq, date_from, date_to, fx):
+    """(spend per category, total spend, cumulative net) on a dense period grid, or None."""
+    rows = trend_totals(freq, date_from, date_to, snapshot=True)
+    if rows.empty:
+        return None
+    rows["date"] = rows["period"]
+    rows["converted"] = convert(rows, fx, amount_col="total")
+
+    # Dense period grids: empty days/weeks count as 0, so rolling windows span real time
+    spend = trends.wide(rows[rows["kind"] == "expense"], freq, date_from, date_to)
+    income = trends.wide(rows[rows["kind"] == "income"], freq, date_from, date_to).sum(axis=1)
+    total_spend = spend.sum(axis=1)
+    net = trends.cumulative_net(income.reindex(total_spend.index, fill_value=0.0), total_spend)
+    return spend, total_spend, net
+
+@cached
+def trend_charts(freq, date_from, date_to, window, shown, fx):
+    """(per-category figure or None, total spend figure, cumulative net figure)."""
+    spend, total_spend, net = trend_series(freq, date_from, date_to, fx)
+    fig_cats = None
+    if shown:
+        lines = trends.downsample(trends.rolling_mean(spend[shown], window))
+        fig_cats = px.line(
+            lines, x="period", y="value", color="series",
+            labels={"value": f"Amount ({fx[0]})", "period": "", "series": "Category"},
+            title=f"{window}-{freq} rolling average per category — {fx[0]}",
+        )
+
+    totals = pd.DataFrame({
+        f"Per {freq}": total_spend,
+        f"{window}-{freq} rolling average": trends.rolling_mean(total_spend, window),
+    })
+    fig_total = px.line(
+        trends.downsample(totals), x="period", y="value", color="series",
+        labels={"value": f"Amount ({fx[0]})", "period": "", "series": ""},
+        title=f"Total spend — {fx[0]}",
+    )
+
+    fig_net = px.area(
+        trends.downsample(net.rename("Net balance").to_frame()), x="period", y="value",
+        labels={"value": f"Amount ({fx[0]})", "period": ""},
+        title=f"Cumulative income minus expenses — {fx[0]}",
+    )
+    return fig_cats, fig_total, fig_net
+
+# -------------------------------
+# Search
+# -------------------------------
+def search_box(kind, page_size=20):
+    """Full-text search over descriptions and category names, best matches first."""
+    text = st.text_input("🔎 Search descriptions and categories", key=f"{kind}_search",
+                         placeholder="e.g. amazon order")
+    if not text.strip():
+        return
+
+    filters = {}
+    if st.checkbox("Filter by date range", key=f"{kind}_search_dates"):
+        date_from, date_to = st.columns(2)
+        filters["date_from"] = date_from.date_input("From", value=date(today.year, 1, 1), key=f"{kind}_search_from")
+        filters["date_to"] = date_to.date_input("To", value=today, key=f"{kind}_search_to")
+
+    # Offset into the ranked hits; reset when the query changes
+    query = (text, filters.get("date_from"), filters.get("date_to"))
+    if st.session_state.get(f"{kind}_search_text") != query:
+        st.session_state[f"{kind}_search_text"] = query
+        st.session_state[f"{kind}_search_offset"] = 0
+    offset = st.session_state[f"{kind}_search_offset"]
+
+    # One extra row tells whether there is a next page
+    hits = search_transactions(text, kind=kind, limit=page_size + 1, offset=offset, **filters)
+    if not hits:
+        st.info("No matches." if offset == 0 else "No more matches.")
     else:
-        # Convert to EUR first, then to target
-        eur_amount = amount / rates.get(row_currency, 1)
-        return eur_amount * rates.get(target_currency, 1)
+        columns = ["id", "date", "amount", "currency", "category", "subcategory", "description"]
+        if kind == "expense":
+            columns.append("expected")
+        st.dataframe(pd.DataFrame(hits[:page_size])[columns], hide_index=True)
+        st.caption(f"Matches {offset + 1}–{offset + len(hits[:page_size])}")
+    if len(hits) <= page_size and offset + len(hits) >= SEARCH_WINDOW:
+        st.caption(f"Only the {SEARCH_WINDOW:,} most recent matches are searched: "
+                   "filter by date range to reach older ones.")
+
+    col_prev, col_next = st.columns(2)
+    if col_prev.button("◀ Better matches", key=f"{kind}_search_prev", disabled=offset == 0):
+        st.session_state[f"{kind}_search_offset"] = max(offset - page_size, 0)
+        st.rerun()
+    if col_next.button("More ▶", key=f"{kind}_search_next", disabled=len(hits) <= page_size):
+        st.session_state[f"{kind}_search_offset"] = offset + page_size
+        st.rerun()
+
+# -------------------------------
+# Ledger editor
+# -------------------------------
+def _clean(value):
+    return None if value is None or (isinstance(value, float) and pd.isna(value)) else value
+
+def ledger_editor(kind, page_size=50):
+    """
+    Keyset-paginated grid editor for expenses or income. Edits and deletions
+    collected in the grid are written in one transaction on "Apply changes".
+    """
+    is_expense = kind == "expense"
+    cats = list_categories()
+    cat_ids = {c["name"]: c["id"] for c in cats}
+    sub_ids = {(c["id"], sc["name"]): sc["id"] for c in cats for sc in c["subcategories"]}
+    sub_names = sorted({sc["name"] for c in cats for sc in c["subcategories"]})
+
+    # ---- FILTERS ----
+    col_from, col_to, col_cat = st.columns(3)
+    filters = {
+        "date_from": col_from.date_input("From", value=None, key=f"{kind}_filter_from"),
+        "date_to": col_to.date_input("To", value=None, key=f"{kind}_filter_to"),
+        "category_id": cat_ids.get(col_cat.selectbox("Category", ["All"] + list(cat_ids), key=f"{kind}_filter_cat")),
+    }
+
+    # Stack of (date, id) cursors, one per visited page; reset when filters change
+    if st.session_state.get(f"{kind}_filters") != filters:
+        st.session_state[f"{kind}_filters"] = filters
+        st.session_state[f"{kind}_cursors"] = [None]
+    cursors = st.session_state[f"{kind}_cursors"]
+    version = st.session_state.setdefault(f"{kind}_editor_version", 0)
+
+    if f"{kind}_flash" in st.session_state:
+        st.success(st.session_state.pop(f"{kind}_flash"))
+
+    fetch = expenses_page if is_expense else incomes_page
+    rows = fetch(after=cursors[-1], limit=page_size, **filters)
+
+    if rows:
+        columns = ["id", "date", "amount", "currency", "category", "subcategory", "description"]
+        if is_expense:
+            columns.append("expected")
+        original = pd.DataFrame(rows)[columns]
+        original["date"] = pd.to_datetime(original["date"]).dt.date
+        if is_expense:
+            original["expected"] = original["expected"].fillna(0).astype(bool)
+        original["delete"] = False
+
+        edited = st.data_editor(
+            original,
+            key=f"{kind}_editor_{version}_{len(cursors)}",
+            hide_index=True,
+            num_rows="fixed",
+            disabled=["id"],
+            column_config={
+                "date": st.column_config.DateColumn("Date", required=True),
+                "amount": st.column_config.NumberColumn("Amount", format="%.2f", required=True),
+                "currency": st.column_config.SelectboxColumn("Currency", options=list(CURRENCIES), required=True),
+                "category": st.column_config.SelectboxColumn("Category", options=list(cat_ids)),
+                "subcategory": st.column_config.SelectboxColumn("Subcategory", options=sub_names),
+                "expected": st.column_config.CheckboxColumn("Expected?"),
+                "delete": st.column_config.CheckboxColumn("Delete?"),
+            },
+        )
+    else:
+        st.info("No entries to edit.")
+
+    col_newer, col_older, col_apply, col_auto = st.columns(4)
+    if col_newer.button("◀ Newer", key=f"{kind}_newer", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if col_older.button("Older ▶", key=f"{kind}_older", disabled=len(rows) < page_size):
+        cursors.append((rows[-1]["date"], rows[-1]["id"]))
+        st.rerun()
+
+    if col_auto.button("✨ Auto-categorize uncategorized", key=f"{kind}_auto",
+                       help="Assign categories from subcategory labels found in descriptions"):
+        count = auto_categorize(kind)
+        st.session_state[f"{kind}_flash"] = f"Categorized {count} entries from subcategory labels."
+        st.session_state[f"{kind}_editor_version"] = version + 1
+        st.rerun()
+
+    if rows and col_apply.button("Apply changes", key=f"{kind}_apply", type="primary"):
+        deletes = edited.loc[edited["delete"], "id"].tolist()
+        updates = []
+        for idx, row in edited[~edited["delete"]].iterrows():
+            new = {k: _clean(v) for k, v in row.items()}
+            if new == {k: _clean(v) for k, v in original.loc[idx].items()}:
+                continue
+            cat_id = cat_ids.get(new["category"])
+            sub_id = sub_ids.get((cat_id, new["subcategory"]))
+            values = [new["id"], new["date"], new["amount"], cat_id, sub_id, new["description"]]
+            if is_expense:
+                values.append(new["expected"])
+            updates.append(tuple(values + [new["currency"]]))
+
+        # Edits and deletions are saved together: all of them or none
+        if is_expense:
+            save_expense_edits(updates, deletes)
+        else:
+            save_income_edits(updates, deletes)
+
+        st.session_state[f"{kind}_flash"] = f"Saved {len(updates)} edits, deleted {len(deletes)} entries."
+        st.session_state[f"{kind}_editor_version"] = version + 1
+        st.rerun()
 
 # -------------------------------
 # Setup
@@ -89,10 +389,16 @@ def to_display_currency(amount, row_currency, target_currency, rates):
 
 BASE_DIR = os.path.dirname(__file__)
 st.set_page_config(page_title="Budget Baddie", layout="wide")
-init_db()
+# Trace this rerun when tracing is on globally or the panel was ticked last rerun
+if instrument.ENABLED or st.session_state.get("perf_panel"):
+    instrument.begin(f"rerun:{st.session_state.get('page', 'Overview')}")
+else:
+    instrument.reset()
+with section("setup"):
+    setup_db()
+    start_backups()
+    start_rates()
 today = date.today()
-# Backup DB on start
-backup_db()
 
 # -------------------------------
 # Sidebar navigation
@@ -101,14 +407,20 @@ LOGO_PATH = BASE_DIR+"/../docs/logo.png"
 # st.sidebar.title("Budget Baddie")
 st.sidebar.image(LOGO_PATH, use_container_width=True)
 st.sidebar.markdown("---")  # nice separator, optional
-page = st.sidebar.radio("Go to page", [
+page = st.sidebar.radio("Go to page", key="page", options=[
     "Overview",
+    "Trends",
     "Manage Expenses",
     "Manage Income",
     "Manage Categories",
     "Export Data"
 ])
-display_currency, rates = currency_selector()
+with section("sidebar"):
+    display_currency, rates, use_historical = currency_selector()
+# Conversion settings, hashable so the cached views below can be keyed on them
+fx = (display_currency, use_historical, tuple(sorted(rates.items())))
+st.sidebar.checkbox("⏱ Performance panel", key="perf_panel",
+                    help="Time SQL statements and page sections for each rerun")
 
 # -------------------------------
 # PAGE: OVERVIEW
@@ -118,30 +430,18 @@ if page == "Overview":
 
     # Recent Expenses
     st.header("🧾 Recent Expenses")
-    recent_exp = pd.DataFrame(list_recent_expenses(limit=10))
+    with section("recent_expenses"):
+        recent_exp = recent_view("expense", fx)
     if not recent_exp.empty:
-        recent_exp["Converted amount"] = recent_exp.apply(
-            lambda r: convert_value(r["amount"], r.get("currency", "EUR"), display_currency, rates), axis=1
-        )
-        recent_exp.rename(columns={
-            "amount": f"Amount ({recent_exp.get('currency', 'EUR').iloc[0] if 'currency' in recent_exp else 'EUR'})",
-            "Converted amount": f"Converted amount ({display_currency})"
-        }, inplace=True)
         st.dataframe(recent_exp)
     else:
         st.info("No recent expenses yet.")
 
     # Recent Income
     st.header("💰 Recent Income")
-    recent_inc = pd.DataFrame(list_incomes(limit=10))
+    with section("recent_income"):
+        recent_inc = recent_view("income", fx)
     if not recent_inc.empty:
-        recent_inc["Converted amount"] = recent_inc.apply(
-            lambda r: convert_value(r["amount"], r.get("currency", "EUR"), display_currency, rates), axis=1
-        )
-        recent_inc.rename(columns={
-            "amount": f"Amount ({recent_inc.get('currency', 'EUR').iloc[0] if 'currency' in recent_inc else 'EUR'})",
-            "Converted amount": f"Converted amount ({display_currency})"
-        }, inplace=True)
         st.dataframe(recent_inc)
     else:
         st.info("No recent income yet.")
@@ -171,85 +471,33 @@ if page == "Overview":
         selected_month_nums = [month_to_num[m] for m in selected_months]
 
     # ---- BUILD FILTERED DF ----
-    df = pd.DataFrame()
-
-    for year in selected_years:
-        for month in selected_month_nums:
-            df_month = expenses_frame(year, month)
-            if df_month is not None and not df_month.empty:
-                df = pd.concat([df, df_month], ignore_index=True)
+    with section("overview.build"):
+        df = overview_view(selected_years, selected_month_nums, fx)
 
     if df.empty:
         st.warning("No expenses for the selected period.")
+        performance_panel()
         st.stop()
 
-    # ---- CURRENCY CONVERSION ----
-    df["Converted amount"] = df.apply(
-        lambda r: convert_value(r["amount"], r.get("currency", "EUR"), display_currency, rates),
-        axis=1
-    )
-
-    df.rename(columns={
-        "amount": f"Amount ({df.get('currency', 'EUR').iloc[0] if 'currency' in df else 'EUR'})",
-        "Converted amount": f"Converted amount ({display_currency})"
-    }, inplace=True)
-
-    st.dataframe(df)
+    with section("overview.table"):
+        st.dataframe(df)
 
     # ---------------------------
     # Pie chart by category
     # ---------------------------
-    by_cat = df.groupby("category")[f"Converted amount ({display_currency})"].sum().reset_index()
-
-    fig_cat = px.pie(
-        by_cat,
-        names="category",
-        values=f"Converted amount ({display_currency})",
-        title=f"Expenses by Category ({display_currency})"
-    )
-
-    st.plotly_chart(fig_cat, use_container_width=True)
+    with section("chart.by_category"):
+        st.plotly_chart(category_pie(selected_years, selected_month_nums, fx), use_container_width=True)
 
     # ---------------------------
     # INCOME VS EXPENSES
     # ---------------------------
     st.header("💵 Income vs Expenses Overview")
 
-    incomes = pd.DataFrame(list_incomes(limit=1000))
-
-    if not incomes.empty:
-        incomes["Converted amount"] = incomes.apply(
-            lambda r: convert_value(r["amount"], r.get("currency", "EUR"), display_currency, rates),
-            axis=1
+    with section("chart.income_vs_expenses"):
+        (total_income, total_other_exp, total_emergency), fig_income_exp = income_vs_expenses(
+            selected_years, selected_month_nums, fx
         )
-        total_income = incomes["Converted amount"].sum()
-    else:
-        total_income = 0.0
-
-    df["is_emergency"] = df["category"].apply(
-        lambda x: str(x).lower().strip() == "unexpected / emergencies"
-    )
-
-    total_emergency = df[df["is_emergency"]][f"Converted amount ({display_currency})"].sum()
-    total_other_exp = df[~df["is_emergency"]][f"Converted amount ({display_currency})"].sum()
-
-    summary_df = pd.DataFrame([
-        {"Category": "Income", "Type": "Income", f"Amount ({display_currency})": total_income},
-        {"Category": "Expenses", "Type": "Expected", f"Amount ({display_currency})": total_other_exp},
-        {"Category": "Expenses", "Type": "Unexpected", f"Amount ({display_currency})": total_emergency},
-    ])
-
-    fig_income_exp = px.bar(
-        summary_df,
-        x="Category",
-        y=f"Amount ({display_currency})",
-        color="Type",
-        text_auto=".2f",
-        title=f"Income vs Expenses (Expected vs Unexpected) — {display_currency}",
-    )
-
-    fig_income_exp.update_layout(barmode="stack", legend_title_text="")
-    st.plotly_chart(fig_income_exp, use_container_width=True)
+        st.plotly_chart(fig_income_exp, use_container_width=True)
 
     # ---- SUMMARY ----
     total_expenses = total_emergency + total_other_exp
@@ -263,6 +511,80 @@ if page == "Overview":
         + ("✅ Surplus" if balance >= 0 else "🚨 Deficit")
     )
 
+    # ---------------------------
+    # BUDGET VS ACTUAL
+    # ---------------------------
+    st.header("🎯 Budget vs Actual")
+    with section("overview.budget"):
+        variance, fig_budget = budget_view(selected_years, selected_month_nums, fx)
+
+    if variance.empty:
+        st.info("No budgets or spending for the selected period.")
+    else:
+        st.dataframe(variance.rename(columns={
+            "budget": f"Budget ({display_currency})",
+            "actual": f"Actual ({display_currency})",
+            "variance": f"Variance ({display_currency})",
+        }).style.format("{:,.2f}", na_rep="—"))
+
+        with section("chart.budget"):
+            st.plotly_chart(fig_budget, use_container_width=True)
+
+    with st.expander("📅 Recurring spend forecast"):
+        horizon = st.slider("Months ahead", min_value=1, max_value=60, value=12)
+        with section("chart.forecast"):
+            expected_total, fig_forecast = forecast_view(horizon, today, fx)
+            st.caption(
+                f"Expected recurring spend over {horizon} months: "
+                f"{expected_total:,.2f} {display_currency}"
+            )
+            st.plotly_chart(fig_forecast, use_container_width=True)
+
+# -------------------------------
+# PAGE: TRENDS
+# -------------------------------
+elif page == "Trends":
+    st.title("📈 Trends")
+
+    today = date.today()
+    c1, c2, c3, c4 = st.columns(4)
+    freq = c1.selectbox("Granularity", ["month", "week", "day"], format_func=str.capitalize)
+    date_from = c2.date_input("From", value=date(today.year - 2, 1, 1), key="trend_from")
+    date_to = c3.date_input("To", value=today, key="trend_to")
+    window = c4.number_input("Rolling window (periods)", min_value=1, max_value=365,
+                             value={"month": 3, "week": 4, "day": 30}[freq])
+
+    with section("trends.series"):
+        series = trend_series(freq, date_from, date_to, fx)
+
+    if series is None:
+        st.warning("No transactions in the selected range.")
+        performance_panel()
+        st.stop()
+
+    spend, total_spend, net = series
+    ranked = spend.sum().sort_values(ascending=False)
+    shown = st.multiselect("Categories", list(ranked.index), default=list(ranked.index[:5]))
+
+    with section("trends.charts"):
+        fig_cats, fig_total, fig_net = trend_charts(freq, date_from, date_to, window, shown, fx)
+
+    st.header("🧾 Spend per Category")
+    if fig_cats is not None:
+        st.plotly_chart(fig_cats, use_container_width=True)
+    else:
+        st.info("Select at least one category.")
+
+    st.header("💸 Total Spend")
+    st.plotly_chart(fig_total, use_container_width=True)
+
+    st.header("⚖️ Cumulative Net Balance")
+    st.plotly_chart(fig_net, use_container_width=True)
+    st.caption(
+        f"{len(total_spend):,} {freq} periods; charts show at most {trends.MAX_POINTS} points per series. "
+        f"Net balance at end of range: {net.iloc[-1]:,.2f} {display_currency}"
+    )
+
 # -------------------------------
 # PAGE: MANAGE EXPENSES
 # -------------------------------
@@ -284,7 +606,7 @@ elif page == "Manage Expenses":
         sub_id = subs.get(sub_name) if sub_name else None
 
         exp_date = st.date_input("Date", value=today)
-        exp_currency = st.selectbox("Currency", ["EUR", "USD", "GBP"], index=0)
+        exp_currency = st.selectbox("Currency", CURRENCIES, index=currency_index(BASE_CURRENCY))
         exp_amount = st.number_input(f"Amount ({exp_currency})", min_value=0.0, format="%.2f")
         desc = st.text_area("Description")
         expected = st.checkbox("Expected?")
@@ -293,62 +615,13 @@ elif page == "Manage Expenses":
             add_expense(exp_date, exp_amount, cat_id, sub_id, desc, expected, exp_currency)
             st.success("Expense added!")
 
-    st.subheader("Edit/Delete Existing Expenses")
-    expenses = pd.DataFrame(list_recent_expenses(limit=50))
-    if expenses.empty:
-        st.info("No expenses to edit.")
-    else:
-        for i, row in expenses.iterrows():
-            with st.expander(f"🧾 {row['description']} — {row['amount']} {row.get('currency', 'EUR')}"):
-                new_desc = st.text_input("Description", value=row["description"], key=f"exp_desc_{row['id']}")
-                new_amount = st.number_input("Amount", value=float(row["amount"]), min_value=0.0, format="%.2f", key=f"exp_amt_{row['id']}")
-                new_currency = st.selectbox(
-                    "Currency",
-                    ["EUR", "USD", "GBP"],
-                    index=["EUR", "USD", "GBP"].index(row.get("currency", "EUR")),
-                    key=f"exp_curr_{row['id']}"
-                )
+    st.subheader("Search Expenses")
+    with section("search.expense"):
+        search_box("expense")
 
-                # Category and subcategory
-                cats_dict = get_cats_dict()
-                new_cat_name = st.selectbox(
-                    "Category",
-                    options=list(cats_dict.keys()),
-                    index=list(cats_dict.keys()).index(row["category"]),
-                    key=f"exp_cat_{row['id']}"
-                )
-                new_cat_id = cats_dict[new_cat_name]
-
-                subcategories = {sc["name"]: sc["id"] for c in list_categories() if c["id"] == new_cat_id for sc in c["subcategories"]}
-                new_sub_name = st.selectbox(
-                    "Subcategory (optional)",
-                    options=[""] + list(subcategories.keys()),
-                    index=([""] + list(subcategories.keys())).index(row["subcategory"]) if row["subcategory"] in subcategories else 0,
-                    key=f"exp_sub_{row['id']}"
-                )
-                new_sub_id = subcategories.get(new_sub_name) if new_sub_name else None
-
-                # Expected checkbox
-                new_expected = st.checkbox("Expected (planned)?", value=bool(row.get("expected", False)), key=f"exp_expected_{row['id']}")
-
-                new_date = st.date_input("Date", value=pd.to_datetime(row["date"]).date(), key=f"exp_date_{row['id']}")
-
-                if st.button("Save changes", key=f"save_exp_{row['id']}"):
-                    update_expense(
-                        expense_id=row["id"],
-                        exp_date=new_date,
-                        amount=new_amount,
-                        category_id=new_cat_id,
-                        subcategory_id=new_sub_id,
-                        description=new_desc,
-                        expected=new_expected,
-                        currency=new_currency
-                    )
-                    st.success("Expense updated!")
-
-                if st.button("Delete", key=f"del_exp_{row['id']}"):
-                    delete_expense(row["id"])
-                    st.warning("Expense deleted!")
+    st.subheader("Edit/Delete Existing Expenses")
+    with section("ledger.expense"):
+        ledger_editor("expense")
 
 # -------------------------------
 # PAGE: MANAGE INCOME
@@ -378,7 +651,7 @@ elif page == "Manage Income":
 
         # Other fields
         inc_date = st.date_input("Date", value=today, key="add_inc_date")
-        inc_currency = st.selectbox("Currency", ["EUR", "USD", "GBP"], index=0, key="add_inc_curr")
+        inc_currency = st.selectbox("Currency", CURRENCIES, index=currency_index(BASE_CURRENCY), key="add_inc_curr")
         inc_amount = st.number_input(f"Amount ({inc_currency})", min_value=0.0, format="%.2f", key="add_inc_amount")
         inc_desc = st.text_area("Description", key="add_inc_desc")
 
@@ -396,56 +669,13 @@ elif page == "Manage Income":
 
     st.markdown("---")
 
-    st.subheader("Edit/Delete Existing Income")
-    incomes = pd.DataFrame(list_incomes(limit=50))
-    if incomes.empty:
-        st.info("No income entries to edit.")
-    else:
-        cats_dict = get_cats_dict()
-        for i, row in incomes.iterrows():
-            with st.expander(f"💵 {row['description']} — {row['amount']} {row.get('currency', 'EUR')}"):
-                # Editable fields
-                new_desc = st.text_input("Description", value=row.get("description", ""), key=f"inc_desc_{row['id']}")
-                new_amount = st.number_input(
-                    "Amount",
-                    value=float(row.get("amount", 0.0)),
-                    min_value=0.0,
-                    format="%.2f",
-                    key=f"inc_amt_{row['id']}"
-                )
-                new_currency = st.selectbox(
-                    "Currency",
-                    ["EUR", "USD", "GBP"],
-                    index=["EUR", "USD", "GBP"].index(row.get("currency", "EUR")),
-                    key=f"inc_curr_{row['id']}"
-                )
-                new_date = st.date_input(
-                    "Date",
-                    value=pd.to_datetime(row.get("date", date.today())).date(),
-                    key=f"inc_date_{row['id']}"
-                )
+    st.subheader("Search Income")
+    with section("search.income"):
+        search_box("income")
 
-                # Preserve old category/subcategory if present
-                cat_id = row.get("category_id", None)
-                sub_id = row.get("subcategory_id", None)
-
-                # Save changes button
-                if st.button("Save changes", key=f"save_inc_{row['id']}"):
-                    update_income(
-                        income_id=row["id"],
-                        amount=new_amount,
-                        description=new_desc,
-                        currency=new_currency,
-                        inc_date=new_date,
-                        category_id=cat_id,
-                        subcategory_id=sub_id
-                    )
-                    st.success("Income updated!")
-
-                # Delete button
-                if st.button("Delete", key=f"del_inc_{row['id']}"):
-                    delete_income(row["id"])
-                    st.warning("Income deleted!")
+    st.subheader("Edit/Delete Existing Income")
+    with section("ledger.income"):
+        ledger_editor("income")
 
 
 # -------------------------------
@@ -478,6 +708,22 @@ elif page == "Manage Categories":
                 delete_category(c["id"])
                 st.success(f"Category '{new_name}' deleted!")
 
+            st.markdown("**Monthly budget override**")
+            col_year, col_month, col_amount = st.columns(3)
+            bud_year = col_year.number_input("Year", value=today.year, step=1, key=f"bud_year_{c['id']}")
+            bud_month = col_month.selectbox("Month", list(range(1, 13)), index=today.month - 1,
+                                            format_func=lambda m: calendar.month_name[m], key=f"bud_month_{c['id']}")
+            bud_amount = col_amount.number_input(f"Budget ({BASE_CURRENCY})", min_value=0.0,
+                                                 value=float(c["expected_monthly"] or 0.0), format="%.2f",
+                                                 key=f"bud_amount_{c['id']}")
+            col_save, col_clear = st.columns(2)
+            if col_save.button("💾 Save budget", key=f"save_bud_{c['id']}"):
+                set_budget(int(bud_year), bud_month, c["id"], bud_amount)
+                st.success(f"Budget for {calendar.month_name[bud_month]} {int(bud_year)} saved!")
+            if col_clear.button("↩ Use expected monthly", key=f"clear_bud_{c['id']}"):
+                set_budget(int(bud_year), bud_month, c["id"], None)
+                st.success("Budget override removed.")
+
             st.markdown("---")
             st.subheader("Subcategories")
             
@@ -485,9 +731,12 @@ elif page == "Manage Categories":
             for sc in c["subcategories"]:
                 sc_name = st.text_input("Subcategory Name", sc["name"], key=f"sc_name_{sc['id']}")
                 sc_desc = st.text_area("Description", sc["description"], key=f"sc_desc_{sc['id']}")
+                sc_labels = st.text_input("Labels (comma-separated)", ", ".join(parse_labels(sc["labels"])),
+                                          key=f"sc_labels_{sc['id']}")
                 
                 if st.button("💾 Save Subcategory", key=f"save_sc_{sc['id']}"):
-                    update_subcategory(sc["id"], name=sc_name, description=sc_desc)
+                    update_subcategory(sc["id"], name=sc_name, description=sc_desc,
+                                       labels=[l.strip() for l in sc_labels.split(",") if l.strip()])
                     st.success(f"Subcategory '{sc_name}' updated!")
 
                 if st.button("🗑 Delete Subcategory", key=f"del_sc_{sc['id']}"):
@@ -520,21 +769,46 @@ elif page == "Manage Categories":
 elif page == "Export Data":
     st.title("📤 Export Expenses & Income")
     try:
-        df_exp = pd.DataFrame(list_recent_expenses(limit=1000))
-        df_inc = pd.DataFrame(list_incomes(limit=1000))
-
-        if df_exp.empty and df_inc.empty:
+        kind_label = st.radio("Data", ["Expenses", "Income"], horizontal=True)
+        kind = "expense" if kind_label == "Expenses" else "income"
+        fmt = st.selectbox("Format", ["CSV", "CSV (gzip)", "Parquet"])
+
+        filters = {}
+        if st.checkbox("Filter by date range"):
+            date_from, date_to = st.columns(2)
+            filters["date_from"] = date_from.date_input("From", value=date(today.year, 1, 1), key="export_from")
+            filters["date_to"] = date_to.date_input("To", value=today, key="export_to")
+        filters["categories"] = st.multiselect("Categories (default: all)", [c["name"] for c in list_categories()])
+
+        st.subheader(f"Latest {kind_label.lower()}")
+        preview = pd.DataFrame(list_recent_expenses(limit=20) if kind == "expense" else list_incomes(limit=20))
+        if preview.empty:
             st.info("No data to export.")
         else:
-            if not df_exp.empty:
-                st.subheader("Expenses")
-                st.dataframe(df_exp)
-                csv = df_exp.to_csv(index=False).encode("utf-8")
-                st.download_button("Download Expenses CSV", data=csv, file_name="expenses_export.csv", mime="text/csv")
-            if not df_inc.empty:
-                st.subheader("Income")
-                st.dataframe(df_inc)
-                csv = df_inc.to_csv(index=False).encode("utf-8")
-                st.download_button("Download Income CSV", data=csv, file_name="income_export.csv", mime="text/csv")
+            st.dataframe(preview)
+
+        # Rows are streamed into a temporary file in batches; only the finished
+        # file is read back, once, for the download, and the file is removed
+        if st.button("Prepare export"):
+            suffix = {"CSV": ".csv", "CSV (gzip)": ".csv.gz", "Parquet": ".parquet"}[fmt]
+            fd, path = tempfile.mkstemp(prefix=f"budget_{kind}_export_", suffix=suffix)
+            os.close(fd)
+            try:
+                if fmt == "Parquet":
+                    count = export_parquet(path, kind, **filters)
+                else:
+                    count = export_csv(path, kind, compress=fmt == "CSV (gzip)", **filters)
+                with open(path, "rb") as f:
+                    data = f.read()
+            finally:
+                os.remove(path)
+            mime = "text/csv" if fmt == "CSV" else "application/octet-stream"
+            # on_click="ignore": downloading does not rerun the page, so the button stays
+            st.download_button(
+                f"Download {kind_label.lower()} ({count} rows)",
+                data=data, file_name=f"{kind}_export{suffix}", mime=mime, on_click="ignore"
+            )
     except Exception as e:
-        st.error(f"Error exporting: {e}")
\ No newline at end of file
+        st.error(f"Error exporting: {e}")
+
+performance_panel()
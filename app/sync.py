@@ -0,0 +1,289 @@
+import json
+import os
+import time
+
+from app import connection
+from app.migrations import SYNCED_TABLES, UUID_SQL, migrate, stamp_sql
+from app.schema import invalidate_categories, remove_category, remove_subcategory
+from app.writer import write
+
+# -------------------------------
+# TWO-WAY SYNC
+# -------------------------------
+# Replicas (copies of the ledger) exchange the latest version of every row
+# changed since their last sync, read from the change log (see
+# migrations.CHANGES_TABLE). Rows travel by uuid, with references to
+# categories and subcategories as uuids too. Conflicts go to the higher
+# (stamp, origin) version, so every replica settles on the same row
+# whichever order they sync in. What sync itself does to a replica
+# (cascades, merges) is not logged: each replica replays it on its own.
+
+TABLES = [table for table, _ in SYNCED_TABLES]
+FIELDS = {table: [c.strip() for c in columns.split(",")] for table, columns in SYNCED_TABLES}
+# Local id column -> (name it travels under, table it points to)
+REFERENCES = {"category_id": ("category", "categories"), "subcategory_id": ("subcategory", "subcategories")}
+CHUNK = 500  # uuids per IN (...) lookup
+
+# Version of rows that predate the change log
+BASE_VERSION = (0, "")
+
+
+# -------------------------------
+# EXPORT
+# -------------------------------
+def replica_id(path=None):
+    with connection.connection(path) as conn:
+        return conn.execute("SELECT value FROM sync_state WHERE name = 'replica'").fetchone()[0]
+
+
+def _select(table):
+    columns, joins = ["t.uuid"], []
+    for field in FIELDS[table]:
+        if field in REFERENCES:
+            name, target = REFERENCES[field]
+            columns.append(f"{name}.uuid AS {name}")
+            joins.append(f"LEFT JOIN {target} {name} ON {name}.id = t.{field}")
+        else:
+            columns.append(f"t.{field}")
+    return f"SELECT {', '.join(columns)} FROM {table} t {' '.join(joins)}"
+
+
+def changes_since(path=None, after=None, skip_origin=None):
+    """
+    The latest version of every row changed after local change `after`
+    (of every row when `after` is None), leaving out versions made by
+    `skip_origin`. Returns (changes, last seq read); each change is a dict
+    of table, uuid, op, stamp, origin and row (None for deletes).
+    """
+    with connection.connection(path) as conn:
+        conn.execute("BEGIN")  # one consistent snapshot for the log and the rows
+        latest = {}
+        for r in conn.execute("SELECT seq, tbl, uuid, op, stamp, origin FROM changes WHERE seq > ? ORDER BY seq",
+                              (after or 0,)):
+            latest[r["uuid"]] = r
+        last = max([after or 0] + [r["seq"] for r in latest.values()])
+
+        changes = []
+        for table in TABLES:
+            if after is None:
+                rows = conn.execute(_select(table)).fetchall()
+            else:
+                wanted = [u for u, r in latest.items() if r["tbl"] == table and r["op"] != "delete"]
+                rows = [row for i in range(0, len(wanted), CHUNK)
+                        for row in conn.execute(
+                            f"{_select(table)} WHERE t.uuid IN ({', '.join('?' * len(wanted[i:i + CHUNK]))})",
+                            wanted[i:i + CHUNK])]
+            for row in rows:
+                version = latest.get(row["uuid"])
+                stamp, origin = (version["stamp"], version["origin"]) if version else BASE_VERSION
+                if origin == skip_origin:
+                    continue
+                changes.append({
+                    "table": table, "uuid": row["uuid"], "op": version["op"] if version else "insert",
+                    "stamp": stamp, "origin": origin, "row": {k: row[k] for k in row.keys()[1:]},
+                })
+        # A row removed by a replayed cascade has no delete of its own: the
+        # query above just does not find it, and the peer replays the cascade too
+        changes += [
+            {"table": r["tbl"], "uuid": r["uuid"], "op": "delete", "stamp": r["stamp"], "origin": r["origin"],
+             "row": None}
+            for r in latest.values() if r["op"] == "delete" and r["origin"] != skip_origin
+        ]
+    return changes, last
+
+
+# -------------------------------
+# APPLY
+# -------------------------------
+def _version(conn, table, uuid):
+    """Local (stamp, origin) of a row, BASE_VERSION if it predates the log, None if unknown."""
+    r = conn.execute("SELECT stamp, origin FROM changes WHERE uuid = ? ORDER BY seq DESC LIMIT 1", (uuid,)).fetchone()
+    if r is not None:
+        return r["stamp"], r["origin"]
+    if conn.execute(f"SELECT 1 FROM {table} WHERE uuid = ?", (uuid,)).fetchone():
+        return BASE_VERSION
+    return None
+
+
+def _local_id(conn, table, uuid, aliases):
+    if uuid is None:
+        return None
+    r = conn.execute(f"SELECT id FROM {table} WHERE uuid = ?", (uuid,)).fetchone()
+    return r["id"] if r else aliases.get(uuid)
+
+
+def _merge_category(conn, drop_id, keep_id):
+    """Point everything at category `keep_id` instead of `drop_id`, then remove the latter."""
+    for table in ("expenses", "income", "subcategories"):
+        conn.execute(f"UPDATE {table} SET category_id=? WHERE category_id=?", (keep_id, drop_id))
+    conn.execute("UPDATE OR IGNORE monthly_budgets SET category_id=? WHERE category_id=?", (keep_id, drop_id))
+    conn.execute("DELETE FROM monthly_budgets WHERE category_id=?", (drop_id,))
+    conn.execute("DELETE FROM categories WHERE id=?", (drop_id,))
+
+
+def _record_merge(conn, table, uuid, after):
+    """
+    Log a merged row as this replica's own update, newer than both merged
+    versions, so the next push sends the surviving uuid back to the peer.
+    """
+    conn.execute(f"""
+        INSERT INTO changes (tbl, uuid, op, stamp, origin)
+        SELECT ?, ?, 'update', MAX({stamp_sql("?")}, ? + 1), value FROM sync_state WHERE name = 'replica'
+    """, (table, uuid, uuid, after))
+
+
+def _upsert_category(conn, change, aliases):
+    """
+    Category names are unique, so one created on two replicas under the same
+    name is merged: the row keeps the smaller uuid and the fields of the
+    newer version. Returns the (uuid, version) to record for it, or
+    (uuid, None) when the merged row differs from what the peer sent (other
+    uuid or older fields) and was logged as a local change to send back.
+    """
+    row, uuid, version = change["row"], change["uuid"], (change["stamp"], change["origin"])
+    clash = conn.execute("SELECT id, uuid FROM categories WHERE name = ? AND uuid != ?",
+                         (row["name"], uuid)).fetchone()
+    if clash is None:
+        _upsert(conn, "categories", uuid, row)
+        return uuid, version
+
+    clash_version = _version(conn, "categories", clash["uuid"])
+    target = _local_id(conn, "categories", uuid, {})
+    if target is None:
+        target = clash["id"]
+    else:
+        _merge_category(conn, clash["id"], target)
+    keep = min(uuid, clash["uuid"])
+    aliases[uuid] = aliases[clash["uuid"]] = target
+    conn.execute("UPDATE categories SET uuid = ? WHERE id = ?", (keep, target))
+    if version > clash_version:
+        _upsert(conn, "categories", keep, row)
+        if keep == uuid:
+            return keep, version
+    _record_merge(conn, "categories", keep, max(version, clash_version)[0])
+    return keep, None
+
+
+def _upsert(conn, table, uuid, values):
+    fields = FIELDS[table]
+    conn.execute(f"""
+        INSERT INTO {table} (uuid, {', '.join(fields)}) VALUES (?, {', '.join('?' * len(fields))})
+        ON CONFLICT (uuid) DO UPDATE SET {', '.join(f'{f} = excluded.{f}' for f in fields)}
+    """, [uuid] + [values[f] for f in fields])
+
+
+def apply_changes(conn, changes):
+    """
+    Apply a peer's changes on `conn` (inside a write job). Each one replaces
+    the local row only if its version is newer. Returns counts of applied,
+    current (already here), outdated (lost to a newer local version) and
+    orphaned changes (a subcategory whose category no longer exists here).
+    """
+    counts = {"applied": 0, "current": 0, "outdated": 0, "orphaned": 0}
+    rank = {table: i for i, table in enumerate(TABLES)}
+    # Parents before children for upserts, children first for deletes
+    ordered = sorted(changes, key=lambda c: (c["op"] == "delete", (-1 if c["op"] == "delete" else 1) * rank[c["table"]]))
+    aliases = {}
+
+    conn.execute("UPDATE sync_state SET value = 1 WHERE name = 'applying'")
+    try:
+        for change in ordered:
+            table, uuid, version = change["table"], change["uuid"], (change["stamp"], change["origin"])
+            local = _version(conn, table, uuid)
+            if local is not None and version <= local:
+                counts["current" if version == local else "outdated"] += 1
+                continue
+
+            row_id = _local_id(conn, table, uuid, aliases)
+            if change["op"] == "delete":
+                if row_id is None:
+                    pass  # never seen here: the tombstone still keeps a stale copy from coming back
+                elif table == "categories":
+                    remove_category(conn, row_id)
+                elif table == "subcategories":
+                    remove_subcategory(conn, row_id)
+                else:
+                    conn.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+            else:
+                values = dict(change["row"])
+                for field, (name, target) in REFERENCES.items():
+                    if field in FIELDS[table]:
+                        values[field] = _local_id(conn, target, values.pop(name), aliases)
+                if table == "subcategories" and values["category_id"] is None:
+                    counts["orphaned"] += 1
+                    continue
+                if table == "categories":
+                    uuid, version = _upsert_category(conn, change, aliases)
+                else:
+                    _upsert(conn, table, uuid, values)
+
+            if version is not None:
+                conn.execute("INSERT INTO changes (tbl, uuid, op, stamp, origin) VALUES (?, ?, ?, ?, ?)",
+                             (table, uuid, change["op"], *version))
+            counts["applied"] += 1
+    finally:
+        conn.execute("UPDATE sync_state SET value = 0 WHERE name = 'applying'")
+    return counts
+
+
+# -------------------------------
+# SYNC
+# -------------------------------
+def _fork(conn, original):
+    """
+    Make the database on `conn`, a file copied from `original`, a replica of
+    its own: new id, and the changes it made since the copy carry that id.
+    """
+    shared = conn.execute("SELECT value FROM sync_state WHERE name = 'replica'").fetchone()[0]
+    since_copy = []
+    with connection.connection(original) as orig:
+        # Both logs are identical up to the copy; walk back until they agree
+        for r in conn.execute("SELECT seq, uuid, stamp FROM changes WHERE origin = ? ORDER BY seq DESC", (shared,)):
+            if orig.execute("SELECT 1 FROM changes WHERE seq = ? AND uuid = ? AND stamp = ?",
+                            (r["seq"], r["uuid"], r["stamp"])).fetchone():
+                break
+            since_copy.append((r["seq"],))
+    conn.execute(f"UPDATE sync_state SET value = {UUID_SQL} WHERE name = 'replica'")
+    conn.executemany("UPDATE changes SET origin = (SELECT value FROM sync_state WHERE name = 'replica') "
+                     "WHERE seq = ?", since_copy)
+
+
+def _transfer(source, target, full):
+    """Send `source`'s changes that `target` has not seen yet; returns counts."""
+    receiver = replica_id(target)
+    with connection.connection(source) as conn:
+        r = conn.execute("SELECT sent FROM sync_peers WHERE peer = ?", (receiver,)).fetchone()
+    changes, last = changes_since(source, None if full or r is None else r["sent"], skip_origin=receiver)
+
+    counts = write(lambda conn: apply_changes(conn, changes), target) if changes else \
+        {"applied": 0, "current": 0, "outdated": 0, "orphaned": 0}
+    write(lambda conn: conn.execute("""
+        INSERT INTO sync_peers (peer, sent) VALUES (?, ?)
+        ON CONFLICT (peer) DO UPDATE SET sent = MAX(sent, excluded.sent)
+    """, (receiver, last)), source)
+    counts.update(changes=len(changes), bytes=len(json.dumps(changes, separators=(",", ":"))))
+    return counts
+
+
+def sync(other, path=None, full=False):
+    """
+    Two-way sync between the database at `path` (default: the app's) and
+    the one at `other`: pull the other's new changes, then push ours. `full`
+    resends everything instead of the changes since the last sync (e.g.
+    after restoring one side from a backup). Returns pulled/pushed counts.
+    """
+    started = time.perf_counter()
+    path = path or connection.DB_PATH
+    if os.path.exists(other) and os.path.samefile(path, other):
+        raise ValueError("cannot sync a database with itself")
+    migrate(path)
+    migrate(other)
+
+    copied = replica_id(path) == replica_id(other)
+    if copied:
+        write(lambda conn: _fork(conn, path), other)
+
+    pulled = _transfer(other, path, full)
+    pushed = _transfer(path, other, full)
+    invalidate_categories()
+    return {"pulled": pulled, "pushed": pushed, "new_replica": copied, "seconds": time.perf_counter() - started}
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+# -------------------------------
+# TREND SERIES
+# -------------------------------
+# Builds dense period x category series from schema.trend_totals rows (after
+# currency conversion) and thins them out before plotting.
+
+FREQUENCIES = {"day": "D", "week": "W-MON", "month": "MS"}
+MAX_POINTS = 800  # roughly the plot width in pixels
+
+
+def period_index(freq, start, end):
+    """Every period start between two dates, including empty periods."""
+    start = pd.Timestamp(start)
+    if freq == "week":
+        start -= pd.Timedelta(days=start.weekday())
+    elif freq == "month":
+        start = start.replace(day=1)
+    return pd.date_range(start, pd.Timestamp(end), freq=FREQUENCIES[freq], name="period")
+
+
+def wide(rows, freq, start, end, value="converted", column="category"):
+    """
+    Pivot long rows (period, `column`, `value`) into a dense frame with one
+    row per period and one column per `column` value; missing periods are 0.
+    """
+    index = period_index(freq, start, end)
+    if rows.empty:
+        return pd.DataFrame(index=index)
+    table = rows.assign(**{column: rows[column].fillna("Uncategorized")}).pivot_table(
+        index="period", columns=column, values=value, aggfunc="sum", fill_value=0.0, observed=True
+    )
+    return table.reindex(index, fill_value=0.0)
+
+
+def rolling_mean(series, window):
+    """Trailing mean over `window` periods (shorter at the start)."""
+    return series.rolling(int(window), min_periods=1).mean()
+
+
+def cumulative_net(income, expenses):
+    """Running income minus expenses over aligned per-period totals."""
+    return (income - expenses).cumsum()
+
+
+# -------------------------------
+# DOWNSAMPLING
+# -------------------------------
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: indices of `threshold` points of (x, y)
+    that keep the visual shape of the line. The first and last points are
+    always kept; inputs no longer than `threshold` are returned whole.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+
+    # Interior points 1..n-2 are split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    picked = np.empty(threshold, dtype=int)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        # Twice the triangle area between the last pick, each candidate and the next bucket's mean
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        picked[i + 1] = a
+    return picked
+
+
+def downsample(frame, max_points=MAX_POINTS):
+    """
+    Thin each column of a period-indexed frame to at most `max_points`
+    points with LTTB and return it in long form (period, series, value),
+    ready for a Plotly line chart.
+    """
+    x = frame.index.asi8 if isinstance(frame.index, pd.DatetimeIndex) else np.arange(len(frame))
+    parts = []
+    for name in frame.columns:
+        y = frame[name].to_numpy(dtype="float64")
+        keep = lttb(x, y, max_points)
+        parts.append(pd.DataFrame({"period": frame.index[keep], "series": name, "value": y[keep]}))
+    if not parts:
+        return pd.DataFrame(columns=["period", "series", "value"])
+    return pd.concat(parts, ignore_index=True)
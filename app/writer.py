@@ -0,0 +1,110 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+from app import connection, instrument
+
+# -------------------------------
+# SERIALIZED WRITER
+# -------------------------------
+# Every write to a database goes through one daemon thread. Callers queue a
+# job (a function taking the writer's connection) and get a Future back;
+# jobs that queue up while a transaction is committing are applied together
+# in the next one, each inside its own savepoint so one failing job does not
+# undo the others. Reads keep using the pool and run concurrently under WAL.
+
+MAX_BATCH = 256  # jobs per transaction
+
+_writers = {}
+_lock = threading.Lock()
+
+
+class Writer:
+    def __init__(self, path):
+        self.path = path
+        self.jobs = queue.SimpleQueue()
+        self.conn = None
+        self.thread = threading.Thread(target=self._run, name="budget-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, fn):
+        """Queue `fn(conn)`; the Future resolves to its result once committed."""
+        future = Future()
+        if threading.current_thread() is self.thread:
+            # A job writing again joins the transaction it is already part of
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(fn(self.conn))
+            except BaseException as exc:
+                future.set_exception(exc)
+            return future
+        self.jobs.put((fn, future, instrument.current()))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self.jobs.get()]
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+            self._apply(batch)
+
+    def _apply(self, batch):
+        done = []
+        try:
+            with connection.connection(self.path) as conn, connection.bind(conn, self.path):
+                self.conn = conn
+                conn.execute("BEGIN IMMEDIATE")
+                for fn, future, trace in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    conn.execute("SAVEPOINT job")
+                    # The job's statements show up in the submitting thread's trace
+                    previous = instrument.attach(trace)
+                    try:
+                        result = fn(conn)
+                    except BaseException as exc:
+                        # SystemExit and the like too: the job fails, the thread lives on
+                        instrument.attach(previous)
+                        conn.execute("ROLLBACK TO job")
+                        future.set_exception(exc)
+                    else:
+                        instrument.attach(previous)
+                        done.append((future, result))
+                    conn.execute("RELEASE job")
+                conn.commit()
+        except BaseException as exc:
+            # BEGIN, COMMIT or a savepoint failed: the connection rolled the
+            # transaction back on return, so nothing in this batch was written
+            for future, _ in done:
+                future.set_exception(exc)
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        finally:
+            self.conn = None
+        for future, result in done:
+            future.set_result(result)
+
+
+def writer(path=None):
+    """The writer thread for `path` (default: the app database), started on first use."""
+    path = path or connection.DB_PATH
+    with _lock:
+        w = _writers.get(path)
+        if w is None or not w.thread.is_alive():
+            w = _writers[path] = Writer(path)
+        return w
+
+
+def submit(fn, path=None):
+    """Queue `fn(conn)` to run in a write transaction; returns a Future of its result."""
+    return writer(path).submit(fn)
+
+
+def write(fn, path=None):
+    """Run `fn(conn)` in a write transaction and return its result once committed."""
+    return submit(fn, path).result()
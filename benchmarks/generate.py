@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import random
+from datetime import date, timedelta
+
+# -------------------------------
+# SYNTHETIC LEDGER
+# -------------------------------
+# Everything is derived from `seed`, so the same arguments always produce
+# the same database and results from different runs stay comparable.
+
+END_DATE = date(2025, 12, 31)
+WORDS = (
+    "market", "coffee", "rent", "train", "pharmacy", "cinema", "books", "fuel",
+    "bakery", "gym", "insurance", "phone", "taxi", "lunch", "hardware", "gift",
+)
+
+
+def _description(rng):
+    return f"{rng.choice(WORDS)} {rng.choice(WORDS)} #{rng.randrange(10_000)}"
+
+
+def _amount(rng, currency):
+    # Log-normal-ish spread: mostly small tickets, a few large ones
+    major = round(rng.lognormvariate(3.0, 1.0), 2)
+    return round(major) if currency == "JPY" else major
+
+
+def generate(path, years=3, per_day=5, categories=12, subcategories=4,
+             currencies=("EUR", "USD", "GBP"), income_per_month=2, seed=42, end=END_DATE):
+    """
+    Write a fresh synthetic `budget.db` at `path` and return a dict with the
+    parameters and row counts. An existing file at `path` is replaced.
+    """
+    from app import connection
+    from app.currency import to_minor, FALLBACK_RATES
+    from app.migrations import migrate, _migrated
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    connection.close_all()
+    _migrated.pop(path, None)
+    migrate(path)
+
+    rng = random.Random(seed)
+    start = date(end.year - years + 1, 1, 1)
+    days = (end - start).days + 1
+
+    with connection.transaction(path) as conn:
+        conn.executemany("""
+            INSERT INTO categories (name, description, recurrent, expected_monthly)
+            VALUES (?, ?, ?, ?)
+        """, [
+            (f"Category {c:02d}", f"Synthetic category {c}", c % 3 == 0, float(50 * (c + 1)) if c % 3 == 0 else 0.0)
+            for c in range(categories)
+        ])
+        conn.executemany("""
+            INSERT INTO subcategories (category_id, name, description, labels)
+            VALUES (?, ?, ?, ?)
+        """, [
+            (c + 1, f"Sub {c:02d}.{s}", "", json.dumps([WORDS[(c + s) % len(WORDS)]]))
+            for c in range(categories) for s in range(subcategories)
+        ])
+
+        # Most rows in the base currency, the rest spread over the others
+        weights = [6] + [1] * (len(currencies) - 1)
+        expenses = []
+        for offset in range(days):
+            day = (start + timedelta(days=offset)).isoformat()
+            for _ in range(per_day):
+                cur = rng.choices(currencies, weights)[0]
+                cat = rng.randrange(categories)
+                sub = cat * subcategories + rng.randrange(subcategories) + 1 if subcategories else None
+                expenses.append((
+                    day, to_minor(_amount(rng, cur), cur), cat + 1, sub,
+                    _description(rng), rng.random() < 0.8, cur,
+                ))
+        conn.executemany("""
+            INSERT INTO expenses (date, amount, category_id, subcategory_id, description, expected, currency)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, expenses)
+
+        incomes = []
+        for month in range(years * 12):
+            first = date(start.year + month // 12, month % 12 + 1, 1)
+            for i in range(income_per_month):
+                cur = currencies[0] if i == 0 else rng.choice(currencies)
+                incomes.append((
+                    (first + timedelta(days=rng.randrange(28))).isoformat(),
+                    to_minor(round(rng.uniform(500, 4000), 2), cur), None, None, "salary", cur,
+                ))
+        conn.executemany("""
+            INSERT INTO income (date, amount, category_id, subcategory_id, description, currency)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, incomes)
+
+        # One rate per currency per week, drifting around the fallback rate
+        rates = []
+        for cur in currencies[1:]:
+            rate = FALLBACK_RATES.get(cur, 1.0)
+            for offset in range(0, days, 7):
+                rate *= 1 + rng.uniform(-0.01, 0.01)
+                rates.append(((start + timedelta(days=offset)).isoformat(), cur, round(rate, 6)))
+        conn.executemany("INSERT INTO rates (date, currency, rate) VALUES (?, ?, ?)", rates)
+
+    return {
+        "years": years,
+        "per_day": per_day,
+        "categories": categories,
+        "subcategories": subcategories,
+        "currencies": list(currencies),
+        "income_per_month": income_per_month,
+        "seed": seed,
+        "end": end.isoformat(),
+        "expenses": len(expenses),
+        "incomes": len(incomes),
+        "rates": len(rates),
+    }
+
+
+def add_arguments(p):
+    p.add_argument("--years", type=int, default=3)
+    p.add_argument("--per-day", type=int, default=5, help="expenses per day")
+    p.add_argument("--categories", type=int, default=12)
+    p.add_argument("--subcategories", type=int, default=4, help="per category")
+    p.add_argument("--currencies", default="EUR,USD,GBP", help="comma-separated, base currency first")
+    p.add_argument("--income-per-month", type=int, default=2)
+    p.add_argument("--seed", type=int, default=42)
+
+
+def generator_options(args):
+    return dict(
+        years=args.years, per_day=args.per_day, categories=args.categories,
+        subcategories=args.subcategories, currencies=tuple(args.currencies.split(",")),
+        income_per_month=args.income_per_month, seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Generate a synthetic budget database")
+    p.add_argument("output", help="database file to (over)write")
+    add_arguments(p)
+    args = p.parse_args()
+    info = generate(os.path.abspath(args.output), **generator_options(args))
+    print(json.dumps(info, indent=2))
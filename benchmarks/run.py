@@ -0,0 +1,264 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+
+from benchmarks.generate import add_arguments, generator_options
+
+MIN_DELTA = 0.0002  # seconds
+
+# -------------------------------
+# TIMING
+# -------------------------------
+def measure(fn, repeat, setup=None, warmup=True):
+    """Run `fn` `repeat` times (after one untimed call) and return timing stats in seconds."""
+    if warmup:
+        if setup:
+            setup()
+        fn()
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "repeat": repeat,
+    }
+
+
+# -------------------------------
+# CASES
+# -------------------------------
+def build_cases(db_path, dataset, workdir):
+    """
+    (name, fn, setup, warmup) tuples in execution order. Read cases come
+    first; the insert cases grow the database and run last.
+    """
+    from app import schema, migrations, cache, sync
+    from app.currency import BASE_CURRENCY, FALLBACK_RATES, convert_frame, convert_frame_asof
+    from app.importer import import_csv
+    from app.rates import rates_table
+
+    end = date.fromisoformat(dataset["end"])
+    periods = {
+        "month": ([end.year], [end.month]),
+        "year": ([end.year], list(range(1, 13))),
+        "all": (None, None),
+    }
+    target = "USD" if BASE_CURRENCY != "USD" else "EUR"
+    year_frame = schema.expenses_frame(*periods["year"])
+    all_descriptions = schema.expenses_frame()["description"].tolist()
+    rate_history = rates_table()
+
+    def overview_totals():
+        totals = schema.monthly_summary(*periods["year"])
+        totals["converted"] = convert_frame(totals, target, FALLBACK_RATES, amount_col="total")
+        return totals.groupby("category")["converted"].sum()
+
+    def overview_rows():
+        df = schema.expenses_frame(*periods["year"], snapshot=True)
+        df["converted"] = convert_frame(df, target, FALLBACK_RATES)
+        return df.groupby("category")["converted"].sum()
+
+    def concurrent_inserts(threads=8, per_thread=100):
+        def work():
+            for _ in range(per_thread):
+                schema.add_expense(end, 1.23, 1, None, "bench concurrent", currency=BASE_CURRENCY)
+        workers = [threading.Thread(target=work) for _ in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+    csv_path = os.path.join(workdir, "bulk.csv")
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["date", "amount", "description", "category", "currency"])
+        for i in range(10_000):
+            writer.writerow([end.isoformat(), f"{i % 500}.{i % 100:02d}", f"bulk {i}", "Category 00", BASE_CURRENCY])
+
+    empty_path = os.path.join(workdir, "empty.db")
+    peer_path = os.path.join(workdir, "peer.db")
+
+    def day_of_edits(count=100):
+        # The peer starts as a synced copy; then each run brings `count` new rows to sync
+        from app.connection import connection
+        from app.writer import write
+        if not os.path.exists(peer_path):
+            with connection(db_path) as conn, contextlib.closing(sqlite3.connect(peer_path)) as peer:
+                conn.backup(peer)
+            sync.sync(peer_path)
+        rows = [(end.isoformat(), 100 + i, f"bench sync {i}", BASE_CURRENCY) for i in range(count)]
+        write(lambda conn: conn.executemany(
+            "INSERT INTO expenses (date, amount, description, currency) VALUES (?, ?, ?, ?)", rows))
+
+    def reset_empty():
+        from app import connection
+        connection.close_all()
+        migrations._migrated.pop(empty_path, None)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(empty_path + suffix):
+                os.remove(empty_path + suffix)
+
+    cases = [
+        ("migrate.empty_db", lambda: migrations.migrate(empty_path), reset_empty, True),
+        ("init_db.first_call", schema.init_db, lambda: migrations._migrated.pop(db_path, None), True),
+        ("init_db.warm", schema.init_db, None, True),
+        ("list_categories.cold", schema.list_categories, schema.invalidate_categories, True),
+        ("list_categories.warm", schema.list_categories, None, True),
+    ]
+    for label, (years, months) in periods.items():
+        cases.append((f"expenses_frame.sql.{label}", lambda y=years, m=months: schema.expenses_frame(y, m), None, True))
+        cases.append((f"expenses_frame.snapshot.{label}",
+                      lambda y=years, m=months: schema.expenses_frame(y, m, snapshot=True), None, True))
+    cases += [
+        ("list_recent_expenses", lambda: schema.list_recent_expenses(limit=20), None, True),
+        ("list_incomes", lambda: schema.list_incomes(limit=20), None, True),
+        ("expenses_page", lambda: schema.expenses_page(limit=50), None, True),
+        ("search.common_word", lambda: schema.search_transactions("market"), None, True),
+        ("search.rare_phrase", lambda: schema.search_transactions("bakery gym #77"), None, True),
+        ("classify.all_descriptions", lambda: schema.classify_descriptions(all_descriptions), None, True),
+        ("budget_vs_actual.all", lambda: schema.budget_vs_actual(), None, True),
+        ("budget_projection.60_months", lambda: schema.budget_projection(60), None, True),
+        ("period_summary.year", lambda: schema.period_summary(*periods["year"]), None, True),
+        ("period_summary.all_by_month", lambda: schema.period_summary(by_month=True), None, True),
+        ("trend_totals.month_sql", lambda: schema.trend_totals("month"), None, True),
+        ("trend_totals.day_sql", lambda: schema.trend_totals("day"), None, True),
+        ("trend_totals.day_snapshot", lambda: schema.trend_totals("day", snapshot=True), None, True),
+        ("monthly_summary.year", lambda: schema.monthly_summary(*periods["year"]), None, True),
+        ("overview.totals_group_convert", overview_totals, None, True),
+        ("overview.rows_group_convert", overview_rows, None, True),
+        ("convert_frame.year", lambda: convert_frame(year_frame, target, FALLBACK_RATES), None, True),
+        ("convert_frame_asof.year",
+         lambda: convert_frame_asof(year_frame, target, rate_history, FALLBACK_RATES), None, True),
+        ("cache.hit.expenses_frame.year", lambda: schema.expenses_frame(*periods["year"]), None, True),
+        ("cache.hit.budget_vs_actual.all", lambda: schema.budget_vs_actual(), None, True),
+        ("insert.single", lambda: schema.add_expense(end, 12.34, 1, None, "bench", currency=BASE_CURRENCY),
+         None, False),
+        ("insert.concurrent_8x100", concurrent_inserts, None, False),
+        ("insert.bulk_10k", lambda: import_csv(csv_path), None, False),
+        ("sync.incremental_100", lambda: sync.sync(peer_path), day_of_edits, True),
+    ]
+    # Time the queries themselves, not the read cache, unless a case is about the cache
+    return [
+        (name, fn, cache.clear if setup is None and not name.startswith(("cache.", "insert.")) else setup, warmup)
+        for name, fn, setup, warmup in cases
+    ]
+
+
+# -------------------------------
+# RESULTS
+# -------------------------------
+def environment():
+    import sqlite3
+    import pandas
+    import pyarrow
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sqlite": sqlite3.sqlite_version,
+        "pandas": pandas.__version__,
+        "pyarrow": pyarrow.__version__,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print median ratios against `baseline` and return the names of regressed cases."""
+    if baseline.get("dataset", {}).get("expenses") != results["dataset"]["expenses"]:
+        print("warning: baseline was generated with different parameters", file=sys.stderr)
+    regressed = []
+    print(f"\n{'case':40} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, stats in results["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            print(f"{name:40} {'-':>10} {stats['median'] * 1000:9.2f}ms {'new':>7}")
+            continue
+        ratio = stats["median"] / old["median"] if old["median"] else float("inf")
+        # Ignore sub-MIN_DELTA differences: timer noise on microsecond cases
+        slower = old["median"] * (1 + threshold) < stats["median"] and stats["median"] - old["median"] > MIN_DELTA
+        flag = " !" if slower else ""
+        print(f"{name:40} {old['median'] * 1000:8.2f}ms {stats['median'] * 1000:8.2f}ms {ratio:6.2f}x{flag}")
+        if flag:
+            regressed.append(name)
+    return regressed
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Benchmark the data layer against a synthetic ledger")
+    p.add_argument("--db", help="where to generate the database (default: a temporary directory)")
+    p.add_argument("--repeat", type=int, default=20)
+    p.add_argument("--output", help="write JSON results to this file (default: stdout)")
+    p.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run")
+    p.add_argument("--threshold", type=float, default=0.2,
+                   help="median slowdown that counts as a regression (0.2 = 20%%)")
+    p.add_argument("--filter", help="only run cases whose name contains this text")
+    add_arguments(p)
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="budget-bench-")
+    db_path = os.path.abspath(args.db or os.path.join(workdir, "budget.db"))
+
+    # app.connection reads BUDGET_DB at import time, so set it before any app import
+    os.environ["BUDGET_DB"] = db_path
+    from benchmarks.generate import generate
+
+    start = time.perf_counter()
+    dataset = generate(db_path, **generator_options(args))
+    dataset["seconds"] = time.perf_counter() - start
+    print(f"Generated {dataset['expenses']} expenses in {dataset['seconds']:.2f}s: {db_path}", file=sys.stderr)
+
+    results = {"environment": environment(), "dataset": dataset, "results": {}}
+    for name, fn, setup, warmup in build_cases(db_path, dataset, workdir):
+        if args.filter and args.filter not in name:
+            continue
+        stats = measure(fn, args.repeat, setup, warmup)
+        results["results"][name] = stats
+        print(f"{name:40} median {stats['median'] * 1000:9.3f}ms  min {stats['min'] * 1000:9.3f}ms",
+              file=sys.stderr)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(results, json.load(f), args.threshold)
+        if regressed:
+            print(f"\n{len(regressed)} case(s) slower than baseline by more than "
+                  f"{args.threshold:.0%}: {', '.join(regressed)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
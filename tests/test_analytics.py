@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+from app import connection, schema
+from app.migrations import migrate
+from app.writer import write
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    db = str(tmp_path / "budget.db")
+    monkeypatch.setattr(connection, "DB_PATH", db)
+    monkeypatch.setattr(schema, "DB_PATH", db)
+    migrate(db)
+
+    def fill(conn):
+        conn.execute("INSERT INTO categories (name) VALUES ('Food')")
+        conn.execute("INSERT INTO subcategories (category_id, name) VALUES (1, 'Market')")
+        conn.executemany("""
+            INSERT INTO expenses (date, amount, category_id, subcategory_id, description, expected, currency)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [
+            ("2025-03-01", 1250, 1, 1, "groceries", 1, "EUR"),
+            ("2025-03-02", -500, 1, None, "refund", 0, "USD"),
+            ("2025-03-03", 990, None, None, None, 0, "EUR"),
+            ("2025-04-01", 100, 1, 1, "next month", 0, "EUR"),
+        ])
+    write(fill, db)
+    return db
+
+
+def test_snapshot_frame_matches_sql_frame(ledger):
+    from_sql = schema.expenses_frame([2025], [3])
+    from_snapshot = schema.expenses_frame([2025], [3], snapshot=True)
+
+    # Typed dates and categorical currencies are the documented differences
+    from_snapshot["date"] = from_snapshot["date"].dt.strftime("%Y-%m-%d")
+    from_snapshot["currency"] = from_snapshot["currency"].astype(object)
+    pd.testing.assert_frame_equal(from_snapshot.reset_index(drop=True), from_sql.reset_index(drop=True))
+    assert from_snapshot["subcategory"].tolist() == ["Market", None, None]
@@ -0,0 +1,22 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _cli(db, *args, stdin=None):
+    env = dict(os.environ, BUDGET_DB=str(db), PYTHONPATH=ROOT)
+    return subprocess.run([sys.executable, os.path.join(ROOT, "app", "cli.py"), *args], input=stdin,
+                          capture_output=True, text=True, env=env, timeout=60)
+
+
+def test_batch_help_line_fails_the_batch(tmp_path):
+    db = tmp_path / "budget.db"
+    result = _cli(db, "batch", "-", stdin="add-category Food\nadd-expense --help\n")
+    assert result.returncode == 1
+    assert "line 2" in result.stderr
+    # The whole batch was rolled back
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM categories").fetchone()[0] == 0
@@ -0,0 +1,54 @@
+import sqlite3
+
+import pytest
+
+from app import sync
+from app.migrations import migrate
+from app.writer import write
+
+
+def _ledger(path, category_uuid, expense):
+    migrate(path)
+
+    def add(conn):
+        conn.execute("INSERT INTO categories (uuid, name) VALUES (?, 'Food')", (category_uuid,))
+        conn.execute("INSERT INTO expenses (date, amount, category_id, description, currency) "
+                     "VALUES ('2025-01-02', 500, (SELECT id FROM categories WHERE name = 'Food'), ?, 'EUR')",
+                     (expense,))
+    write(add, str(path))
+
+
+def _state(path):
+    with sqlite3.connect(path) as conn:
+        categories = conn.execute("SELECT uuid, name FROM categories").fetchall()
+        expenses = conn.execute("""
+            SELECT e.description, c.uuid FROM expenses e LEFT JOIN categories c ON c.id = e.category_id
+            ORDER BY e.description
+        """).fetchall()
+    return categories, expenses
+
+
+# The merged category keeps the smaller uuid: cover both sides winning
+@pytest.mark.parametrize("uuid_a, uuid_b", [("1" * 8, "f" * 8), ("f" * 8, "1" * 8)])
+def test_same_name_categories_converge(tmp_path, uuid_a, uuid_b):
+    a, b = tmp_path / "a.db", tmp_path / "b.db"
+    _ledger(a, uuid_a, "lunch")
+    _ledger(b, uuid_b, "hotel")
+
+    sync.sync(str(b), str(a))
+    categories, expenses = _state(a)
+    assert _state(b) == (categories, expenses)
+    assert categories == [(min(uuid_a, uuid_b), "Food")]
+    assert [e[1] for e in expenses] == [categories[0][0]] * 2
+
+    # Nothing left to exchange once both sides agree
+    again = sync.sync(str(b), str(a))
+    assert again["pulled"]["applied"] == again["pushed"]["applied"] == 0
+    assert _state(a) == _state(b) == (categories, expenses)
+
+
+def test_refuses_the_same_file_under_another_path(tmp_path, monkeypatch):
+    migrate(tmp_path / "a.db")
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ValueError, match="itself"):
+        sync.sync(str(tmp_path / "a.db"), "a.db")
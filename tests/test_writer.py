@@ -0,0 +1,18 @@
+import pytest
+
+from app.migrations import migrate
+from app.writer import submit, write
+
+
+def test_job_raising_system_exit_does_not_stop_the_writer(tmp_path):
+    db = str(tmp_path / "budget.db")
+    migrate(db)
+
+    def leave(conn):
+        conn.execute("INSERT INTO categories (name) VALUES ('Rolled back')")
+        raise SystemExit(0)
+
+    with pytest.raises(SystemExit):
+        submit(leave, db).result(timeout=10)  # used to hang: the writer thread died
+    # The writer thread is still serving jobs, and the failed one left nothing behind
+    assert write(lambda conn: conn.execute("SELECT COUNT(*) FROM categories").fetchone()[0], db) == 0